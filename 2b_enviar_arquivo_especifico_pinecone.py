@@ -1,65 +1,435 @@
 # 2b_enviar_arquivo_especifico_pinecone.py
 from pinecone import Pinecone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import json
+import os
+import random
 import sys
+import threading
+import time
 import config
+from cache_embeddings import CacheEmbeddings, EmbedderComCache, CACHE_EMBEDDINGS
+from embeddings import criar_embedder
+from formato_saida import ler_registros
+from manifesto_incremental import caminho_manifesto, carregar_manifesto, confirmar_envio
+from namespaces import NAMESPACE, CHAVES_NAMESPACE, REGISTRO_NAMESPACES, RegistroNamespaces, nome_namespace
 
 # --- CONFIGURAÇÃO ---
-NAMESPACE = "manual-participante"  # Mesmo namespace do script original
+TAMANHO_LOTE_REMOCAO = 1000  # Máximo de IDs por chamada de delete
+MAX_REGISTROS_LOTE = 96  # Máximo de registros por upsert_records
+MAX_BYTES_LOTE = 2 * 1024 * 1024  # Tamanho máximo de uma requisição de upsert
+MAX_BYTES_REGISTRO = 40 * 1024  # Tamanho máximo de um registro
+UPLOAD_WORKERS = 4  # Lotes enviados em paralelo
+MAX_RETRIES_UPSERT = 5
+RETRY_DELAY_BASE = 1  # Segundos (backoff exponencial com jitter)
+BYTES_POR_DIMENSAO = 12  # Estimativa do tamanho de cada valor do vetor na requisição
 
-def enviar_arquivo_para_pinecone(caminho_arquivo):
+def tamanho_registro(doc):
+    """Tamanho do registro serializado, em bytes"""
+    return len(json.dumps(doc, ensure_ascii=False).encode('utf-8'))
+
+def gerar_lotes(documentos, registros_grandes, bytes_vetor=0, chave_namespace=None):
+    """
+    Agrupa os registros (qualquer iterável, inclusive um stream) em lotes
+    respeitando os limites de quantidade (MAX_REGISTROS_LOTE) e de bytes
+    por requisição (MAX_BYTES_LOTE). `bytes_vetor` é o tamanho estimado do
+    vetor acrescentado a cada registro no envio de vetores.
+
+    Cada lote pertence a um namespace (nome_namespace com `chave_namespace`);
+    há um lote aberto por namespace.
+
+    Registros maiores que MAX_BYTES_REGISTRO não são enviados; seus IDs e
+    tamanhos são acrescentados a `registros_grandes` para serem reportados.
+
+    Gera: (namespace, lote)
+    """
+    lotes = {}  # namespace -> (registros, bytes)
+
+    for doc in documentos:
+        tamanho = tamanho_registro(doc)
+        if tamanho > MAX_BYTES_REGISTRO:
+            registros_grandes.append((doc['id'], tamanho))
+            continue
+
+        tamanho += bytes_vetor
+        namespace = nome_namespace(doc, chave_namespace)
+        lote, bytes_lote = lotes.get(namespace, ([], 0))
+        if lote and (len(lote) >= MAX_REGISTROS_LOTE or bytes_lote + tamanho > MAX_BYTES_LOTE):
+            yield namespace, lote
+            lote, bytes_lote = [], 0
+
+        lote.append(doc)
+        lotes[namespace] = (lote, bytes_lote + tamanho)
+
+    for namespace, (lote, _) in lotes.items():
+        if lote:
+            yield namespace, lote
+
+def status_http(erro):
+    """Status HTTP de uma exceção do Pinecone (None se não houver)"""
+    status = getattr(erro, 'status', None)
+    if status is None:
+        status = getattr(getattr(erro, 'http_resp', None), 'status', None)
+    return status
+
+def erro_temporario(erro):
+    """True para erros que valem retry: 429, 5xx e falhas de conexão"""
+    status = status_http(erro)
+    if status is None:
+        return "429" in str(erro) or isinstance(erro, (ConnectionError, TimeoutError, OSError))
+    return status == 429 or status >= 500
+
+def erro_lote_grande(erro):
+    """True se a requisição foi recusada por tamanho (o lote deve ser dividido)"""
+    status = status_http(erro)
+    texto = str(erro).lower()
+    return status == 413 or (status == 400 and ("too large" in texto or "exceeds" in texto))
+
+def montar_vetores(lote, embedder):
+    """
+    Converte os registros em vetores densos para index.upsert: o embedding
+    do chunk_text (calculado em um lote só, com cache) e os demais campos,
+    incluindo o chunk_text, como metadados.
+    """
+    valores = embedder.embed_documentos([doc['chunk_text'] for doc in lote])
+    return [
+        {
+            'id': doc['id'],
+            'values': vetor.tolist(),
+            # O Pinecone não aceita metadados nulos
+            'metadata': {chave: valor for chave, valor in doc.items() if chave != 'id' and valor is not None},
+        }
+        for doc, vetor in zip(lote, valores)
+    ]
+
+def enviar_lote(index, lote, namespace, embedder=None):
+    """
+    Envia um lote com retry e backoff exponencial (com jitter) para erros
+    temporários. Se o lote for recusado por tamanho, é dividido ao meio e
+    cada metade enviada separadamente.
+
+    Sem `embedder`, os registros vão por upsert_records (o índice calcula
+    os embeddings); com ele, vão como vetores densos por upsert.
+
+    Retorna: lista de IDs confirmados
+    """
+    for tentativa in range(MAX_RETRIES_UPSERT):
+        try:
+            if embedder is None:
+                index.upsert_records(records=lote, namespace=namespace)
+            else:
+                index.upsert(vectors=montar_vetores(lote, embedder), namespace=namespace)
+            return [doc['id'] for doc in lote]
+        except Exception as e:
+            if erro_lote_grande(e) and len(lote) > 1:
+                meio = len(lote) // 2
+                return (enviar_lote(index, lote[:meio], namespace, embedder)
+                        + enviar_lote(index, lote[meio:], namespace, embedder))
+            if not erro_temporario(e) or tentativa == MAX_RETRIES_UPSERT - 1:
+                raise
+            delay = RETRY_DELAY_BASE * (2 ** tentativa)
+            time.sleep(delay + random.uniform(0, delay))
+
+    return []
+
+def caminho_checkpoint(caminho_arquivo):
+    """Caminho do checkpoint de envio associado a um arquivo"""
+    return os.path.splitext(caminho_arquivo)[0] + ".checkpoint.jsonl"
+
+def assinatura_arquivo(caminho_arquivo):
+    """Identifica a versão do arquivo (tamanho e data de modificação)"""
+    estado = os.stat(caminho_arquivo)
+    return f"{estado.st_size}:{int(estado.st_mtime)}"
+
+class Checkpoint:
+    """
+    Registro dos IDs já confirmados pelo Pinecone, para que um envio
+    interrompido continue de onde parou.
+
+    O arquivo é JSONL e só recebe acréscimos: a primeira linha identifica
+    o arquivo de origem e o namespace, e cada lote confirmado acrescenta
+    uma linha com seus IDs (custo constante por lote).
+    """
+
+    def __init__(self, caminho, assinatura, namespace, reiniciar=False, embedder=None):
+        self.caminho = caminho
+        self.ids_confirmados = set()
+        self._lock = threading.Lock()
+        cabecalho = {'assinatura': assinatura, 'namespace': namespace}
+        if embedder:
+            cabecalho['embedder'] = embedder
+
+        if os.path.exists(caminho) and not reiniciar:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                linhas = [json.loads(linha) for linha in f if linha.endswith('\n')]
+            # Checkpoint de outra versão do arquivo (ou outro namespace) é ignorado
+            if linhas and linhas[0] == cabecalho:
+                for linha in linhas[1:]:
+                    self.ids_confirmados.update(linha['ids'])
+
+        self._arquivo = open(caminho, 'w', encoding='utf-8')
+        self._acrescentar(cabecalho)
+        if self.ids_confirmados:
+            self._acrescentar({'ids': sorted(self.ids_confirmados)})
+
+    def _acrescentar(self, dados):
+        self._arquivo.write(json.dumps(dados, ensure_ascii=False) + '\n')
+        self._arquivo.flush()
+
+    def confirmar(self, ids):
+        """Marca IDs como enviados e acrescenta a linha ao checkpoint"""
+        with self._lock:
+            self.ids_confirmados.update(ids)
+            self._acrescentar({'ids': ids})
+
+    def fechar(self):
+        self._arquivo.close()
+
+    def remover(self):
+        """Apaga o checkpoint após um envio completo"""
+        self.fechar()
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+def ids_atuais_por_documento(caminho_arquivo, chave_namespace=None):
+    """IDs de cada documento do arquivo, por namespace: {source_file: {namespace: set}}"""
+    ids = {}
+    # Só os campos que definem o namespace (no Parquet, o chunk_text não é lido)
+    for doc in ler_registros(caminho_arquivo, colunas=['id', 'source_file', 'chunk_type']):
+        por_namespace = ids.setdefault(doc.get('source_file', ''), {})
+        por_namespace.setdefault(nome_namespace(doc, chave_namespace), set()).add(doc['id'])
+    return ids
+
+def remover_ids(index, ids, namespace):
+    """Remove IDs do índice em lotes de TAMANHO_LOTE_REMOCAO"""
+    ids = sorted(ids)
+    for i in range(0, len(ids), TAMANHO_LOTE_REMOCAO):
+        index.delete(ids=ids[i:i + TAMANHO_LOTE_REMOCAO], namespace=namespace)
+
+def enviar_arquivo_para_pinecone(caminho_arquivo, incremental=False, workers=UPLOAD_WORKERS,
+                                 reiniciar=False, index=None, embedder=None,
+                                 cache_embeddings=CACHE_EMBEDDINGS, chave_namespace=None,
+                                 substituir=False, registro=REGISTRO_NAMESPACES):
     """
-    Envia um arquivo JSON específico para o Pinecone.
+    Envia um arquivo JSON (ou JSONL/Parquet) específico para o Pinecone.
+
+    Arquivos .jsonl são lidos como stream, linha a linha, e os .parquet
+    por grupo de linhas; os lotes são montados sob demanda, com memória
+    constante independentemente do tamanho do corpus.
+
+    Os lotes são enviados em paralelo por `workers` threads, com retry para
+    erros temporários (429/5xx). Os IDs confirmados ficam num checkpoint
+    (<arquivo>.checkpoint.jsonl), e uma nova execução continua de onde a
+    anterior parou (a menos que `reiniciar` seja True).
+
+    Com incremental=True, usa o manifesto gerado por
+    `processar_pdf_completo.py --incremental` para enviar apenas os registros
+    novos ou alterados e remover do índice os IDs que deixaram de existir.
+
+    Se `index` for informado (objeto com upsert_records e delete, ex.: o
+    Pinecone simulado de benchmark.py), ele é usado sem conectar ao Pinecone.
+
+    Com `embedder` (nome, ex.: 'gemini', ou objeto de embeddings.py), os
+    embeddings são calculados aqui e enviados como vetores densos com os
+    metadados (index.upsert), para um índice denso da mesma dimensão. Os
+    vetores ficam no cache `cache_embeddings` (SQLite; None desativa),
+    então um novo envio só calcula os textos que mudaram.
+
+    Com `chave_namespace` ('source_file', 'chunk_type' ou 'grupo'), cada
+    registro vai para o namespace derivado desse campo (ver namespaces.py)
+    em vez de NAMESPACE. Os IDs enviados ficam no registro local
+    `registro`. Com `substituir`, depois do upsert os IDs registrados dos
+    documentos do arquivo que não existem mais nele são removidos, em
+    qualquer namespace (substitui um documento sem tocar nos demais).
     """
     print(f"Enviando arquivo: {caminho_arquivo}")
-    print(f"Namespace: {NAMESPACE}")
+    print(f"Namespace: {NAMESPACE if chave_namespace is None else f'um por {chave_namespace}'}")
+    registro_namespaces = RegistroNamespaces(registro)
+
+    # --- Embeddings locais (vetores densos) ---
+    cache = None
+    if isinstance(embedder, str):
+        embedder = criar_embedder(embedder)
+    if embedder is not None:
+        if cache_embeddings:
+            cache = CacheEmbeddings(cache_embeddings)
+            embedder = EmbedderComCache(embedder, cache)
+        print(f"Embeddings: {embedder.nome} ({embedder.dimensao} dimensões), "
+              f"cache: {cache_embeddings or 'desativado'}")
     print()
 
-    # --- Carregar arquivo JSON ---
-    print(f"Carregando arquivo JSON...")
-    with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-        todos_documentos = json.load(f)
-            
-    print(f"Total de {len(todos_documentos)} documentos carregados.")
+    # --- Leitura dos registros (stream) ---
+    documentos = ler_registros(caminho_arquivo)
+
+    ids_remover = []
+    arquivo_manifesto = caminho_manifesto(caminho_arquivo)
+    if incremental:
+        if not os.path.exists(arquivo_manifesto):
+            print(f"ERRO: Manifesto não encontrado: {arquivo_manifesto}")
+            return
+        alteracoes = carregar_manifesto(arquivo_manifesto)['alteracoes']
+        ids_upsert = set(alteracoes['upsert'])
+        ids_remover = alteracoes['remover']
+        documentos = ler_registros(caminho_arquivo, filtros=[('id', 'in', sorted(ids_upsert))])
+        print(f"Modo incremental: {len(ids_upsert)} para enviar, {len(ids_remover)} para remover.")
+
+    # --- Checkpoint de envios anteriores ---
+    checkpoint = Checkpoint(
+        caminho_checkpoint(caminho_arquivo), assinatura_arquivo(caminho_arquivo),
+        NAMESPACE if chave_namespace is None else f"chave:{chave_namespace}", reiniciar=reiniciar, embedder=embedder.nome if embedder else None,
+    )
+    if checkpoint.ids_confirmados:
+        print(f"Checkpoint: {len(checkpoint.ids_confirmados)} documentos já enviados, retomando.")
+        documentos = (doc for doc in documentos if doc['id'] not in checkpoint.ids_confirmados)
 
     # --- Conexão com o Pinecone ---
-    print(f"Conectando ao Pinecone e ao índice '{config.PINECONE_INDEX_NAME}'...")
-    try:
-        pc = Pinecone(api_key=config.PINECONE_API_KEY)
-        
-        if config.PINECONE_INDEX_NAME not in pc.list_indexes().names():
-            print(f"ERRO: O índice '{config.PINECONE_INDEX_NAME}' não existe.")
+    if index is None:
+        print(f"Conectando ao Pinecone e ao índice '{config.PINECONE_INDEX_NAME}'...")
+        try:
+            pc = Pinecone(api_key=config.PINECONE_API_KEY)
+
+            if config.PINECONE_INDEX_NAME not in pc.list_indexes().names():
+                print(f"ERRO: O índice '{config.PINECONE_INDEX_NAME}' não existe.")
+                checkpoint.fechar()
+                return
+
+            index = pc.Index(config.PINECONE_INDEX_NAME)
+            print("-> Conexão estabelecida.")
+        except Exception as e:
+            print(f"ERRO ao conectar com Pinecone: {e}")
+            checkpoint.fechar()
             return
-            
-        index = pc.Index(config.PINECONE_INDEX_NAME)
-        print("-> Conexão estabelecida.")
-    except Exception as e:
-        print(f"ERRO ao conectar com Pinecone: {e}")
-        return
 
     # --- Upsert dos Registros em Lotes ---
-    print("Enviando registros para o Pinecone...")
-    batch_size = 96
-    
-    try:
-        for i in range(0, len(todos_documentos), batch_size):
-            batch = todos_documentos[i:i + batch_size]
-            print(f"Enviando batch de {len(batch)} documentos...")
-            
-            index.upsert_records(records=batch, namespace=NAMESPACE)
-
-    except Exception as e:
-        print(f"\n--- ERRO AO ENVIAR O BATCH ---")
-        print(f"A operação de upsert falhou: {e}")
+    print(f"Enviando registros em lotes ({workers} em paralelo)...")
+
+    enviados = 0
+    falhas = []
+    registros_grandes = []
+    em_voo = {}
+
+    def coletar_concluidos():
+        """Aguarda ao menos um lote em voo e contabiliza os concluídos"""
+        nonlocal enviados
+        concluidos, _ = wait(list(em_voo), return_when=FIRST_COMPLETED)
+        for futuro in concluidos:
+            namespace, lote = em_voo.pop(futuro)
+            try:
+                ids = futuro.result()
+            except Exception as e:
+                falhas.append((lote, e))
+                print(f"ERRO no batch de {len(lote)} documentos ({lote[0]['id']}...): {e}")
+                continue
+            checkpoint.confirmar(ids)
+            enviados += len(ids)
+            print(f"Batch de {len(ids)} documentos confirmado em '{namespace}' ({enviados} enviados).")
+
+    bytes_vetor = embedder.dimensao * BYTES_POR_DIMENSAO if embedder else 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for namespace, lote in gerar_lotes(documentos, registros_grandes, bytes_vetor, chave_namespace):
+            # Limita os lotes em memória aguardando envio
+            while len(em_voo) >= max(1, workers) * 2:
+                coletar_concluidos()
+            em_voo[executor.submit(enviar_lote, index, lote, namespace, embedder)] = (namespace, lote)
+
+        while em_voo:
+            coletar_concluidos()
+
+    if cache:
+        print(f"Cache de embeddings: {cache.acertos} acerto(s), {cache.faltas} texto(s) calculado(s).")
+        cache.fechar()
+
+    for doc_id, tamanho in registros_grandes:
+        print(f"AVISO: Registro '{doc_id}' ignorado ({tamanho} bytes, limite {MAX_BYTES_REGISTRO}).")
+
+    if falhas:
+        checkpoint.fechar()
+        print(f"\n--- ERRO AO ENVIAR {len(falhas)} BATCH(ES) ---")
+        print(f"{enviados} documentos confirmados ficaram no checkpoint; execute novamente para retomar.")
         return
 
-    print(f"\n-> {len(todos_documentos)} documentos enviados com sucesso para o namespace '{NAMESPACE}'.")
+    # --- Remoção dos IDs que não existem mais ---
+    # (do manifesto incremental e, com substituir, dos documentos do arquivo)
+    remocoes = {}  # namespace -> IDs
+    for doc_id in ids_remover:
+        for namespace in registro_namespaces.namespaces_do_id(doc_id) or [NAMESPACE]:
+            remocoes.setdefault(namespace, set()).add(doc_id)
+
+    ids_atuais = ids_atuais_por_documento(caminho_arquivo, chave_namespace)
+    ignorados = {doc_id for doc_id, _ in registros_grandes}
+    for atuais in ids_atuais.values():
+        for ids in atuais.values():
+            ids -= ignorados
+    if substituir:
+        for source_file, atuais in ids_atuais.items():
+            for namespace, anteriores in registro_namespaces.ids_documento(source_file).items():
+                obsoletos = anteriores - atuais.get(namespace, set())
+                if obsoletos:
+                    remocoes.setdefault(namespace, set()).update(obsoletos)
+
+    if remocoes:
+        print(f"Removendo {sum(len(ids) for ids in remocoes.values())} registros obsoletos "
+              f"({len(remocoes)} namespace(s))...")
+        try:
+            for namespace, ids in remocoes.items():
+                remover_ids(index, ids, namespace)
+                registro_namespaces.remover(namespace, ids)
+        except Exception as e:
+            checkpoint.fechar()
+            registro_namespaces.salvar()
+            print(f"\n--- ERRO AO REMOVER REGISTROS ---")
+            print(f"A operação de delete falhou: {e}")
+            return
+
+    # --- Registro local dos IDs por namespace ---
+    for source_file, atuais in ids_atuais.items():
+        if substituir:
+            registro_namespaces.definir_documento(source_file, atuais)
+        else:
+            for namespace, ids in atuais.items():
+                registro_namespaces.adicionar(namespace, source_file, ids)
+    registro_namespaces.salvar()
+
+    if incremental:
+        confirmar_envio(arquivo_manifesto)
+    checkpoint.remover()
+
+    namespaces_enviados = sorted({ns for atuais in ids_atuais.values() for ns in atuais})
+    print(f"\n-> {enviados} documentos enviados com sucesso para o(s) namespace(s): "
+          f"{', '.join(namespaces_enviados)}.")
     print("Envio concluído com sucesso!")
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print("Uso: python 2b_enviar_arquivo_especifico_pinecone.py <caminho_arquivo.json>")
+        print("Uso: python 2b_enviar_arquivo_especifico_pinecone.py <caminho_arquivo.json|.jsonl|.parquet> [--incremental] [--workers N] [--reiniciar] [--embedder NOME] [--sem-cache-embeddings] [--namespace-por CHAVE] [--substituir]")
         print("Exemplo: python 2b_enviar_arquivo_especifico_pinecone.py json_processados/manual-chefe-unidade-TELAS-DETALHADAS.json")
+        print("\nFlags:")
+        print("  --incremental    Envia só as alterações registradas no manifesto (<arquivo>.manifesto.json)")
+        print(f"  --workers N      Lotes enviados em paralelo (padrão: {UPLOAD_WORKERS})")
+        print("  --reiniciar      Ignora o checkpoint (<arquivo>.checkpoint.jsonl) e envia tudo novamente")
+        print("  --embedder NOME  Calcula os embeddings localmente (hash|gemini) e envia vetores densos")
+        print(f"  --sem-cache-embeddings  Não usa o cache de embeddings ({CACHE_EMBEDDINGS})")
+        print(f"  --namespace-por CHAVE   Um namespace por {'|'.join(CHAVES_NAMESPACE)} (padrão: tudo em '{NAMESPACE}')")
+        print(f"  --substituir     Remove os IDs antigos dos documentos do arquivo que não existem mais ({REGISTRO_NAMESPACES})")
         sys.exit(1)
-    
-    enviar_arquivo_para_pinecone(sys.argv[1])
+
+    workers = UPLOAD_WORKERS
+    if "--workers" in sys.argv and sys.argv.index("--workers") + 1 < len(sys.argv):
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+    embedder = None
+    if "--embedder" in sys.argv and sys.argv.index("--embedder") + 1 < len(sys.argv):
+        embedder = sys.argv[sys.argv.index("--embedder") + 1]
+    chave_namespace = None
+    if "--namespace-por" in sys.argv and sys.argv.index("--namespace-por") + 1 < len(sys.argv):
+        chave_namespace = sys.argv[sys.argv.index("--namespace-por") + 1]
+
+    enviar_arquivo_para_pinecone(
+        sys.argv[1],
+        incremental="--incremental" in sys.argv,
+        workers=workers,
+        reiniciar="--reiniciar" in sys.argv,
+        embedder=embedder,
+        cache_embeddings=None if "--sem-cache-embeddings" in sys.argv else CACHE_EMBEDDINGS,
+        chave_namespace=chave_namespace,
+        substituir="--substituir" in sys.argv,
+    )
@@ -0,0 +1,367 @@
+# benchmark.py
+"""
+Benchmark do pipeline sem gastar cota de API.
+
+Executa processar_pdf_completo() sobre os PDFs de documentos_para_processar/
+com um Gemini simulado (latência, taxa de 429 e de JSON malformado
+configuráveis) e envia a saída ao uploader com um índice Pinecone simulado
+(upsert_records/delete). Reporta páginas/s, latência por página (p50/p95),
+pico de memória (RSS) e chamadas à API por etapa.
+
+As respostas do Gemini simulado são determinísticas (dependem da semente e
+dos bytes de cada imagem), então duas execuções com os mesmos parâmetros
+fazem as mesmas chamadas e podem ser comparadas antes e depois de uma mudança.
+Pelo mesmo motivo, o classificador local e os parâmetros calibrados da
+heurística do diretório atual não são usados: só os informados em
+--classificador e --parametros-heuristica (registrados no relatório).
+
+Uso:
+    python benchmark.py [diretorio_ou_glob] [--latencia-ms N] [--taxa-429 X]
+                        [--taxa-json-invalido X] [--concorrencia N] [--rpm N]
+                        [--sem-pinecone] [--classificador ARQ]
+                        [--parametros-heuristica ARQ] [--saida ARQ]
+"""
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+from metricas import caminho_relatorio, combinar_relatorios, percentil
+import processar_pdf_completo as pipeline
+
+# --- CONFIGURAÇÕES ---
+DIRETORIO_PDFS = "documentos_para_processar"
+LATENCIA_GEMINI_MS = 400  # Latência média de uma chamada simulada ao Gemini
+LATENCIA_PINECONE_MS = 50  # Latência média de um upsert simulado
+TAXA_429 = 0.02  # Fração das chamadas recusadas com 429
+TAXA_JSON_INVALIDO = 0.02  # Fração das análises Vision com JSON truncado
+PROPORCAO_TELAS = 0.6  # Fração das páginas que o Gemini simulado diz ter tela
+BENCHMARK_RPM = 600  # Acima do limite real, para o limitador não mascarar o pipeline
+SEMENTE = 42
+TOKENS_POR_IMAGEM = 258  # Tokens de entrada cobrados por imagem (estimativa)
+
+_PADRAO_ROTULO = re.compile(r"Página (\d+)")
+
+
+class _Uso:
+    def __init__(self, entrada, saida):
+        self.prompt_token_count = entrada
+        self.candidates_token_count = saida
+
+
+class _Resposta:
+    """Resposta simulada com a mesma interface usada do google.generativeai"""
+
+    def __init__(self, texto, tokens_entrada):
+        self.text = texto
+        self.usage_metadata = _Uso(tokens_entrada, len(texto) // 4)
+
+
+class ErroSimulado(Exception):
+    """Erro HTTP simulado (status como nas exceções do Pinecone)"""
+
+    def __init__(self, status, mensagem):
+        super().__init__(f"{status} {mensagem}")
+        self.status = status
+
+
+class GeminiSimulado:
+    """
+    Substituto do GenerativeModel: responde aos prompts de detecção
+    (individual e em lote) e de análise completa após `latencia_ms`
+    (±50%), recusando `taxa_429` das chamadas e truncando o JSON de
+    `taxa_json_invalido` das análises (como uma resposta cortada pelo
+    limite de tokens de saída).
+    """
+
+    def __init__(self, latencia_ms=LATENCIA_GEMINI_MS, taxa_429=TAXA_429,
+                 taxa_json_invalido=TAXA_JSON_INVALIDO, semente=SEMENTE):
+        self.latencia_ms = latencia_ms
+        self.taxa_429 = taxa_429
+        self.taxa_json_invalido = taxa_json_invalido
+        self.semente = semente
+        self._lock = threading.Lock()
+        self._tentativas = {}
+        self.chamadas = {}
+
+    def _sorteio(self, *chaves):
+        """Número em [0, 1) determinado pela semente e pelas chaves"""
+        texto = "\0".join(str(c) for c in (self.semente,) + chaves)
+        return int.from_bytes(hashlib.sha256(texto.encode('utf-8')).digest()[:8], 'big') / 2 ** 64
+
+    def _contar(self, tipo):
+        with self._lock:
+            self.chamadas[tipo] = self.chamadas.get(tipo, 0) + 1
+
+    def _tem_tela(self, parte):
+        return self._sorteio('tela', hashlib.sha256(parte['data']).hexdigest()) < PROPORCAO_TELAS
+
+    def _analise(self):
+        analise = {
+            "tem_tela": True,
+            "titulo_tela": "Tela simulada",
+            "tipo_tela": "formulário",
+            "contexto": "Resposta gerada pelo benchmark, sem chamada à API",
+            "instrucoes_navegacao": [f"{i}. Clicar em [Botão {i}]" for i in range(1, 6)],
+            "elementos_visiveis": [
+                {"tipo": "botão", "nome": f"Botão {i}", "localizacao": "rodapé", "acao": "Clicar"}
+                for i in range(1, 6)
+            ],
+            "campos_formulario": [
+                {"nome": "Data de início", "tipo": "data", "obrigatorio": True, "formato": "dd/mm/aaaa"}
+            ],
+            "observacoes": "",
+        }
+        return json.dumps(analise, ensure_ascii=False)
+
+    def generate_content(self, partes, generation_config=None):
+        prompt = partes[0]
+        imagens = [p for p in partes if isinstance(p, dict)]
+        tipo = {pipeline.PROMPT_VISION: 'vision', pipeline.PROMPT_DETECCAO_TELA: 'deteccao',
+                pipeline.PROMPT_DETECCAO_TELA_LOTE: 'deteccao_lote'}.get(prompt, 'outro')
+
+        # Sorteios por tentativa: o retry da mesma imagem pode ter outro resultado
+        chave = (tipo,) + tuple(hashlib.sha256(p['data']).hexdigest() for p in imagens)
+        with self._lock:
+            tentativa = self._tentativas[chave] = self._tentativas.get(chave, 0) + 1
+
+        latencia = self.latencia_ms * (0.5 + self._sorteio('latencia', tentativa, *chave))
+        time.sleep(latencia / 1000)
+
+        if self._sorteio('429', tentativa, *chave) < self.taxa_429:
+            self._contar(f"{tipo}_429")
+            raise ErroSimulado(429, "Resource has been exhausted (e.g. check quota).")
+        self._contar(tipo)
+
+        tokens_entrada = TOKENS_POR_IMAGEM * len(imagens) + sum(
+            len(p) // 4 for p in partes if isinstance(p, str)
+        )
+        if tipo == 'deteccao':
+            return _Resposta("SIM" if self._tem_tela(imagens[0]) else "NÃO", tokens_entrada)
+        if tipo == 'deteccao_lote':
+            rotulos = [int(m.group(1)) for m in map(_PADRAO_ROTULO.match, (p for p in partes if isinstance(p, str)))
+                       if m]
+            veredictos = [{"pagina": n, "tem_tela": self._tem_tela(img)} for n, img in zip(rotulos, imagens)]
+            return _Resposta(json.dumps({"paginas": veredictos}), tokens_entrada)
+
+        texto = self._analise()
+        if self._sorteio('json', tentativa, *chave) < self.taxa_json_invalido:
+            self._contar(f"{tipo}_json_invalido")
+            texto = texto[:len(texto) // 2]
+        return _Resposta(f"```json\n{texto}\n```", tokens_entrada)
+
+
+class PineconeSimulado:
+    """Substituto do Index do Pinecone: aceita upsert_records, upsert (vetores) e delete"""
+
+    def __init__(self, latencia_ms=LATENCIA_PINECONE_MS, taxa_429=TAXA_429, semente=SEMENTE):
+        self.latencia_ms = latencia_ms
+        self.taxa_429 = taxa_429
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self.registros = {}
+        self.chamadas = {}
+
+    def _requisicao(self, tipo):
+        with self._lock:
+            sorteio = self._aleatorio.random()
+            latencia = self.latencia_ms * (0.5 + self._aleatorio.random())
+        time.sleep(latencia / 1000)
+        with self._lock:
+            if sorteio < self.taxa_429:
+                self.chamadas[f"{tipo}_429"] = self.chamadas.get(f"{tipo}_429", 0) + 1
+                raise ErroSimulado(429, "Too Many Requests")
+            self.chamadas[tipo] = self.chamadas.get(tipo, 0) + 1
+
+    def upsert_records(self, records, namespace):
+        self._requisicao('upsert_records')
+        with self._lock:
+            for registro in records:
+                self.registros[(namespace, registro['id'])] = registro
+
+    def upsert(self, vectors, namespace):
+        self._requisicao('upsert')
+        with self._lock:
+            for vetor in vectors:
+                self.registros[(namespace, vetor['id'])] = vetor
+
+    def delete(self, ids, namespace):
+        self._requisicao('delete')
+        with self._lock:
+            for doc_id in ids:
+                self.registros.pop((namespace, doc_id), None)
+
+
+def pico_rss_mb():
+    """Pico de memória residente do processo (ru_maxrss é em KB no Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def executar_benchmark(entrada=DIRETORIO_PDFS, latencia_ms=LATENCIA_GEMINI_MS, taxa_429=TAXA_429,
+                       taxa_json_invalido=TAXA_JSON_INVALIDO, concorrencia=pipeline.VISION_CONCORRENCIA,
+                       rpm=BENCHMARK_RPM, pinecone=True, semente=SEMENTE, classificador=None,
+                       parametros_heuristica=None):
+    """
+    Processa os PDFs com o Gemini simulado (um documento por vez, sem cache
+    Vision, para que todas as chamadas aconteçam) e, se `pinecone`, envia
+    cada saída ao índice simulado.
+    
+    `classificador` e `parametros_heuristica` são caminhos explícitos
+    (None: sem classificador local e com os pesos e limiares padrão), para
+    que o resultado não dependa de arquivos do diretório atual.
+
+    Retorna: dict com o relatório do benchmark
+    """
+    pdfs = pipeline.listar_pdfs(entrada)
+    if not pdfs:
+        raise FileNotFoundError(f"Nenhum PDF encontrado em: {entrada}")
+
+    for caminho in (classificador, parametros_heuristica):
+        if caminho and not os.path.exists(caminho):
+            raise FileNotFoundError(f"Arquivo não encontrado: {caminho}")
+    parametros = pipeline.carregar_parametros_heuristica(parametros_heuristica)
+    gemini = GeminiSimulado(latencia_ms, taxa_429, taxa_json_invalido, semente)
+    indice = PineconeSimulado(taxa_429=taxa_429, semente=semente) if pinecone else None
+    uploader = importlib.import_module("2b_enviar_arquivo_especifico_pinecone") if pinecone else None
+
+    relatorios = []
+    latencias_pagina = []
+    tempo_processamento = 0.0
+    tempo_envio = 0.0
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as diretorio:
+        for caminho_pdf in pdfs:
+            nome_base = os.path.splitext(os.path.basename(caminho_pdf))[0]
+            output_json = os.path.join(diretorio, f"{nome_base}.jsonl")
+
+            inicio = time.perf_counter()
+            pipeline.processar_pdf_completo(
+                caminho_pdf, output_json, concorrencia=concorrencia, rpm=rpm, cache_dir=None,
+                verboso=False, modelo=gemini, classificador=classificador,
+                parametros_heuristica=parametros_heuristica,
+            )
+            tempo_processamento += time.perf_counter() - inicio
+
+            with open(caminho_relatorio(output_json), 'r', encoding='utf-8') as f:
+                relatorio = json.load(f)
+            relatorios.append(relatorio)
+            # Latência da página: soma das etapas cronometradas dela (inclui o Vision)
+            latencias_pagina.extend(sum(p['etapas_ms'].values()) for p in relatorio['paginas'])
+
+            if indice is not None:
+                inicio = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    # Registro de namespaces temporário: os IDs simulados não podem
+                    # se misturar ao registro real (usado por --substituir)
+                    uploader.enviar_arquivo_para_pinecone(
+                        output_json, index=indice, reiniciar=True,
+                        registro=os.path.join(diretorio, "registro_namespaces.json"),
+                    )
+                tempo_envio += time.perf_counter() - inicio
+
+    combinado = combinar_relatorios(relatorios)
+    total_paginas = sum(r['total_paginas'] for r in relatorios)
+    total_registros = sum(r['documentos'] for r in relatorios)
+
+    return {
+        'entrada': entrada,
+        'parametros': {
+            'latencia_ms': latencia_ms, 'taxa_429': taxa_429, 'taxa_json_invalido': taxa_json_invalido,
+            'concorrencia': concorrencia, 'rpm': rpm, 'semente': semente,
+            'classificador': classificador,
+            'parametros_heuristica': parametros_heuristica,
+            'limiares_heuristica': [parametros['limiar_alto'], parametros['limiar_baixo']],
+        },
+        'documentos': len(pdfs),
+        'paginas': total_paginas,
+        'registros': total_registros,
+        'processamento': {
+            'tempo_s': round(tempo_processamento, 3),
+            'paginas_por_s': round(total_paginas / tempo_processamento, 3) if tempo_processamento else None,
+            'latencia_pagina_p50_ms': round(percentil(latencias_pagina, 50), 3),
+            'latencia_pagina_p95_ms': round(percentil(latencias_pagina, 95), 3),
+            'etapas': combinado['etapas'],
+            'esperas': combinado['esperas'],
+        },
+        'api_gemini': {
+            'por_etapa': combinado['api'],
+            'servidor': dict(sorted(gemini.chamadas.items())),
+        },
+        'pinecone': {
+            'tempo_s': round(tempo_envio, 3),
+            'registros_por_s': round(total_registros / tempo_envio, 3) if tempo_envio else None,
+            'registros_no_indice': len(indice.registros),
+            'servidor': dict(sorted(indice.chamadas.items())),
+        } if indice is not None else None,
+        'pico_rss_mb': round(pico_rss_mb(), 1),
+    }
+
+
+def imprimir_relatorio(relatorio):
+    processamento = relatorio['processamento']
+    print("=" * 80)
+    print("BENCHMARK (Gemini e Pinecone simulados)")
+    print("=" * 80)
+    print(f"📄 Documentos: {relatorio['documentos']} | Páginas: {relatorio['paginas']} | "
+          f"Registros: {relatorio['registros']}")
+    print(f"⚙️  Parâmetros: {relatorio['parametros']}")
+    print(f"\n🚀 Processamento: {processamento['paginas_por_s']} páginas/s "
+          f"({processamento['tempo_s']:.1f}s)")
+    print(f"   Latência por página: p50 {processamento['latencia_pagina_p50_ms']:.1f} ms | "
+          f"p95 {processamento['latencia_pagina_p95_ms']:.1f} ms")
+    print(f"\n⏱️  Etapas:")
+    for etapa, valores in sorted(processamento['etapas'].items(), key=lambda e: -e[1]['total_s']):
+        print(f"   {etapa:<16} {valores['chamadas']:>6} execução(ões) {valores['total_s']:>9.2f}s "
+              f"(média {valores['medio_ms']:.1f} ms)")
+    for motivo, espera in processamento['esperas'].items():
+        print(f"   espera/{motivo:<10} {espera['ocorrencias']:>6} ocorrência(s) {espera['segundos']:>9.2f}s")
+    print(f"\n🔍 Chamadas ao Gemini por etapa:")
+    for tipo, valores in relatorio['api_gemini']['por_etapa'].items():
+        print(f"   {tipo:<16} {valores['chamadas']:>6} chamada(s), {valores['erros']} com erro, "
+              f"{valores['bytes_enviados'] / 1024 / 1024:.1f} MB enviados")
+    print(f"   Servidor simulado: {relatorio['api_gemini']['servidor']}")
+    if relatorio['pinecone']:
+        pinecone = relatorio['pinecone']
+        print(f"\n📤 Pinecone: {pinecone['registros_por_s']} registros/s ({pinecone['tempo_s']:.1f}s), "
+              f"{pinecone['registros_no_indice']} no índice")
+        print(f"   Servidor simulado: {pinecone['servidor']}")
+    print(f"\n💾 Pico de memória (RSS): {relatorio['pico_rss_mb']:.1f} MB")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    if "--ajuda" in argv or "-h" in argv:
+        print(__doc__)
+        sys.exit(0)
+
+    obter_opcao = pipeline.obter_opcao
+    entrada = argv[0] if argv and not argv[0].startswith("--") else DIRETORIO_PDFS
+    relatorio = executar_benchmark(
+        entrada,
+        latencia_ms=obter_opcao(argv, "--latencia-ms", LATENCIA_GEMINI_MS, float),
+        taxa_429=obter_opcao(argv, "--taxa-429", TAXA_429, float),
+        taxa_json_invalido=obter_opcao(argv, "--taxa-json-invalido", TAXA_JSON_INVALIDO, float),
+        concorrencia=obter_opcao(argv, "--concorrencia", pipeline.VISION_CONCORRENCIA),
+        rpm=obter_opcao(argv, "--rpm", BENCHMARK_RPM),
+        pinecone="--sem-pinecone" not in argv,
+        semente=obter_opcao(argv, "--semente", SEMENTE),
+        classificador=obter_opcao(argv, "--classificador", None, str),
+        parametros_heuristica=obter_opcao(argv, "--parametros-heuristica", None, str),
+    )
+    imprimir_relatorio(relatorio)
+
+    saida = obter_opcao(argv, "--saida", None, str)
+    if saida:
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"📁 Relatório salvo em: {saida}")
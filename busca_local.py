@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Busca vetorial local sobre os chunks gerados por processar_pdf_completo.py.
+
+Permite consultar o corpus sem um índice Pinecone (CI, benchmarks de
+latência/recall e implantações pequenas). O índice é um diretório com:
+- vetores.npy: matriz N x d (float32, normalizada), aberta com mmap
+- registros.jsonl: id, metadados e chunk_text de cada vetor, na mesma ordem
+- ivf_centroides.npy / ivf_ordem.npy / ivf_offsets.npy: índice aproximado
+  IVF (k-means), com os vetores agrupados por lista
+- indice.json: embedder, dimensão e parâmetros
+
+A busca exata calcula o produto interno com toda a matriz; a aproximada
+visita só as `n_sondas` listas IVF mais próximas da consulta. Ambas aceitam
+filtros por chunk_type, source_file e pagina.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+from cache_embeddings import CacheEmbeddings, EmbedderComCache, CACHE_EMBEDDINGS
+from embeddings import criar_embedder
+from formato_saida import ler_registros
+
+# --- CONFIGURAÇÕES ---
+EMBEDDER_PADRAO = "hash"
+TAMANHO_LOTE_EMBEDDING = 64
+ITERACOES_KMEANS = 20
+N_SONDAS_PADRAO = 4
+CAMPOS_FILTRO = ('chunk_type', 'source_file', 'pagina')
+
+
+def _kmeans(vetores, n_listas, iteracoes=ITERACOES_KMEANS, semente=0):
+    """
+    k-means esférico (vetores normalizados, similaridade por produto interno).
+
+    Retorna: (centroides n_listas x d, atribuição de cada vetor)
+    """
+    rng = np.random.default_rng(semente)
+    centroides = vetores[rng.choice(len(vetores), n_listas, replace=False)].copy()
+
+    for _ in range(iteracoes):
+        atribuicao = np.argmax(vetores @ centroides.T, axis=1)
+        for lista in range(n_listas):
+            membros = vetores[atribuicao == lista]
+            if len(membros):
+                centroide = membros.sum(axis=0)
+                centroides[lista] = centroide / max(np.linalg.norm(centroide), 1e-12)
+
+    return centroides, np.argmax(vetores @ centroides.T, axis=1)
+
+
+class IndiceLocal:
+    """Índice vetorial local com busca exata e aproximada (IVF)"""
+
+    def __init__(self, diretorio, embedder=None):
+        self.diretorio = diretorio
+
+        with open(os.path.join(diretorio, "indice.json"), 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+
+        self.embedder = embedder or criar_embedder(self.info['embedder'])
+        if self.embedder.nome != self.info['embedder']:
+            raise ValueError(
+                f"Índice criado com '{self.info['embedder']}', embedder informado: '{self.embedder.nome}'"
+            )
+
+        self.vetores = np.load(os.path.join(diretorio, "vetores.npy"), mmap_mode='r')
+        self.registros = list(ler_registros(os.path.join(diretorio, "registros.jsonl")))
+
+        # Colunas para os filtros de metadados
+        self._colunas = {
+            'chunk_type': np.array([r.get('chunk_type', '') for r in self.registros], dtype=object),
+            'source_file': np.array([r.get('source_file', '') for r in self.registros], dtype=object),
+            'pagina': np.array([r.get('pagina', 0) for r in self.registros], dtype=np.int32),
+            'pagina_final': np.array(
+                [r.get('pagina_final', r.get('pagina', 0)) for r in self.registros], dtype=np.int32
+            ),
+        }
+
+        self.centroides = None
+        if self.info.get('ivf'):
+            self.centroides = np.load(os.path.join(diretorio, "ivf_centroides.npy"))
+            self.ivf_ordem = np.load(os.path.join(diretorio, "ivf_ordem.npy"), mmap_mode='r')
+            self.ivf_offsets = np.load(os.path.join(diretorio, "ivf_offsets.npy"))
+
+    @classmethod
+    def construir(cls, caminho_registros, diretorio, embedder, n_listas=None, verboso=True):
+        """
+        Gera o índice a partir de um arquivo .json/.jsonl de registros.
+
+        Os vetores são calculados em lotes e gravados direto na matriz em
+        disco (mmap). O IVF usa ~sqrt(N) listas por padrão (n_listas=0 desativa).
+        """
+        os.makedirs(diretorio, exist_ok=True)
+        total = sum(1 for _ in ler_registros(caminho_registros))
+        if total == 0:
+            raise ValueError(f"Nenhum registro em {caminho_registros}")
+
+        vetores = np.lib.format.open_memmap(
+            os.path.join(diretorio, "vetores.npy"), mode='w+',
+            dtype=np.float32, shape=(total, embedder.dimensao),
+        )
+
+        posicao = 0
+        lote = []
+        with open(os.path.join(diretorio, "registros.jsonl"), 'w', encoding='utf-8') as saida, \
+                tqdm(total=total, desc="Indexando", unit="chunk", disable=not verboso) as barra:
+
+            def gravar_lote():
+                nonlocal posicao
+                vetores[posicao:posicao + len(lote)] = embedder.embed_documentos(
+                    [doc['chunk_text'] for doc in lote]
+                )
+                for doc in lote:
+                    saida.write(json.dumps(doc, ensure_ascii=False) + '\n')
+                posicao += len(lote)
+                barra.update(len(lote))
+                lote.clear()
+
+            for doc in ler_registros(caminho_registros):
+                lote.append(doc)
+                if len(lote) >= TAMANHO_LOTE_EMBEDDING:
+                    gravar_lote()
+            if lote:
+                gravar_lote()
+
+        vetores.flush()
+
+        if n_listas is None:
+            n_listas = int(np.sqrt(total))
+        n_listas = min(n_listas, total)
+
+        info = {
+            'embedder': embedder.nome,
+            'dimensao': embedder.dimensao,
+            'total': total,
+            'origem': os.path.basename(caminho_registros),
+            'ivf': None,
+        }
+
+        if n_listas >= 2:
+            matriz = np.asarray(vetores)
+            centroides, atribuicao = _kmeans(matriz, n_listas)
+            ordem = np.argsort(atribuicao, kind='stable').astype(np.int64)
+            offsets = np.searchsorted(atribuicao[ordem], np.arange(n_listas + 1)).astype(np.int64)
+            np.save(os.path.join(diretorio, "ivf_centroides.npy"), centroides.astype(np.float32))
+            np.save(os.path.join(diretorio, "ivf_ordem.npy"), ordem)
+            np.save(os.path.join(diretorio, "ivf_offsets.npy"), offsets)
+            info['ivf'] = {'n_listas': n_listas}
+
+        with open(os.path.join(diretorio, "indice.json"), 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+
+        return cls(diretorio, embedder)
+
+    def _mascara(self, filtros):
+        """
+        Máscara booleana dos registros que atendem aos filtros.
+
+        Filtros: {'chunk_type': valor ou lista, 'source_file': valor ou lista,
+                  'pagina': número ou (inicio, fim)}
+        """
+        if not filtros:
+            return None
+
+        mascara = np.ones(len(self.registros), dtype=bool)
+        for campo, valor in filtros.items():
+            if campo not in CAMPOS_FILTRO:
+                raise ValueError(f"Filtro não suportado: {campo}")
+            if campo == 'pagina':
+                inicio, fim = valor if isinstance(valor, (tuple, list)) else (valor, valor)
+                # Registros podem cobrir um intervalo de páginas (pagina..pagina_final)
+                mascara &= (self._colunas['pagina'] <= fim) & (self._colunas['pagina_final'] >= inicio)
+            else:
+                valores = valor if isinstance(valor, (tuple, list, set)) else [valor]
+                mascara &= np.isin(self._colunas[campo], list(valores))
+        return mascara
+
+    def _candidatos_ivf(self, consulta, n_sondas):
+        """Posições dos vetores nas `n_sondas` listas IVF mais próximas"""
+        listas = np.argsort(-(self.centroides @ consulta))[:n_sondas]
+        return np.concatenate([
+            self.ivf_ordem[self.ivf_offsets[lista]:self.ivf_offsets[lista + 1]] for lista in listas
+        ])
+
+    def buscar_vetor(self, consulta, top_k=5, filtros=None, aproximado=False, n_sondas=N_SONDAS_PADRAO):
+        """
+        Busca pelos `top_k` vetores mais similares a um vetor de consulta.
+
+        Retorna: lista de (posição, score) em ordem decrescente de score
+        """
+        mascara = self._mascara(filtros)
+
+        if aproximado and self.centroides is not None:
+            posicoes = np.sort(self._candidatos_ivf(consulta, n_sondas))
+            if mascara is not None:
+                posicoes = posicoes[mascara[posicoes]]
+            scores = self.vetores[posicoes] @ consulta
+        else:
+            posicoes = np.flatnonzero(mascara) if mascara is not None else None
+            if posicoes is not None:
+                scores = self.vetores[posicoes] @ consulta
+            else:
+                scores = self.vetores @ consulta
+                posicoes = np.arange(len(scores))
+
+        if len(scores) == 0:
+            return []
+
+        k = min(top_k, len(scores))
+        melhores = np.argpartition(-scores, k - 1)[:k]
+        melhores = melhores[np.argsort(-scores[melhores])]
+        return [(int(posicoes[i]), float(scores[i])) for i in melhores]
+
+    def buscar(self, consulta, top_k=5, filtros=None, aproximado=False, n_sondas=N_SONDAS_PADRAO):
+        """
+        Busca textual: gera o embedding da consulta e retorna os registros.
+
+        Retorna: lista de dicts {'id', 'score', 'registro'}
+        """
+        vetor = self.embedder.embed_consulta(consulta)
+        resultados = self.buscar_vetor(vetor, top_k, filtros, aproximado, n_sondas)
+        return [
+            {'id': self.registros[pos]['id'], 'score': score, 'registro': self.registros[pos]}
+            for pos, score in resultados
+        ]
+
+
+def obter_opcao(argv, nome, padrao, tipo=str):
+    """Lê o valor de uma flag no formato '--nome VALOR' (ou retorna o padrão)"""
+    if nome in argv:
+        indice = argv.index(nome)
+        if indice + 1 < len(argv):
+            return tipo(argv[indice + 1])
+    return padrao
+
+
+def _uso():
+    print("Uso:")
+    print("  python busca_local.py indexar <arquivo.json|.jsonl|.parquet> <diretorio_indice> [--embedder hash|gemini] [--listas N] [--sem-cache-embeddings]")
+    print("  python busca_local.py buscar <diretorio_indice> \"<consulta>\" [--top-k N] [--tipo T] [--arquivo F] [--pagina N] [--aproximado]")
+    print("\nExemplos:")
+    print("  python busca_local.py indexar json_processados/manual.json indice_local/")
+    print("  python busca_local.py buscar indice_local/ \"como incluir plano de trabalho\" --tipo contexto")
+    print("\nFlags:")
+    print(f"  --embedder NOME   Embedder do índice (padrão: {EMBEDDER_PADRAO})")
+    print("  --listas N        Listas do índice IVF (padrão: raiz de N; 0 desativa)")
+    print(f"  --sem-cache-embeddings  Não usa o cache de embeddings ({CACHE_EMBEDDINGS}) na indexação")
+    print("  --top-k N         Número de resultados (padrão: 5)")
+    print("  --tipo T          Filtra por chunk_type")
+    print("  --arquivo F       Filtra por source_file")
+    print("  --pagina N        Filtra por página")
+    print("  --aproximado      Usa o índice IVF em vez da busca exata")
+    print(f"  --sondas N        Listas IVF visitadas na busca aproximada (padrão: {N_SONDAS_PADRAO})")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] not in ('indexar', 'buscar'):
+        _uso()
+        sys.exit(1)
+
+    if sys.argv[1] == 'indexar':
+        caminho_registros, diretorio = sys.argv[2], sys.argv[3]
+        embedder = criar_embedder(obter_opcao(sys.argv, "--embedder", EMBEDDER_PADRAO))
+        n_listas = obter_opcao(sys.argv, "--listas", None, tipo=int)
+        # Os mesmos vetores do envio ao Pinecone, sem recalcular os textos inalterados
+        if "--sem-cache-embeddings" not in sys.argv:
+            embedder = EmbedderComCache(embedder, CacheEmbeddings(CACHE_EMBEDDINGS))
+
+        inicio = time.time()
+        indice = IndiceLocal.construir(caminho_registros, diretorio, embedder, n_listas)
+        print(f"✅ {indice.info['total']} vetores indexados em {time.time() - inicio:.1f}s "
+              f"(embedder: {embedder.nome}, IVF: {indice.info['ivf']})")
+        print(f"📁 Índice salvo em: {diretorio}")
+        sys.exit(0)
+
+    diretorio, consulta = sys.argv[2], sys.argv[3]
+    filtros = {}
+    if obter_opcao(sys.argv, "--tipo", None):
+        filtros['chunk_type'] = obter_opcao(sys.argv, "--tipo", None)
+    if obter_opcao(sys.argv, "--arquivo", None):
+        filtros['source_file'] = obter_opcao(sys.argv, "--arquivo", None)
+    if obter_opcao(sys.argv, "--pagina", None):
+        filtros['pagina'] = obter_opcao(sys.argv, "--pagina", None, tipo=int)
+
+    indice = IndiceLocal(diretorio)
+    inicio = time.perf_counter()
+    resultados = indice.buscar(
+        consulta,
+        top_k=obter_opcao(sys.argv, "--top-k", 5, tipo=int),
+        filtros=filtros,
+        aproximado="--aproximado" in sys.argv,
+        n_sondas=obter_opcao(sys.argv, "--sondas", N_SONDAS_PADRAO, tipo=int),
+    )
+    latencia_ms = (time.perf_counter() - inicio) * 1000
+
+    print(f"🔍 {len(resultados)} resultado(s) em {latencia_ms:.1f} ms\n")
+    for posicao, resultado in enumerate(resultados, 1):
+        registro = resultado['registro']
+        trecho = registro['chunk_text'][:200].replace('\n', ' ')
+        print(f"{posicao}. [{resultado['score']:.3f}] {registro['source_file']} p.{registro['pagina']} "
+              f"({registro['chunk_type']}) - {registro['task_title']}")
+        print(f"   {trecho}...\n")
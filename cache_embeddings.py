@@ -0,0 +1,107 @@
+# cache_embeddings.py
+"""
+Cache persistente (SQLite) de embeddings dos chunks.
+
+A chave é (nome do modelo de embedding, SHA-256 do chunk_text): um novo
+envio ou uma nova indexação só calcula o embedding dos textos que
+mudaram. EmbedderComCache envolve qualquer embedder de embeddings.py e
+mantém a mesma interface (nome, dimensao, embed_documentos,
+embed_consulta), com as chamadas ao embedder agrupadas em lotes.
+"""
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+CACHE_EMBEDDINGS = "cache_embeddings.sqlite"
+TAMANHO_LOTE_EMBEDDING = 96  # Textos por chamada ao embedder
+_MAX_PARAMETROS_SQL = 900  # Abaixo do limite de parâmetros por consulta do SQLite
+
+
+def hash_texto(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class CacheEmbeddings:
+    """
+    Vetores float32 gravados como BLOB, um por (modelo, hash do texto).
+
+    A conexão é compartilhada entre threads (o uploader embute os lotes
+    nos workers), com acesso serializado por um lock.
+    """
+
+    def __init__(self, caminho=CACHE_EMBEDDINGS):
+        self.caminho = caminho
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "modelo TEXT NOT NULL, hash_texto TEXT NOT NULL, vetor BLOB NOT NULL, "
+            "PRIMARY KEY (modelo, hash_texto)) WITHOUT ROWID"
+        )
+        self._conexao.commit()
+
+    def obter(self, modelo, hashes):
+        """Vetores em cache dos hashes informados: dict hash -> np.ndarray"""
+        hashes = list(dict.fromkeys(hashes))
+        encontrados = {}
+        with self._lock:
+            for i in range(0, len(hashes), _MAX_PARAMETROS_SQL):
+                parte = hashes[i:i + _MAX_PARAMETROS_SQL]
+                marcadores = ",".join("?" * len(parte))
+                linhas = self._conexao.execute(
+                    f"SELECT hash_texto, vetor FROM embeddings WHERE modelo = ? AND hash_texto IN ({marcadores})",
+                    [modelo] + parte,
+                )
+                for h, vetor in linhas:
+                    encontrados[h] = np.frombuffer(vetor, dtype=np.float32)
+            self.acertos += len(encontrados)
+            self.faltas += len(hashes) - len(encontrados)
+        return encontrados
+
+    def salvar(self, modelo, vetores):
+        """Grava um dict hash -> vetor"""
+        with self._lock:
+            self._conexao.executemany(
+                "INSERT OR REPLACE INTO embeddings (modelo, hash_texto, vetor) VALUES (?, ?, ?)",
+                [(modelo, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in vetores.items()],
+            )
+            self._conexao.commit()
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+
+class EmbedderComCache:
+    """Embedder que consulta o cache antes e só calcula os textos ausentes"""
+
+    def __init__(self, embedder, cache, tamanho_lote=TAMANHO_LOTE_EMBEDDING):
+        self.embedder = embedder
+        self.cache = cache
+        self.tamanho_lote = tamanho_lote
+        self.nome = embedder.nome
+        self.dimensao = embedder.dimensao
+
+    def embed_documentos(self, textos):
+        textos = list(textos)
+        hashes = [hash_texto(t) for t in textos]
+        vetores = self.cache.obter(self.nome, hashes)
+
+        # Textos ausentes, sem repetição, calculados em lotes
+        ausentes = {h: t for h, t in zip(hashes, textos) if h not in vetores}
+        itens = list(ausentes.items())
+        for i in range(0, len(itens), self.tamanho_lote):
+            lote = itens[i:i + self.tamanho_lote]
+            calculados = self.embedder.embed_documentos([t for _, t in lote])
+            novos = {h: vetor for (h, _), vetor in zip(lote, calculados)}
+            self.cache.salvar(self.nome, novos)
+            vetores.update(novos)
+
+        return np.asarray([vetores[h] for h in hashes], dtype=np.float32).reshape(len(textos), self.dimensao)
+
+    def embed_consulta(self, texto):
+        return self.embedder.embed_consulta(texto)
@@ -0,0 +1,117 @@
+# cache_vision.py
+"""
+Cache persistente (em disco) dos resultados do Gemini Vision.
+
+A chave é o hash do conteúdo renderizado da página (pixels do pixmap)
+combinado com o modelo e o texto do prompt, de modo que só as páginas
+cujos pixels mudaram voltam a ser enviadas à API. Os valores são
+gravados como JSON, um arquivo por chave, com remoção das entradas
+menos usadas quando o tamanho total passa do limite configurado.
+"""
+import hashlib
+import json
+import os
+import threading
+
+CACHE_VISION_DIR = "cache_vision"
+CACHE_TAMANHO_MAX_MB = 500
+
+
+class CacheVision:
+    """
+    Cache em disco endereçado por conteúdo.
+
+    Cada entrada fica em <diretorio>/<2 primeiros caracteres>/<chave>.json.
+    O horário de modificação dos arquivos é atualizado a cada acerto e
+    usado para remover primeiro as entradas menos usadas recentemente.
+    """
+
+    def __init__(self, diretorio=CACHE_VISION_DIR, tamanho_max_mb=CACHE_TAMANHO_MAX_MB):
+        self.diretorio = diretorio
+        self.tamanho_max = int(tamanho_max_mb * 1024 * 1024)
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._tamanho_total = sum(os.path.getsize(c) for c in self._listar_entradas())
+
+    @staticmethod
+    def chave(hash_pixels, prompt, modelo):
+        """
+        Calcula a chave de uma página renderizada.
+
+        Combina modelo, prompt e o hash dos pixels da página (calculado por
+        preparar_imagem() a partir das amostras do pixmap e suas dimensões).
+        """
+        h = hashlib.sha256()
+        h.update(modelo.encode('utf-8'))
+        h.update(b'\0')
+        h.update(prompt.encode('utf-8'))
+        h.update(b'\0')
+        h.update(hash_pixels.encode('ascii'))
+        return h.hexdigest()
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.json")
+
+    def _listar_entradas(self):
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                if nome.endswith('.json'):
+                    yield os.path.join(raiz, nome)
+
+    def obter(self, chave):
+        """Retorna o valor armazenado para a chave ou None"""
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                valor = json.load(f)
+            os.utime(caminho)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.faltas += 1
+            return None
+
+        with self._lock:
+            self.acertos += 1
+        return valor
+
+    def salvar(self, chave, valor):
+        """Grava o valor (escrita atômica) e aplica o limite de tamanho"""
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(valor, f, ensure_ascii=False)
+
+        with self._lock:
+            tamanho_anterior = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+            os.replace(temporario, caminho)
+            self._tamanho_total += os.path.getsize(caminho) - tamanho_anterior
+
+            if self._tamanho_total > self.tamanho_max:
+                self._remover_antigos()
+
+    def _remover_antigos(self):
+        """Remove as entradas menos usadas até ficar abaixo de 90% do limite"""
+        entradas = []
+        for caminho in self._listar_entradas():
+            try:
+                estado = os.stat(caminho)
+            except OSError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, caminho))
+
+        entradas.sort()
+        self._tamanho_total = sum(tamanho for _, tamanho, _ in entradas)
+        alvo = self.tamanho_max * 0.9
+
+        for _, tamanho, caminho in entradas:
+            if self._tamanho_total <= alvo:
+                break
+            try:
+                os.remove(caminho)
+                self._tamanho_total -= tamanho
+            except OSError:
+                pass
@@ -0,0 +1,291 @@
+# classificador_telas.py
+"""
+Classificador local (CPU, sem API) de telas de sistema para páginas ambíguas.
+
+Extrai características baratas da miniatura renderizada da página
+(densidade de bordas, linhas horizontais/verticais de widgets, regiões
+planas de cor, saturação, layout das linhas de texto) e decide SIM/NÃO
+com uma regressão logística. Só as páginas em que o modelo também fica
+em dúvida (probabilidade entre LIMIAR_NAO e LIMIAR_SIM) seguem para o
+Vision Flash.
+
+Os dados de treino são os vereditos já obtidos do Gemini (confirmação
+Flash e análise completa), gravados por processar_pdf_completo.py com
+--coletar-treino em ARQUIVO_TREINO_CLASSIFICADOR (JSONL).
+
+Uso:
+    python classificador_telas.py treinar [dados.jsonl] [modelo.json]
+    python classificador_telas.py avaliar [dados.jsonl] [modelo.json]
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+MODELO_CLASSIFICADOR_TELAS = "modelo_classificador_telas.json"
+ARQUIVO_TREINO_CLASSIFICADOR = "treino_classificador_telas.jsonl"
+VERSAO_CARACTERISTICAS = 2
+LADO_CARACTERISTICAS = 256  # Lado máximo (px) da imagem usada nas características
+LIMIAR_SIM = 0.85  # Probabilidade a partir da qual a página é tela sem chamar a API
+LIMIAR_NAO = 0.15  # Probabilidade até a qual a página não é tela sem chamar a API
+LIMIAR_BORDA = 0.15  # Diferença de intensidade (0-1) considerada borda
+TAMANHO_BLOCO = 8  # Blocos (px) para medir regiões planas
+
+NOMES_CARACTERISTICAS = [
+    'densidade_bordas',
+    'linhas_horizontais',
+    'linhas_verticais',
+    'blocos_planos_coloridos',
+    'blocos_planos_brancos',
+    'saturacao_media',
+    'fracao_colorida',
+    'cores_distintas',
+    'fracao_tinta',
+    'linhas_texto',
+    'altura_media_linha',
+    'confianca_heuristica',
+]
+
+
+def extrair_caracteristicas(imagem, confianca_heuristica=0.5):
+    """
+    Características da miniatura de uma página (imagem PIL).
+
+    A imagem é reduzida para LADO_CARACTERISTICAS, então o resultado não
+    depende da resolução em que a página foi renderizada.
+
+    Retorna: lista de floats na ordem de NOMES_CARACTERISTICAS
+    """
+    imagem = imagem.convert("RGB")
+    imagem.thumbnail((LADO_CARACTERISTICAS, LADO_CARACTERISTICAS))
+    rgb = np.asarray(imagem, dtype=np.float32) / 255.0
+    cinza = rgb.mean(axis=2)
+    altura, largura = cinza.shape
+
+    # Bordas: diferenças entre pixels vizinhos
+    bordas_x = np.abs(np.diff(cinza, axis=1)) > LIMIAR_BORDA
+    bordas_y = np.abs(np.diff(cinza, axis=0)) > LIMIAR_BORDA
+    densidade_bordas = (bordas_x.mean() + bordas_y.mean()) / 2
+
+    # Bordas longas de botões, campos, tabelas e janelas
+    linhas_horizontais = (bordas_y.mean(axis=1) > 0.3).mean()
+    linhas_verticais = (bordas_x.mean(axis=0) > 0.3).mean()
+
+    # Regiões planas: blocos de baixa variação (fundos de barras e painéis)
+    h_blocos, l_blocos = altura // TAMANHO_BLOCO, largura // TAMANHO_BLOCO
+    if h_blocos and l_blocos:
+        blocos = cinza[:h_blocos * TAMANHO_BLOCO, :l_blocos * TAMANHO_BLOCO].reshape(
+            h_blocos, TAMANHO_BLOCO, l_blocos, TAMANHO_BLOCO
+        )
+        planos = blocos.std(axis=(1, 3)) < 0.02
+        brancos = blocos.mean(axis=(1, 3)) > 0.95
+        blocos_planos_coloridos = (planos & ~brancos).mean()
+        blocos_planos_brancos = (planos & brancos).mean()
+    else:
+        blocos_planos_coloridos = blocos_planos_brancos = 0.0
+
+    # Cor: interfaces têm mais áreas saturadas que páginas de texto
+    saturacao = rgb.max(axis=2) - rgb.min(axis=2)
+    saturacao_media = saturacao.mean()
+    fracao_colorida = (saturacao > 0.15).mean()
+    quantizada = (rgb * 15).astype(np.uint16)
+    codigos = (quantizada[..., 0] << 8) | (quantizada[..., 1] << 4) | quantizada[..., 2]
+    cores_distintas = np.log1p(len(np.unique(codigos))) / np.log1p(4096)
+
+    # Layout do texto: faixas horizontais com tinta (linhas de texto)
+    tinta = cinza < 0.5
+    fracao_tinta = tinta.mean()
+    linhas_com_tinta = tinta.any(axis=1)
+    inicios = np.flatnonzero(linhas_com_tinta[1:] & ~linhas_com_tinta[:-1])
+    num_linhas = len(inicios) + int(linhas_com_tinta[0])
+    linhas_texto = num_linhas / altura
+    altura_media_linha = linhas_com_tinta.sum() / max(num_linhas, 1) / altura
+
+    return [float(v) for v in (
+        densidade_bordas, linhas_horizontais, linhas_verticais,
+        blocos_planos_coloridos, blocos_planos_brancos,
+        saturacao_media, fracao_colorida, cores_distintas,
+        fracao_tinta, linhas_texto, altura_media_linha,
+        confianca_heuristica,
+    )]
+
+
+class ClassificadorTelas:
+    """Regressão logística sobre as características padronizadas"""
+
+    def __init__(self, pesos, vies, media, desvio, limiar_sim=LIMIAR_SIM, limiar_nao=LIMIAR_NAO):
+        self.pesos = np.asarray(pesos, dtype=np.float64)
+        self.vies = float(vies)
+        self.media = np.asarray(media, dtype=np.float64)
+        self.desvio = np.asarray(desvio, dtype=np.float64)
+        self.limiar_sim = limiar_sim
+        self.limiar_nao = limiar_nao
+
+    @classmethod
+    def treinar(cls, caracteristicas, rotulos, iteracoes=2000, taxa=0.1, regularizacao=1e-3):
+        """
+        Treina por gradiente descendente, com pesos por classe para
+        compensar o desbalanceamento entre páginas com e sem tela.
+        """
+        x = np.asarray(caracteristicas, dtype=np.float64)
+        y = np.asarray(rotulos, dtype=np.float64)
+        media = x.mean(axis=0)
+        desvio = np.maximum(x.std(axis=0), 1e-6)
+        x = (x - media) / desvio
+
+        positivos = max(y.sum(), 1)
+        negativos = max(len(y) - y.sum(), 1)
+        peso_amostra = np.where(y == 1, len(y) / (2 * positivos), len(y) / (2 * negativos))
+
+        pesos = np.zeros(x.shape[1])
+        vies = 0.0
+        for _ in range(iteracoes):
+            p = 1 / (1 + np.exp(-(x @ pesos + vies)))
+            erro = (p - y) * peso_amostra
+            pesos -= taxa * (x.T @ erro / len(y) + regularizacao * pesos)
+            vies -= taxa * erro.mean()
+
+        return cls(pesos, vies, media, desvio)
+
+    @classmethod
+    def carregar(cls, caminho=MODELO_CLASSIFICADOR_TELAS):
+        """Carrega o modelo salvo (None se o arquivo não existir)"""
+        if not caminho or not os.path.exists(caminho):
+            return None
+        with open(caminho, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+        if dados.get('versao_caracteristicas') != VERSAO_CARACTERISTICAS:
+            raise ValueError(
+                f"Modelo {caminho} usa características v{dados.get('versao_caracteristicas')}; "
+                f"esperado v{VERSAO_CARACTERISTICAS} (treine novamente)"
+            )
+        return cls(dados['pesos'], dados['vies'], dados['media'], dados['desvio'],
+                   dados.get('limiar_sim', LIMIAR_SIM), dados.get('limiar_nao', LIMIAR_NAO))
+
+    def salvar(self, caminho=MODELO_CLASSIFICADOR_TELAS, metricas=None):
+        dados = {
+            'versao_caracteristicas': VERSAO_CARACTERISTICAS,
+            'caracteristicas': NOMES_CARACTERISTICAS,
+            'pesos': self.pesos.tolist(),
+            'vies': self.vies,
+            'media': self.media.tolist(),
+            'desvio': self.desvio.tolist(),
+            'limiar_sim': self.limiar_sim,
+            'limiar_nao': self.limiar_nao,
+            'metricas': metricas or {},
+        }
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False, indent=2)
+
+    def probabilidade(self, caracteristicas):
+        """Probabilidade de a página conter tela (aceita um vetor ou uma matriz)"""
+        x = (np.asarray(caracteristicas, dtype=np.float64) - self.media) / self.desvio
+        return 1 / (1 + np.exp(-(x @ self.pesos + self.vies)))
+
+    def decidir(self, caracteristicas):
+        """
+        Retorna: (tem_tela: True/False, ou None se o modelo estiver em dúvida;
+                  probabilidade)
+        """
+        p = float(self.probabilidade(caracteristicas))
+        if p >= self.limiar_sim:
+            return True, p
+        if p <= self.limiar_nao:
+            return False, p
+        return None, p
+
+
+def registrar_amostra(caminho, amostra):
+    """Acrescenta uma amostra de treino (uma linha JSON) ao arquivo"""
+    amostra = dict(amostra, versao_caracteristicas=VERSAO_CARACTERISTICAS)
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(amostra, ensure_ascii=False) + '\n')
+
+
+def carregar_amostras(caminho):
+    """
+    Lê as amostras de treino, mantendo a mais recente de cada página
+    (id) e preferindo o veredito da análise completa ao do Flash.
+
+    Retorna: (matriz de características, rótulos, amostras)
+    """
+    por_id = {}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            amostra = json.loads(linha)
+            if amostra.get('versao_caracteristicas') != VERSAO_CARACTERISTICAS:
+                continue
+            anterior = por_id.get(amostra['id'])
+            if anterior and anterior['origem'] == 'vision' and amostra['origem'] == 'flash':
+                continue
+            por_id[amostra['id']] = amostra
+
+    amostras = list(por_id.values())
+    x = np.array([a['caracteristicas'] for a in amostras], dtype=np.float64)
+    y = np.array([1 if a['tem_tela'] else 0 for a in amostras])
+    return x, y, amostras
+
+
+def avaliar(classificador, x, y):
+    """Acurácia geral e cobertura/acurácia das decisões locais (fora da faixa de dúvida)"""
+    p = classificador.probabilidade(x)
+    decididas = (p >= classificador.limiar_sim) | (p <= classificador.limiar_nao)
+    acertos = (p >= 0.5) == (y == 1)
+    return {
+        'amostras': int(len(y)),
+        'acuracia': float(acertos.mean()) if len(y) else 0.0,
+        'cobertura_local': float(decididas.mean()) if len(y) else 0.0,
+        'acuracia_local': float(acertos[decididas].mean()) if decididas.any() else 0.0,
+    }
+
+
+def _imprimir_metricas(titulo, metricas):
+    print(f"{titulo}: {metricas['amostras']} amostra(s)")
+    print(f"   Acurácia (limiar 0.5): {metricas['acuracia']:.1%}")
+    print(f"   Decididas localmente: {metricas['cobertura_local']:.1%} "
+          f"(acurácia {metricas['acuracia_local']:.1%})")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('treinar', 'avaliar'):
+        print("Uso: python classificador_telas.py treinar|avaliar [dados.jsonl] [modelo.json]")
+        print(f"\nPadrões: dados={ARQUIVO_TREINO_CLASSIFICADOR} modelo={MODELO_CLASSIFICADOR_TELAS}")
+        print("Os dados são gravados por: python processar_pdf_completo.py ... --coletar-treino")
+        sys.exit(1)
+
+    caminho_dados = sys.argv[2] if len(sys.argv) > 2 else ARQUIVO_TREINO_CLASSIFICADOR
+    caminho_modelo = sys.argv[3] if len(sys.argv) > 3 else MODELO_CLASSIFICADOR_TELAS
+
+    if not os.path.exists(caminho_dados):
+        print(f"❌ Erro: dados de treino não encontrados: {caminho_dados}")
+        sys.exit(1)
+
+    x, y, amostras = carregar_amostras(caminho_dados)
+    print(f"📊 {len(y)} página(s): {int(y.sum())} com tela, {int(len(y) - y.sum())} sem tela")
+
+    if sys.argv[1] == 'avaliar':
+        classificador = ClassificadorTelas.carregar(caminho_modelo)
+        if classificador is None:
+            print(f"❌ Erro: modelo não encontrado: {caminho_modelo}")
+            sys.exit(1)
+        _imprimir_metricas("\n✅ Avaliação", avaliar(classificador, x, y))
+        sys.exit(0)
+
+    if len(set(y.tolist())) < 2:
+        print("❌ Erro: o treino precisa de páginas com e sem tela")
+        sys.exit(1)
+
+    # Validação com 20% das páginas (ordem fixa, reprodutível)
+    ordem = np.random.default_rng(0).permutation(len(y))
+    corte = max(1, len(y) // 5)
+    validacao, treino = ordem[:corte], ordem[corte:]
+    metricas_validacao = avaliar(ClassificadorTelas.treinar(x[treino], y[treino]), x[validacao], y[validacao])
+    _imprimir_metricas("\n🔍 Validação", metricas_validacao)
+
+    # Modelo final com todas as páginas
+    classificador = ClassificadorTelas.treinar(x, y)
+    classificador.salvar(caminho_modelo, {'validacao': metricas_validacao})
+    print(f"\n📁 Modelo salvo em: {caminho_modelo}")
@@ -0,0 +1,317 @@
+# controle_taxa.py
+"""
+Controle de taxa para as chamadas ao Gemini Vision.
+
+O LimitadorTaxa é um token bucket configurado em requisições por minuto
+e pode ser compartilhado entre as threads que fazem chamadas à API e,
+com um estado criado por criar_estado_compartilhado(), entre processos
+(processamento em lote).
+
+O ControleTaxa acrescenta ao token bucket a adaptação ao servidor:
+- erros classificados por tipo/status (classificar_erro), não por texto
+- pausa global ao receber 429, respeitando o atraso informado pelo
+  servidor (Retry-After / RetryInfo) ou com backoff exponencial e jitter
+- taxa ajustada por AIMD: cai pela metade a cada 429 e sobe aos poucos a
+  cada sucesso, até o limite configurado
+- disjuntor (circuit breaker): após falhas seguidas, as chamadas falham
+  imediatamente com CircuitoAberto durante uma pausa, em vez de esperar
+"""
+import multiprocessing
+import random
+import re
+import threading
+import time
+
+# --- CONFIGURAÇÕES DO CONTROLE ADAPTATIVO ---
+FATOR_REDUCAO_RPM = 0.5  # Redução multiplicativa da taxa a cada 429
+AUMENTO_RPM_SUCESSO = 1.0  # Aumento aditivo da taxa (req/min) a cada sucesso
+FRACAO_RPM_MINIMO = 0.1  # A taxa não cai abaixo desta fração do limite
+PAUSA_BASE_LIMITE = 5.0  # Segundos de pausa global no primeiro 429 sem Retry-After
+PAUSA_MAXIMA_LIMITE = 60.0  # Teto da pausa global por 429
+LIMIAR_FALHAS_CIRCUITO = 5  # Falhas seguidas (429/5xx/rede) que abrem o circuito
+PAUSA_CIRCUITO = 120.0  # Segundos com o circuito aberto
+
+# Posições do estado (local ou compartilhado)
+_TOKENS, _ULTIMO, _RPM_ATUAL, _PAUSA_ATE, _FALHAS, _CIRCUITO_ATE, _ABERTURAS = range(7)
+
+_PADRAO_ATRASO = re.compile(
+    r"(?:retry[ _-]?after|retry[ _-]?delay|retry in)\W*(\d+(?:\.\d+)?)\s*(ms|s)?", re.IGNORECASE
+)
+# Nomes das exceções de google.api_core (sem depender do pacote)
+_EXCECOES_LIMITE = {'ResourceExhausted', 'TooManyRequests'}
+_EXCECOES_TEMPORARIAS = {
+    'ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+    'BadGateway', 'Aborted', 'RetryError',
+}
+# finish_reason de respostas barradas pelos filtros: repetir a chamada não muda o resultado
+_MOTIVOS_BLOQUEIO = {
+    'SAFETY', 'RECITATION', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII', 'IMAGE_SAFETY', 'LANGUAGE',
+}
+
+
+class CircuitoAberto(Exception):
+    """Chamada recusada sem ir à API porque o circuito está aberto"""
+
+
+def criar_estado_compartilhado(capacidade=1, contexto=None):
+    """
+    Cria o estado do token bucket em memória compartilhada entre processos.
+
+    O estado deve ser repassado aos processos filhos na criação (por exemplo,
+    via `initargs` do pool) e usado em LimitadorTaxa(..., estado=estado).
+
+    Retorna: multiprocessing.Array com [tokens, instante da última reposição]
+    """
+    contexto = contexto or multiprocessing.get_context()
+    # [tokens, última reposição, rpm atual (0 = ainda não definido), pausa até,
+    #  falhas seguidas, circuito aberto até, aberturas do circuito]
+    return contexto.Array('d', [max(1.0, float(capacidade)), time.monotonic(), 0.0, 0.0, 0.0, 0.0, 0.0])
+
+
+def status_erro(erro):
+    """Status HTTP de uma exceção (google.api_core, Pinecone, requests), ou None"""
+    for candidato in (getattr(erro, 'code', None), getattr(erro, 'status', None),
+                      getattr(getattr(erro, 'http_resp', None), 'status', None),
+                      getattr(getattr(erro, 'response', None), 'status_code', None)):
+        if isinstance(candidato, int):
+            return candidato
+    return None
+
+
+def classificar_erro(erro):
+    """
+    Classifica a falha de uma chamada à API:
+    - 'limite': 429 / cota esgotada
+    - 'temporario': 5xx, timeout, falha de conexão
+    - 'resposta': resposta recebida, mas inválida (ex.: JSON malformado)
+    - 'permanente': demais erros (4xx), que não adianta repetir
+    """
+    status = status_erro(erro)
+    nome = type(erro).__name__
+    if status == 429 or nome in _EXCECOES_LIMITE:
+        return 'limite'
+    if (status is not None and status >= 500) or nome in _EXCECOES_TEMPORARIAS:
+        return 'temporario'
+    if isinstance(erro, ValueError):  # inclui json.JSONDecodeError
+        return 'resposta'
+    if isinstance(erro, (ConnectionError, TimeoutError)):
+        return 'temporario'
+    if status is not None:
+        return 'permanente'
+    # Exceção sem status nem tipo conhecido: último recurso, a mensagem
+    texto = str(erro).lower()
+    if "429" in texto or "resource exhausted" in texto or "quota" in texto:
+        return 'limite'
+    return 'temporario'
+
+
+def _nome_enum(valor):
+    return getattr(valor, 'name', None) or str(valor).upper()
+
+
+def motivo_bloqueio(resposta):
+    """
+    Motivo pelo qual o Gemini barrou o prompt ou a resposta (filtros de
+    segurança, recitação etc.), ou None se a resposta não foi bloqueada.
+    Respostas sem o atributo `candidates` (ex.: simuladas) não são avaliadas.
+    """
+    bloqueio = getattr(getattr(resposta, 'prompt_feedback', None), 'block_reason', None)
+    if bloqueio:
+        return f"Prompt bloqueado ({_nome_enum(bloqueio)})"
+    candidatos = getattr(resposta, 'candidates', None)
+    if candidatos is None:
+        return None
+    if not candidatos:
+        return "Resposta sem candidatos"
+    motivo = _nome_enum(getattr(candidatos[0], 'finish_reason', None))
+    if motivo in _MOTIVOS_BLOQUEIO:
+        return f"Resposta bloqueada ({motivo})"
+    return None
+
+
+def atraso_servidor(erro):
+    """
+    Atraso pedido pelo servidor, em segundos: cabeçalho Retry-After,
+    RetryInfo nos detalhes do erro do Gemini ou "retry in/after N" na
+    mensagem. Retorna None se o servidor não informou.
+    """
+    for resposta in (getattr(erro, 'response', None), getattr(erro, 'http_resp', None)):
+        cabecalhos = getattr(resposta, 'headers', None) or {}
+        valor = cabecalhos.get('Retry-After') or cabecalhos.get('retry-after')
+        if valor is not None:
+            try:
+                return max(0.0, float(valor))
+            except (TypeError, ValueError):
+                pass
+
+    for detalhe in getattr(erro, 'details', None) or []:
+        atraso = getattr(detalhe, 'retry_delay', None)
+        if atraso is not None:
+            return getattr(atraso, 'seconds', 0) + getattr(atraso, 'nanos', 0) / 1e9
+
+    encontrado = _PADRAO_ATRASO.search(str(erro))
+    if encontrado:
+        valor = float(encontrado.group(1))
+        return valor / 1000 if (encontrado.group(2) or '').lower() == 'ms' else valor
+    return None
+
+
+def backoff_com_jitter(base, tentativa, maximo=PAUSA_MAXIMA_LIMITE):
+    """Backoff exponencial com jitter ("equal jitter"): entre metade e o total do atraso"""
+    atraso = min(maximo, base * (2 ** tentativa))
+    return atraso / 2 + random.uniform(0, atraso / 2)
+
+
+class LimitadorTaxa:
+    """
+    Token bucket em requisições por minuto (RPM).
+
+    Os tokens são repostos continuamente à taxa de rpm/60 por segundo, até
+    o limite de `capacidade` (rajada máxima). Cada chamada a adquirir()
+    consome um token, esperando o tempo necessário se o balde estiver vazio.
+
+    Sem `estado`, o balde é local ao processo (seguro entre threads). Com um
+    estado de criar_estado_compartilhado(), o mesmo orçamento de requisições
+    vale para todos os processos que o receberem.
+    """
+
+    def __init__(self, rpm, capacidade=1, estado=None):
+        if rpm <= 0:
+            raise ValueError("rpm deve ser maior que zero")
+        self.rpm = rpm
+        self.capacidade = max(1.0, float(capacidade))
+        if estado is None:
+            self._estado = [self.capacidade, time.monotonic(), 0.0, 0.0, 0.0, 0.0, 0.0]
+            self._lock = threading.Lock()
+        else:
+            self._estado = estado
+            self._lock = estado.get_lock()
+
+    def _taxa(self):
+        """Taxa vigente em requisições por minuto"""
+        return self.rpm
+
+    def _repor(self, agora):
+        """Repõe os tokens acumulados desde a última verificação"""
+        tokens, ultimo = self._estado[_TOKENS], self._estado[_ULTIMO]
+        self._estado[_TOKENS] = min(self.capacidade, tokens + (agora - ultimo) * self._taxa() / 60.0)
+        self._estado[_ULTIMO] = agora
+
+    # O limitador simples não se adapta às respostas do servidor
+    def registrar_sucesso(self):
+        pass
+
+    def registrar_falha(self, classe, atraso=None):
+        pass
+
+    def circuito_aberto(self):
+        return False
+
+    def situacao(self):
+        """Resumo do estado do limitador (para relatórios)"""
+        return {'rpm': self.rpm}
+
+    def adquirir(self):
+        """
+        Bloqueia até haver um token disponível e o consome.
+
+        Retorna: tempo total de espera em segundos
+        """
+        esperado = 0.0
+        while True:
+            with self._lock:
+                espera = self._consumir(time.monotonic())
+            if espera <= 0:
+                return esperado
+            time.sleep(espera)
+            esperado += espera
+
+    def _consumir(self, agora):
+        """Consome um token, se houver (retorna 0), ou retorna quanto esperar (com o lock)"""
+        self._repor(agora)
+        if self._estado[_TOKENS] >= 1:
+            self._estado[_TOKENS] -= 1
+            return 0.0
+        return (1 - self._estado[_TOKENS]) * 60.0 / self._taxa()
+
+
+class ControleTaxa(LimitadorTaxa):
+    """
+    Token bucket com taxa adaptativa (AIMD), pausa global por 429 e
+    disjuntor, compartilhável entre threads e processos como o LimitadorTaxa.
+
+    Quem chama a API informa o resultado: registrar_sucesso() ou
+    registrar_falha(classe, atraso) com a classe de classificar_erro() e o
+    atraso de atraso_servidor(). Assim um 429 pausa todas as requisições
+    (não só a página que o recebeu) e a taxa cai para todos os workers.
+
+    Com o circuito aberto, adquirir() levanta CircuitoAberto sem esperar:
+    a página deve ser marcada para processamento posterior. Passada a
+    pausa, as chamadas voltam (meio aberto); uma nova falha reabre o
+    circuito e um sucesso o fecha.
+    """
+
+    def __init__(self, rpm, capacidade=1, estado=None, rpm_minimo=None):
+        super().__init__(rpm, capacidade, estado)
+        self.rpm_minimo = max(0.1, rpm_minimo or rpm * FRACAO_RPM_MINIMO)
+        with self._lock:
+            if self._estado[_RPM_ATUAL] <= 0:
+                self._estado[_RPM_ATUAL] = float(rpm)
+
+    def _taxa(self):
+        return self._estado[_RPM_ATUAL]
+
+    def _consumir(self, agora):
+        if self._estado[_CIRCUITO_ATE] > agora:
+            raise CircuitoAberto(
+                f"Circuito aberto por {self._estado[_CIRCUITO_ATE] - agora:.0f}s "
+                f"após {int(self._estado[_FALHAS])} falha(s) seguida(s)"
+            )
+        if self._estado[_PAUSA_ATE] > agora:
+            return self._estado[_PAUSA_ATE] - agora
+        return super()._consumir(agora)
+
+    def registrar_sucesso(self):
+        """Sucesso: fecha o circuito e aumenta a taxa (aumento aditivo)"""
+        with self._lock:
+            self._estado[_FALHAS] = 0
+            self._estado[_RPM_ATUAL] = min(float(self.rpm), self._estado[_RPM_ATUAL] + AUMENTO_RPM_SUCESSO)
+
+    def registrar_falha(self, classe, atraso=None):
+        """
+        Falha de uma chamada. Para 'limite', reduz a taxa à metade e pausa
+        todas as requisições por `atraso` segundos (ou backoff com jitter
+        pelo número de falhas seguidas). 'limite' e 'temporario' contam para
+        abrir o circuito; 'resposta' e 'permanente' não indicam sobrecarga.
+        """
+        if classe not in ('limite', 'temporario'):
+            return
+        with self._lock:
+            agora = time.monotonic()
+            self._repor(agora)
+            self._estado[_FALHAS] += 1
+            falhas = int(self._estado[_FALHAS])
+
+            if classe == 'limite':
+                self._estado[_RPM_ATUAL] = max(self.rpm_minimo, self._estado[_RPM_ATUAL] * FATOR_REDUCAO_RPM)
+                pausa = atraso if atraso is not None else backoff_com_jitter(PAUSA_BASE_LIMITE, falhas - 1)
+                self._estado[_PAUSA_ATE] = max(self._estado[_PAUSA_ATE], agora + pausa)
+                # Sem rajada ao fim da pausa
+                self._estado[_TOKENS] = min(self._estado[_TOKENS], 0.0)
+
+            if falhas >= LIMIAR_FALHAS_CIRCUITO and self._estado[_CIRCUITO_ATE] <= agora:
+                self._estado[_CIRCUITO_ATE] = agora + PAUSA_CIRCUITO
+                self._estado[_ABERTURAS] += 1
+
+    def circuito_aberto(self):
+        with self._lock:
+            return self._estado[_CIRCUITO_ATE] > time.monotonic()
+
+    def situacao(self):
+        with self._lock:
+            return {
+                'rpm': self.rpm,
+                'rpm_atual': round(self._estado[_RPM_ATUAL], 2),
+                'falhas_seguidas': int(self._estado[_FALHAS]),
+                'aberturas_circuito': int(self._estado[_ABERTURAS]),
+            }
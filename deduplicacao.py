@@ -0,0 +1,216 @@
+# deduplicacao.py
+"""
+Deduplicação de telas repetidas e de chunks quase idênticos.
+
+Os manuais do Petrvs repetem as mesmas capturas de tela em várias páginas
+e em vários documentos. Duas etapas evitam pagar o Vision e gerar vetores
+para o mesmo conteúdo:
+
+- IndiceTelas: hash perceptual (dHash) da captura de tela embutida na
+  página (não da página inteira: cabeçalho, texto e rodapé iguais
+  aproximariam telas diferentes). Uma captura a até LIMIAR_HAMMING_TELA
+  bits de outra já analisada é candidata; só reaproveita a análise se a
+  miniatura também for igual bloco a bloco (diferenca_local até
+  LIMIAR_DIFERENCA_LOCAL), o que separa telas com o mesmo layout e campos
+  diferentes. O índice pode ser compartilhado entre os processos do modo
+  lote (armazenamento de um multiprocessing.Manager).
+- colapsar_chunks_duplicados: MinHash do chunk_text com LSH por bandas;
+  chunks com similaridade de Jaccard estimada acima do limiar viram um
+  só registro, que guarda as páginas de origem de todos.
+"""
+import hashlib
+import re
+import threading
+
+import numpy as np
+from PIL import Image
+
+DHASH_LADO = 16  # dHash de 16x16 = 256 bits
+# Validado nos manuais: a mesma tela recapturada fica a 3-4 bits, capturas
+# diferentes a 28 ou mais; telas com o mesmo layout e campos diferentes
+# ficam a 1-3 bits e são separadas pela diferença local
+LIMIAR_HAMMING_TELA = 6  # Bits diferentes (de 256) para considerar candidata
+MINIATURA_LADO = 128  # Miniatura em tons de cinza usada na verificação
+MINIATURA_BLOCO = 8  # Blocos (px) comparados na verificação
+# Maior diferença média de um bloco (0-1): recapturas ~0.005, um campo a
+# mais ou a menos na mesma tela ~0.07
+LIMIAR_DIFERENCA_LOCAL = 0.03
+MINHASH_PERMUTACOES = 64
+MINHASH_BANDAS = 16  # 16 bandas de 4 linhas
+MINHASH_SHINGLE = 5  # Palavras por shingle
+LIMIAR_SIMILARIDADE_CHUNK = 0.9  # Jaccard estimado para colapsar dois chunks
+
+_PADRAO_PALAVRA = re.compile(r"\w+")
+_PRIMO_MINHASH = np.uint64(4294967311)  # Primo > 2^32: a*x + b cabe em 64 bits
+_gerador = np.random.default_rng(20250126)
+_COEF_A = _gerador.integers(1, 2 ** 32, size=MINHASH_PERMUTACOES, dtype=np.uint64)
+_COEF_B = _gerador.integers(0, 2 ** 32, size=MINHASH_PERMUTACOES, dtype=np.uint64)
+
+
+def dhash(imagem, lado=DHASH_LADO):
+    """
+    Hash perceptual por diferença (dHash) de uma imagem PIL: a imagem em
+    tons de cinza reduzida a (lado+1) x lado, comparando cada pixel com o
+    vizinho da direita. Retorna um inteiro de lado*lado bits.
+    """
+    reduzida = imagem.convert("L").resize((lado + 1, lado), Image.Resampling.BILINEAR)
+    pixels = reduzida.tobytes()
+    bits = 0
+    for linha in range(lado):
+        inicio = linha * (lado + 1)
+        for coluna in range(inicio, inicio + lado):
+            bits = (bits << 1) | (pixels[coluna] > pixels[coluna + 1])
+    return bits
+
+
+def distancia_hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def miniatura_tela(imagem, lado=MINIATURA_LADO):
+    """Miniatura lado x lado em tons de cinza (bytes), para diferenca_local"""
+    return imagem.convert("L").resize((lado, lado), Image.Resampling.BILINEAR).tobytes()
+
+
+def diferenca_local(a, b, lado=MINIATURA_LADO, bloco=MINIATURA_BLOCO):
+    """
+    Maior diferença média (0-1) entre blocos correspondentes de duas
+    miniaturas: pequena com ruído de recaptura espalhado, grande quando
+    uma região muda (um campo, um botão, outro texto).
+    """
+    diferenca = np.abs(
+        np.frombuffer(a, dtype=np.uint8).astype(np.float32) - np.frombuffer(b, dtype=np.uint8)
+    ).reshape(lado, lado) / 255
+    n = lado // bloco
+    return float(diferenca[:n * bloco, :n * bloco].reshape(n, bloco, n, bloco).mean(axis=(1, 3)).max())
+
+
+class IndiceTelas:
+    """
+    Índice dos hashes perceptuais das imagens analisadas pelo Vision.
+
+    A busca usa o princípio da casa dos pombos: com o hash dividido em
+    limiar+1 blocos, dois hashes a até `limiar` bits de distância têm ao
+    menos um bloco idêntico, então só os hashes que compartilham um bloco
+    são comparados.
+
+    `armazenamento` (dict) e `lock` podem vir de um multiprocessing.Manager
+    para que todos os processos do lote usem o mesmo índice.
+    """
+
+    def __init__(self, limiar=LIMIAR_HAMMING_TELA, armazenamento=None, lock=None, bits=DHASH_LADO ** 2):
+        self.limiar = limiar
+        self.bits = bits
+        self.n_blocos = limiar + 1
+        self._tamanho_bloco = -(-bits // self.n_blocos)
+        self._dados = {} if armazenamento is None else armazenamento
+        self._lock = lock or threading.Lock()
+
+    def _blocos(self, valor):
+        mascara = (1 << self._tamanho_bloco) - 1
+        return [f"b{i}:{(valor >> (i * self._tamanho_bloco)) & mascara:x}" for i in range(self.n_blocos)]
+
+    def buscar(self, valor, miniatura):
+        """
+        Entrada da tela mais próxima a até `limiar` bits cuja miniatura
+        também confere (diferenca_local até LIMIAR_DIFERENCA_LOCAL), ou None
+        """
+        with self._lock:
+            candidatos = set()
+            for bloco in self._blocos(valor):
+                candidatos.update(self._dados.get(bloco, ()))
+            proximos = sorted(
+                (distancia_hamming(int(candidato, 16), valor), candidato) for candidato in candidatos
+            )
+            for distancia, candidato in proximos:
+                if distancia > self.limiar:
+                    break
+                entrada = self._dados.get(f"h:{candidato}")
+                if diferenca_local(entrada['miniatura'], miniatura) <= LIMIAR_DIFERENCA_LOCAL:
+                    return entrada
+            return None
+
+    def adicionar(self, valor, entrada):
+        """Registra a entrada (análise, origem e 'miniatura' de miniatura_tela) de uma tela"""
+        chave = f"{valor:x}"
+        with self._lock:
+            if f"h:{chave}" in self._dados:
+                return
+            self._dados[f"h:{chave}"] = entrada
+            for bloco in self._blocos(valor):
+                self._dados[bloco] = list(self._dados.get(bloco, ())) + [chave]
+
+
+def assinatura_minhash(texto):
+    """Assinatura MinHash dos shingles de palavras do texto (None se não houver palavras)"""
+    palavras = _PADRAO_PALAVRA.findall(texto.lower())
+    if not palavras:
+        return None
+    tamanho = min(MINHASH_SHINGLE, len(palavras))
+    shingles = {" ".join(palavras[i:i + tamanho]) for i in range(len(palavras) - tamanho + 1)}
+    valores = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little') for s in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    return ((_COEF_A[:, None] * valores[None, :] + _COEF_B[:, None]) % _PRIMO_MINHASH).min(axis=1)
+
+
+def _origem(doc):
+    return f"{doc['source_file']}:{doc['pagina']}"
+
+
+def colapsar_chunks_duplicados(registros, limiar=LIMIAR_SIMILARIDADE_CHUNK):
+    """
+    Colapsa os registros cujo chunk_text é quase idêntico ao de outro.
+
+    Fica o primeiro registro de cada grupo (na ordem original), o
+    representante; um registro só entra no grupo se a similaridade com o
+    representante atingir o limiar (sem encadear: A~B e B~C não juntam
+    A e C abaixo do limiar). O representante fica com
+    `paginas_origem` ("arquivo.pdf:página" de todos os membros) e
+    `ids_colapsados` (IDs dos registros absorvidos). Listas de strings,
+    para caber nos metadados do Pinecone.
+
+    Retorna: (registros resultantes, número de registros colapsados)
+    """
+    assinaturas = [assinatura_minhash(doc['chunk_text']) for doc in registros]
+    linhas = MINHASH_PERMUTACOES // MINHASH_BANDAS
+
+    # Candidatos: registros que coincidem em alguma banda
+    baldes = {}
+    for indice, assinatura in enumerate(assinaturas):
+        if assinatura is None:
+            continue
+        for banda in range(MINHASH_BANDAS):
+            chave = (banda, assinatura[banda * linhas:(banda + 1) * linhas].tobytes())
+            baldes.setdefault(chave, []).append(indice)
+
+    candidatos = {}
+    for membros in baldes.values():
+        for i in membros:
+            candidatos.setdefault(i, set()).update(membros)
+
+    # Cada registro ainda livre vira representante e absorve os candidatos
+    # posteriores, livres e similares a ele
+    grupos = {}
+    absorvidos = set()
+    for i in range(len(registros)):
+        if i in absorvidos:
+            continue
+        grupos[i] = [i]
+        for j in sorted(candidatos.get(i, ())):
+            if j > i and j not in absorvidos and np.mean(assinaturas[i] == assinaturas[j]) >= limiar:
+                grupos[i].append(j)
+                absorvidos.add(j)
+
+    saida = []
+    for indice, doc in enumerate(registros):
+        grupo = grupos.get(indice)
+        if grupo is None:
+            continue  # absorvido por um registro anterior
+        if len(grupo) > 1:
+            doc = dict(doc)
+            doc['paginas_origem'] = [_origem(registros[i]) for i in grupo]
+            doc['ids_colapsados'] = [registros[i]['id'] for i in grupo[1:]]
+        saida.append(doc)
+    return saida, len(registros) - len(saida)
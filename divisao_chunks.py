@@ -0,0 +1,218 @@
+# divisao_chunks.py
+"""
+Divisão e junção dos registros por página em chunks com orçamento de tokens.
+
+Cada registro gerado por processar_pdf_completo.py corresponde a uma página.
+Esta etapa, aplicada após a extração:
+- divide páginas longas em fronteiras estruturais (Art., §, CAPÍTULO,
+  Seção, passos numerados), com sobreposição entre as partes
+  (ids ..._pagina_012_parte_01, ..._parte_02, ...)
+- junta páginas curtas consecutivas do mesmo chunk_type até o orçamento
+  (id ..._paginas_012_014)
+
+Todo registro de saída tem `pagina` (primeira página, inteiro, como antes)
+e o intervalo `pagina_inicial`/`pagina_final`; task_title e chunk_type são
+mantidos. Os tokens são estimados (~4 caracteres por token), sem depender
+do tokenizador do modelo de embedding.
+"""
+import os
+import re
+
+CHUNK_MAX_TOKENS = 512  # Orçamento máximo por chunk
+CHUNK_MIN_TOKENS = 120  # Abaixo disso a página é candidata à junção
+CHUNK_SOBREPOSICAO_TOKENS = 48  # Cauda da parte anterior repetida na seguinte
+CARACTERES_POR_TOKEN = 4
+
+# Início de linha com marcador estrutural (divisão antes do marcador)
+_PADRAO_FRONTEIRA = re.compile(
+    r"^[ \t]*(?=(?:Art\.\s*\d|§\s*\d|Parágrafo único|CAP[ÍI]TULO\b|Cap[íi]tulo\s|"
+    r"SE[ÇC][ÃA]O\b|Seção\s|Passo\s+\d|\d{1,2}[.)]\s))",
+    re.MULTILINE,
+)
+_PADRAO_SENTENCA = re.compile(r"(?<=[.;:!?])\s+")
+
+
+def estimar_tokens(texto):
+    """Estimativa do número de tokens de um texto"""
+    return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+
+def caminho_paginas(output_json):
+    """Arquivo com os registros por página (antes da divisão em chunks)"""
+    return os.path.splitext(output_json)[0] + ".paginas.jsonl"
+
+
+def segmentos_estruturais(texto):
+    """Divide o texto antes de cada marcador estrutural (sem perder caracteres)"""
+    inicios = sorted({0, *(m.start() for m in _PADRAO_FRONTEIRA.finditer(texto))})
+    inicios.append(len(texto))
+    return [texto[a:b] for a, b in zip(inicios, inicios[1:]) if texto[a:b].strip()]
+
+
+def _dividir_segmento_longo(segmento, max_tokens):
+    """Divide um segmento maior que o orçamento por sentenças (e, se preciso, palavras)"""
+    max_caracteres = max_tokens * CARACTERES_POR_TOKEN
+    pedacos = []
+    for sentenca in _PADRAO_SENTENCA.split(segmento):
+        if len(sentenca) <= max_caracteres:
+            pedacos.append(sentenca + " ")
+            continue
+        atual = ""
+        for palavra in sentenca.split():
+            if atual and len(atual) + len(palavra) + 1 > max_caracteres:
+                pedacos.append(atual)
+                atual = ""
+            atual += palavra + " "
+        if atual:
+            pedacos.append(atual)
+
+    unidades = []
+    atual = ""
+    for pedaco in pedacos:
+        if atual and estimar_tokens(atual + pedaco) > max_tokens:
+            unidades.append(atual)
+            atual = ""
+        atual += pedaco
+    if atual.strip():
+        unidades.append(atual)
+    return unidades
+
+
+def _cauda(texto, tokens):
+    """Últimas palavras do texto, até `tokens` tokens estimados"""
+    if tokens <= 0:
+        return ""
+    palavras = texto.split()
+    cauda = []
+    for palavra in reversed(palavras):
+        if estimar_tokens(" ".join([palavra] + cauda)) > tokens:
+            break
+        cauda.insert(0, palavra)
+    return " ".join(cauda)
+
+
+def dividir_texto(texto, max_tokens=CHUNK_MAX_TOKENS, sobreposicao=CHUNK_SOBREPOSICAO_TOKENS):
+    """
+    Divide um texto em partes de até `max_tokens`, preferindo as fronteiras
+    estruturais; cada parte (exceto a primeira) começa com a cauda da anterior.
+    """
+    unidades = []
+    for segmento in segmentos_estruturais(texto):
+        if estimar_tokens(segmento) <= max_tokens:
+            unidades.append(segmento)
+        else:
+            unidades.extend(_dividir_segmento_longo(segmento, max_tokens))
+
+    partes = []
+    atual = ""
+    for unidade in unidades:
+        if atual.strip() and estimar_tokens(atual + unidade) > max_tokens:
+            partes.append(atual.strip())
+            cauda = _cauda(atual, sobreposicao)
+            atual = cauda + "\n" if cauda and estimar_tokens(cauda + unidade) <= max_tokens else ""
+        atual += unidade
+    if atual.strip():
+        partes.append(atual.strip())
+    return partes
+
+
+def _com_intervalo(doc, inicio, fim):
+    doc['pagina'] = inicio
+    doc['pagina_inicial'] = inicio
+    doc['pagina_final'] = fim
+    return doc
+
+
+def _partes_pagina(doc, partes):
+    """Registros das partes de uma página dividida"""
+    registros = []
+    for numero, texto in enumerate(partes, 1):
+        parte = dict(doc)
+        parte.update({
+            'id': f"{doc['id']}_parte_{numero:02d}",
+            'chunk_text': texto,
+            'num_palavras': len(texto.split()),
+            'parte': numero,
+            'total_partes': len(partes),
+        })
+        registros.append(_com_intervalo(parte, doc['pagina'], doc['pagina']))
+    return registros
+
+
+def _juntar_paginas(grupo):
+    """Registro único para um grupo de páginas consecutivas"""
+    primeiro = grupo[0]
+    if len(grupo) == 1:
+        return _com_intervalo(dict(primeiro), primeiro['pagina'], primeiro['pagina'])
+
+    inicio, fim = primeiro['pagina'], grupo[-1]['pagina']
+    prefixo = primeiro['id'].rsplit('_pagina_', 1)[0]
+    chunk_text = "\n\n".join(doc['chunk_text'] for doc in grupo)
+
+    junto = dict(primeiro)
+    junto.update({
+        'id': f"{prefixo}_paginas_{inicio:03d}_{fim:03d}",
+        'chunk_text': chunk_text,
+        'num_palavras': len(chunk_text.split()),
+        'tem_texto': any(doc.get('tem_texto') for doc in grupo),
+        'tem_instrucoes_navegacao': any(doc.get('tem_instrucoes_navegacao') for doc in grupo),
+    })
+    if any('num_elementos' in doc for doc in grupo):
+        junto['num_elementos'] = sum(doc.get('num_elementos', 0) for doc in grupo)
+    # Basta uma página pendente para o chunk ser refeito
+    if any(doc.get('vision_pendente') for doc in grupo):
+        junto['vision_pendente'] = True
+    return _com_intervalo(junto, inicio, fim)
+
+
+def chunkear_registros(registros, max_tokens=CHUNK_MAX_TOKENS, min_tokens=CHUNK_MIN_TOKENS,
+                       sobreposicao=CHUNK_SOBREPOSICAO_TOKENS):
+    """
+    Aplica a divisão e a junção aos registros por página (em ordem de página).
+
+    Uma página é juntada à anterior se ambas forem consecutivas, do mesmo
+    arquivo e chunk_type, uma delas tiver menos de `min_tokens` e o total
+    couber em `max_tokens`. Páginas com análise reaproveitada de outra tela
+    (tela_repetida_de) não são juntadas. Páginas acima de `max_tokens` são
+    divididas.
+
+    Retorna: lista de registros prontos para envio
+    """
+    saida = []
+    grupo = []
+    tokens_grupo = 0
+
+    def fechar_grupo():
+        nonlocal grupo, tokens_grupo
+        if grupo:
+            saida.append(_juntar_paginas(grupo))
+        grupo = []
+        tokens_grupo = 0
+
+    for doc in registros:
+        tokens = estimar_tokens(doc['chunk_text'])
+
+        if tokens > max_tokens:
+            fechar_grupo()
+            saida.extend(_partes_pagina(doc, dividir_texto(doc['chunk_text'], max_tokens, sobreposicao)))
+            continue
+
+        if grupo:
+            ultimo = grupo[-1]
+            pode_juntar = (
+                doc['pagina'] == ultimo['pagina'] + 1
+                and doc['source_file'] == ultimo['source_file']
+                and doc['chunk_type'] == ultimo['chunk_type']
+                and not doc.get('tela_repetida_de') and not ultimo.get('tela_repetida_de')
+                and (tokens < min_tokens or tokens_grupo < min_tokens)
+                # "\n\n" entre páginas
+                and tokens_grupo + tokens + 1 <= max_tokens
+            )
+            if not pode_juntar:
+                fechar_grupo()
+
+        grupo.append(doc)
+        tokens_grupo += tokens + (1 if len(grupo) > 1 else 0)
+
+    fechar_grupo()
+    return saida
@@ -0,0 +1,101 @@
+# embeddings.py
+"""
+Embedders usados na busca local (busca_local.py).
+
+Todos seguem a mesma interface:
+- nome: identificador do modelo (gravado no índice)
+- dimensao: tamanho dos vetores
+- embed_documentos(textos) -> np.ndarray (N x dimensao, float32, normalizado)
+- embed_consulta(texto) -> np.ndarray (dimensao,)
+
+EmbedderHash não depende de rede nem de modelo (hashing de tokens), e serve
+para CI e benchmarks; EmbedderGemini usa a API de embeddings do Gemini.
+"""
+import re
+import zlib
+
+import numpy as np
+
+import config
+
+MODELO_EMBEDDING_GEMINI = "models/text-embedding-004"
+DIMENSAO_HASH = 512
+
+_PADRAO_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def normalizar(vetores):
+    """Normaliza (L2) cada linha, para que o produto interno seja o cosseno"""
+    vetores = np.asarray(vetores, dtype=np.float32)
+    normas = np.linalg.norm(vetores, axis=-1, keepdims=True)
+    return vetores / np.maximum(normas, 1e-12)
+
+
+class EmbedderHash:
+    """
+    Embedding determinístico por hashing de unigramas e bigramas.
+
+    Não captura semântica como um modelo treinado, mas recupera bem por
+    sobreposição de termos e é reprodutível entre execuções e máquinas.
+    """
+
+    def __init__(self, dimensao=DIMENSAO_HASH):
+        self.dimensao = dimensao
+        self.nome = f"hash-{dimensao}"
+
+    def _vetor(self, texto):
+        vetor = np.zeros(self.dimensao, dtype=np.float32)
+        tokens = _PADRAO_TOKEN.findall(texto.lower())
+        termos = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for termo in termos:
+            h = zlib.crc32(termo.encode('utf-8'))
+            # O bit mais alto define o sinal (reduz o viés das colisões)
+            vetor[h % self.dimensao] += 1.0 if h & 0x80000000 else -1.0
+        return vetor
+
+    def embed_documentos(self, textos):
+        return normalizar([self._vetor(t) for t in textos])
+
+    def embed_consulta(self, texto):
+        return self.embed_documentos([texto])[0]
+
+
+class EmbedderGemini:
+    """Embeddings da API do Gemini (text-embedding-004, 768 dimensões)"""
+
+    def __init__(self, modelo=MODELO_EMBEDDING_GEMINI):
+        import google.generativeai as genai
+
+        genai.configure(api_key=config.GEMINI_API_KEY)
+        self._genai = genai
+        self.nome = modelo
+        self.dimensao = 768
+
+    def embed_documentos(self, textos):
+        resposta = self._genai.embed_content(
+            model=self.nome, content=list(textos), task_type="retrieval_document"
+        )
+        return normalizar(resposta['embedding'])
+
+    def embed_consulta(self, texto):
+        resposta = self._genai.embed_content(
+            model=self.nome, content=texto, task_type="retrieval_query"
+        )
+        return normalizar([resposta['embedding']])[0]
+
+
+EMBEDDERS = {
+    'hash': EmbedderHash,
+    'gemini': EmbedderGemini,
+}
+
+
+def criar_embedder(nome):
+    """Cria um embedder pelo nome curto ('hash' ou 'gemini') ou nome do modelo"""
+    if nome in EMBEDDERS:
+        return EMBEDDERS[nome]()
+    if nome.startswith("hash-"):
+        return EmbedderHash(int(nome.split("-", 1)[1]))
+    if nome.startswith("models/"):
+        return EmbedderGemini(nome)
+    raise ValueError(f"Embedder desconhecido: {nome}")
@@ -0,0 +1,255 @@
+# formato_saida.py
+"""
+Leitura e escrita dos registros processados.
+
+Três formatos são suportados, escolhidos pela extensão do arquivo:
+- .json: lista JSON única (indent=2), gravada ao final do processamento
+- .jsonl: um registro por linha, gravado e descarregado (flush) assim que
+  cada página é montada; permite retomar a extração e ler o arquivo como
+  stream, com memória constante
+- .parquet: colunar (pacote opcional pyarrow), gravado ao final do
+  processamento; cada campo é uma coluna, então ler só os metadados
+  (id, source_file, pagina, num_palavras...) não decodifica o chunk_text,
+  e os filtros usam as estatísticas dos grupos de linhas para pular o
+  que não interessa
+
+ler_registros() aceita projeção (colunas) e filtros em todos os formatos;
+no JSON/JSONL eles são aplicados depois de ler cada registro.
+converter_registros() (ou `python formato_saida.py converter`) exporta de
+um formato para outro, por exemplo do Parquet para JSON.
+
+Uso:
+    python formato_saida.py converter <origem> <destino>
+"""
+import json
+import operator
+import os
+import sys
+
+TAMANHO_GRUPO_PARQUET = 1024  # Registros por grupo de linhas (unidade de leitura e de filtro)
+COMPRESSAO_PARQUET = "zstd"
+METADADO_COLUNAS_JSON = b"colunas_json"  # Metadado do esquema com as colunas gravadas como texto JSON
+
+_OPERADORES = {
+    '==': operator.eq, '=': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    'in': lambda valor, opcoes: valor in opcoes,
+    'not in': lambda valor, opcoes: valor not in opcoes,
+}
+
+
+def eh_jsonl(caminho):
+    """True se o caminho usa o formato JSONL (um registro por linha)"""
+    return caminho.lower().endswith('.jsonl')
+
+
+def eh_parquet(caminho):
+    """True se o caminho usa o formato Parquet (colunar)"""
+    return caminho.lower().endswith('.parquet')
+
+
+def nome_formato(caminho):
+    """Nome do formato do arquivo, para mensagens"""
+    if eh_parquet(caminho):
+        return "Parquet"
+    return "JSONL" if eh_jsonl(caminho) else "JSON"
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("O formato Parquet requer o pacote pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _atende(doc, filtros):
+    """True se o registro satisfaz todos os filtros (campo, operador, valor)"""
+    for campo, operador, valor in filtros:
+        if operador not in _OPERADORES:
+            raise ValueError(f"Operador de filtro desconhecido: {operador}")
+        if campo not in doc or not _OPERADORES[operador](doc[campo], valor):
+            return False
+    return True
+
+
+def _ler_parquet(caminho, colunas=None, filtros=None):
+    """
+    Registros de um arquivo Parquet, um grupo de linhas por vez. Campos
+    nulos (ausentes no registro original) são omitidos e as colunas
+    gravadas como texto JSON voltam a ser objetos.
+    """
+    pa = _pyarrow()
+    dataset = pa.dataset.dataset(caminho, format="parquet")
+    metadados = dataset.schema.metadata or {}
+    colunas_json = set(json.loads(metadados.get(METADADO_COLUNAS_JSON, b"[]")))
+    if colunas is not None:
+        colunas = [c for c in colunas if c in dataset.schema.names]
+    expressao = None
+    if filtros:
+        # Como no JSON, filtrar por um campo que nenhum registro tem não retorna nada
+        if any(campo not in dataset.schema.names for campo, _, _ in filtros):
+            return
+        filtros = [(campo, '==' if op == '=' else op, list(valor) if op in ('in', 'not in') else valor)
+                   for campo, op, valor in filtros]
+        expressao = pa.parquet.filters_to_expression(filtros)
+    for lote in dataset.to_batches(columns=colunas, filter=expressao):
+        for linha in lote.to_pylist():
+            yield {campo: json.loads(valor) if campo in colunas_json else valor
+                   for campo, valor in linha.items() if valor is not None}
+
+
+def ler_registros(caminho, colunas=None, filtros=None):
+    """
+    Itera sobre os registros de um arquivo .json, .jsonl ou .parquet.
+
+    No JSONL a leitura é linha a linha (memória constante); uma última
+    linha incompleta (processamento interrompido) é ignorada. No Parquet
+    a leitura é por grupo de linhas e só as colunas pedidas são lidas.
+
+    Args:
+        colunas: Campos de cada registro (None: todos)
+        filtros: Lista de (campo, operador, valor), todos obrigatórios;
+            operadores: ==, !=, <, <=, >, >=, in, not in
+            (ex.: [('source_file', '==', 'decreto.pdf'), ('pagina', '<=', 10)])
+    """
+    if eh_parquet(caminho):
+        yield from _ler_parquet(caminho, colunas, filtros)
+        return
+
+    if filtros:
+        # Conjunto montado uma vez: busca O(1) por registro em 'in'/'not in'
+        filtros = [(campo, op, frozenset(valor) if op in ('in', 'not in') else valor)
+                   for campo, op, valor in filtros]
+    for doc in _ler_json(caminho):
+        if filtros and not _atende(doc, filtros):
+            continue
+        yield doc if colunas is None else {c: doc[c] for c in colunas if c in doc}
+
+
+def _ler_json(caminho):
+    if not eh_jsonl(caminho):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            try:
+                yield json.loads(linha)
+            except json.JSONDecodeError:
+                if linha.endswith('\n'):
+                    raise
+                # Linha final truncada por uma interrupção
+                return
+
+
+class EscritorJSONL:
+    """
+    Escreve registros em JSONL, um por linha, com flush a cada registro.
+
+    Com retomar=True, mantém os registros completos já gravados (descarta
+    uma eventual linha final truncada) e continua escrevendo no fim do
+    arquivo; os registros existentes ficam em `registros_existentes`.
+    """
+
+    def __init__(self, caminho, retomar=False):
+        self.caminho = caminho
+        self.registros_existentes = []
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+
+        if retomar and os.path.exists(caminho):
+            self.registros_existentes = list(ler_registros(caminho))
+            self._truncar_linha_incompleta()
+            self._arquivo = open(caminho, 'a', encoding='utf-8')
+        else:
+            self._arquivo = open(caminho, 'w', encoding='utf-8')
+
+    def _truncar_linha_incompleta(self):
+        """Remove bytes após a última quebra de linha (registro incompleto)"""
+        with open(self.caminho, 'rb+') as f:
+            conteudo = f.read()
+            fim = conteudo.rfind(b'\n') + 1
+            if fim < len(conteudo):
+                f.truncate(fim)
+
+    @property
+    def ultima_pagina(self):
+        """Última página já gravada (0 se nenhuma)"""
+        return max((doc['pagina'] for doc in self.registros_existentes), default=0)
+
+    def escrever(self, doc):
+        self._arquivo.write(json.dumps(doc, ensure_ascii=False) + '\n')
+        self._arquivo.flush()
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+def _aninhado(valor):
+    """True para objetos e listas que contêm objetos ou listas"""
+    return isinstance(valor, dict) or (
+        isinstance(valor, list) and any(isinstance(item, (dict, list)) for item in valor)
+    )
+
+
+def _salvar_parquet(caminho, documentos):
+    """
+    Uma coluna por campo (a união dos campos de todos os registros; nulo
+    onde o registro não tem o campo), com o chunk_text por último, em
+    grupos de TAMANHO_GRUPO_PARQUET registros.
+
+    Campos com objetos aninhados são gravados como texto JSON (listados no
+    metadado METADADO_COLUNAS_JSON): como struct, o Parquet uniria as
+    chaves de todos os registros e a leitura traria chaves nulas a mais.
+    """
+    pa = _pyarrow()
+    campos = list(dict.fromkeys(campo for doc in documentos for campo in doc))
+    if 'chunk_text' in campos:
+        campos.remove('chunk_text')
+        campos.append('chunk_text')
+    colunas_json = [campo for campo in campos if any(_aninhado(doc.get(campo)) for doc in documentos)]
+    colunas = {}
+    for campo in campos:
+        valores = [doc.get(campo) for doc in documentos]
+        if campo in colunas_json:
+            valores = [None if valor is None else json.dumps(valor, ensure_ascii=False) for valor in valores]
+        colunas[campo] = valores
+    tabela = pa.table(colunas)
+    if colunas_json:
+        tabela = tabela.replace_schema_metadata({METADADO_COLUNAS_JSON: json.dumps(colunas_json)})
+    pa.parquet.write_table(tabela, caminho, row_group_size=TAMANHO_GRUPO_PARQUET,
+                           compression=COMPRESSAO_PARQUET)
+
+
+def salvar_registros(caminho, documentos):
+    """Grava a lista completa de registros (.json com indent=2, .jsonl ou .parquet)"""
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    if eh_parquet(caminho):
+        _salvar_parquet(caminho, list(documentos))
+        return
+    with open(caminho, 'w', encoding='utf-8') as f:
+        if eh_jsonl(caminho):
+            for doc in documentos:
+                f.write(json.dumps(doc, ensure_ascii=False) + '\n')
+        else:
+            json.dump(list(documentos), f, ensure_ascii=False, indent=2)
+
+
+def converter_registros(origem, destino):
+    """Grava os registros de `origem` em `destino`, no formato da extensão de cada um"""
+    documentos = list(ler_registros(origem))
+    salvar_registros(destino, documentos)
+    return len(documentos)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'converter':
+        print(__doc__)
+        sys.exit(1)
+    total = converter_registros(sys.argv[2], sys.argv[3])
+    print(f"✅ {total} registro(s): {sys.argv[2]} → {sys.argv[3]} ({nome_formato(sys.argv[3])})")
@@ -0,0 +1,442 @@
+# job_vision.py
+"""
+Modo job do Vision: envia todas as páginas de uma vez e coleta depois.
+
+Na reconstrução do corpus a latência não importa, mas processar_pdf_completo()
+paga ida e volta e limite de requisições página a página. Aqui o trabalho
+é dividido em duas fases:
+
+1. enviar: extrai as páginas e aplica a heurística (e o classificador
+   local) como o pipeline; as páginas roteadas ao Vision viram requisições
+   de um arquivo JSONL (prompt e imagem, no formato do batch do Gemini),
+   submetido a um backend de job. Páginas ambíguas levam a confirmação
+   (Vision Flash) e a análise completa no mesmo job, para não precisar de
+   uma segunda rodada.
+2. coletar: consulta o job (ou aguarda), grava os resultados no cache
+   Vision com as mesmas chaves que o pipeline calcula e roda
+   processar_pdf_completo(), que monta os registros a partir do cache.
+   Requisições que falharam no job caem no Vision interativo.
+
+Backends (mesma interface: submeter, situacao, baixar_resultados):
+- local: diretório em disco; com um `modelo` (ex.: o Gemini simulado de
+  benchmark.py) executa as requisições ao consultar a situação, sem ele
+  espera um resultados.jsonl colocado no diretório do job
+- gemini: Batch API do Gemini (pacote opcional google-genai)
+
+Uso:
+    python job_vision.py enviar <pdf_diretorio_ou_glob> <diretorio_job>
+                         [--backend local|gemini] [--recortar-telas]
+                         [--deteccao-lote K] [--sem-classificador]
+                         [--parametros-heuristica ARQ]
+    python job_vision.py coletar <diretorio_job> <diretorio_saida>
+                         [--aguardar] [--intervalo S] [--jsonl | --parquet]
+                         [--chunking] [--max-tokens N] [--deduplicar]
+"""
+import base64
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+
+import fitz  # PyMuPDF
+
+import config
+import processar_pdf_completo as pipeline
+from cache_vision import CacheVision, CACHE_VISION_DIR
+from classificador_telas import ClassificadorTelas, extrair_caracteristicas, MODELO_CLASSIFICADOR_TELAS
+from reparo_json import interpretar_json
+
+# --- CONFIGURAÇÕES ---
+ARQUIVO_JOB = "job.json"
+ARQUIVO_REQUISICOES = "requisicoes.jsonl"
+ARQUIVO_RESULTADOS = "resultados.jsonl"
+INTERVALO_CONSULTA_JOB = 60  # Segundos entre consultas com --aguardar
+BACKEND_JOB_PADRAO = "local"
+DIRETORIO_JOBS_LOCAL = "jobs_vision_local"  # Diretório do backend local
+
+
+def _esquema_api(esquema):
+    """Esquema de resposta com os tipos no formato da API REST ("OBJECT", "STRING"...)"""
+    if isinstance(esquema, dict):
+        return {
+            chave: valor.upper() if chave == 'type' else _esquema_api(valor)
+            for chave, valor in esquema.items()
+        }
+    if isinstance(esquema, list):
+        return [_esquema_api(valor) for valor in esquema]
+    return esquema
+
+
+def montar_requisicao(chave, partes, configuracao=None):
+    """
+    Linha do arquivo do job (formato do batch do Gemini): as partes de texto
+    e as imagens (inline_data em base64) da requisição, identificadas pela
+    chave do cache Vision.
+    """
+    conteudo = []
+    for parte in partes:
+        if isinstance(parte, dict):
+            conteudo.append({'inline_data': {
+                'mime_type': parte['mime_type'],
+                'data': base64.b64encode(parte['data']).decode('ascii'),
+            }})
+        else:
+            conteudo.append({'text': parte})
+    requisicao = {'contents': [{'role': 'user', 'parts': conteudo}]}
+    if configuracao:
+        requisicao['generation_config'] = {
+            'response_mime_type': configuracao['response_mime_type'],
+            'response_schema': _esquema_api(configuracao['response_schema']),
+        }
+    return {'key': chave, 'request': requisicao}
+
+
+def texto_resultado(linha):
+    """Texto da resposta de uma linha de resultados (None se a requisição falhou)"""
+    try:
+        partes = linha['response']['candidates'][0]['content']['parts']
+    except (KeyError, IndexError, TypeError):
+        return None
+    return "".join(parte.get('text', '') for parte in partes) or None
+
+
+class BackendJobLocal:
+    """
+    Backend em disco, para testes e execução sem a Batch API.
+
+    Cada job é um diretório <diretorio>/<id> com o requisicoes.jsonl
+    submetido. O job fica concluído quando existe o resultados.jsonl: se
+    houver `modelo` (qualquer objeto com generate_content), ele é gerado
+    na primeira consulta à situação.
+    """
+
+    nome = "local"
+
+    def __init__(self, diretorio=DIRETORIO_JOBS_LOCAL, modelo=None):
+        self.diretorio = diretorio
+        self.modelo = modelo
+
+    def _caminho(self, id_job, arquivo):
+        return os.path.join(self.diretorio, id_job, arquivo)
+
+    def submeter(self, arquivo_requisicoes, nome_exibicao):
+        id_job = f"{nome_exibicao}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.join(self.diretorio, id_job))
+        shutil.copyfile(arquivo_requisicoes, self._caminho(id_job, ARQUIVO_REQUISICOES))
+        return id_job
+
+    def _executar(self, id_job):
+        """Executa as requisições com o modelo e grava o resultados.jsonl"""
+        temporario = self._caminho(id_job, ARQUIVO_RESULTADOS + ".tmp")
+        with open(self._caminho(id_job, ARQUIVO_REQUISICOES), 'r', encoding='utf-8') as entrada, \
+                open(temporario, 'w', encoding='utf-8') as saida:
+            for linha in entrada:
+                requisicao = json.loads(linha)
+                partes = [
+                    {'mime_type': p['inline_data']['mime_type'],
+                     'data': base64.b64decode(p['inline_data']['data'])} if 'inline_data' in p else p['text']
+                    for p in requisicao['request']['contents'][0]['parts']
+                ]
+                resultado = {'key': requisicao['key']}
+                try:
+                    resposta = self.modelo.generate_content(
+                        partes, generation_config=requisicao['request'].get('generation_config')
+                    )
+                    resultado['response'] = {'candidates': [{'content': {'parts': [{'text': resposta.text}]}}]}
+                except Exception as e:
+                    resultado['error'] = {'message': str(e)[:200]}
+                saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        os.replace(temporario, self._caminho(id_job, ARQUIVO_RESULTADOS))
+
+    def situacao(self, id_job):
+        """'concluido', 'pendente' ou 'falhou'"""
+        if not os.path.exists(self._caminho(id_job, ARQUIVO_REQUISICOES)):
+            return 'falhou'
+        if not os.path.exists(self._caminho(id_job, ARQUIVO_RESULTADOS)) and self.modelo is not None:
+            self._executar(id_job)
+        return 'concluido' if os.path.exists(self._caminho(id_job, ARQUIVO_RESULTADOS)) else 'pendente'
+
+    def baixar_resultados(self, id_job, destino):
+        shutil.copyfile(self._caminho(id_job, ARQUIVO_RESULTADOS), destino)
+
+
+class BackendJobGemini:
+    """Batch API do Gemini (custo menor, sem o limite de requisições por minuto)"""
+
+    nome = "gemini"
+    _SITUACOES = {
+        'JOB_STATE_SUCCEEDED': 'concluido',
+        'JOB_STATE_FAILED': 'falhou',
+        'JOB_STATE_CANCELLED': 'falhou',
+        'JOB_STATE_EXPIRED': 'falhou',
+    }
+
+    def __init__(self, modelo=pipeline.MODELO_VISION):
+        try:
+            from google import genai
+        except ImportError as e:
+            raise ImportError("O backend 'gemini' requer o pacote google-genai (pip install google-genai)") from e
+
+        self._cliente = genai.Client(api_key=config.GEMINI_API_KEY)
+        self.modelo = modelo
+
+    def submeter(self, arquivo_requisicoes, nome_exibicao):
+        arquivo = self._cliente.files.upload(
+            file=arquivo_requisicoes, config={'display_name': nome_exibicao, 'mime_type': 'jsonl'},
+        )
+        job = self._cliente.batches.create(
+            model=self.modelo, src=arquivo.name, config={'display_name': nome_exibicao},
+        )
+        return job.name
+
+    def situacao(self, id_job):
+        job = self._cliente.batches.get(name=id_job)
+        return self._SITUACOES.get(job.state.name, 'pendente')
+
+    def baixar_resultados(self, id_job, destino):
+        job = self._cliente.batches.get(name=id_job)
+        conteudo = self._cliente.files.download(file=job.dest.file_name)
+        with open(destino, 'wb') as f:
+            f.write(conteudo)
+
+
+BACKENDS_JOB = {
+    'local': BackendJobLocal,
+    'gemini': BackendJobGemini,
+}
+
+
+def criar_backend(nome, **opcoes):
+    """Cria um backend de job pelo nome ('local' ou 'gemini')"""
+    if nome not in BACKENDS_JOB:
+        raise ValueError(f"Backend de job desconhecido: {nome}")
+    return BACKENDS_JOB[nome](**opcoes)
+
+
+def _requisicoes_documento(caminho_pdf, cache, recortar_telas, deteccao_lote, classificador_local,
+                           estatisticas, parametros):
+    """
+    Gera (chave, tipo, linha) das requisições Vision de um PDF, com o mesmo
+    roteamento e as mesmas imagens que processar_pdf_completo() usaria.
+    Requisições já presentes no cache não são geradas.
+    """
+    lado_deteccao = pipeline.LADO_MAX_MINIATURA_LOTE if deteccao_lote > 1 else pipeline.LADO_MAX_DETECCAO
+
+    with fitz.open(caminho_pdf) as documento:
+        dimensoes_imagens = pipeline.indexar_dimensoes_imagens(documento)
+        for num_pagina in range(len(documento)):
+            extraida = pipeline.extrair_pagina(documento, num_pagina, heuristica=True,
+                                               dimensoes_imagens=dimensoes_imagens,
+                                               pesos=parametros['pesos'])
+            tem_tela, confianca, _ = extraida['heuristica']
+            rota = pipeline.rotear_pagina(tem_tela, confianca, parametros)
+            if rota == 'texto':
+                continue
+            pagina = documento.load_page(num_pagina)
+
+            if rota == 'ambigua':
+                decisao_local = None
+                if classificador_local:
+                    miniatura = pipeline.preparar_imagem(
+                        pipeline.renderizar_pagina(pagina, pipeline.LADO_MAX_MINIATURA_LOTE)
+                    )
+                    decisao_local, _ = classificador_local.decidir(
+                        extrair_caracteristicas(miniatura['imagem'], confianca)
+                    )
+                if decisao_local is False:
+                    continue
+                if decisao_local is None:
+                    imagem = pipeline.preparar_imagem(pipeline.renderizar_pagina(pagina, lado_deteccao))
+                    chave = cache.chave(imagem['hash_pixels'], pipeline.PROMPT_DETECCAO_TELA,
+                                        pipeline.MODELO_VISION)
+                    if cache.obter(chave) is None:
+                        partes = [pipeline.PROMPT_DETECCAO_TELA, pipeline.obter_parte_imagem(imagem)]
+                        yield chave, 'deteccao', montar_requisicao(chave, partes)
+
+            estatisticas['paginas_vision'] += 1
+            imagem, _ = pipeline.preparar_imagem_analise(pagina, recortar_telas)
+            imagens, prompt, hash_pixels = pipeline.requisicao_analise(imagem)
+            chave = cache.chave(hash_pixels, prompt, pipeline.MODELO_VISION)
+            if cache.obter(chave) is None:
+                partes = pipeline.montar_partes_analise(imagens)
+                yield chave, 'analise', montar_requisicao(chave, partes, pipeline.CONFIG_GERACAO_VISION)
+
+
+def enviar_job(entrada, diretorio_job, backend=None, recortar_telas=False,
+               deteccao_lote=pipeline.DETECCAO_LOTE_TAMANHO, classificador=MODELO_CLASSIFICADOR_TELAS,
+               cache_dir=CACHE_VISION_DIR, parametros_heuristica=pipeline.ARQUIVO_PARAMETROS_HEURISTICA):
+    """
+    Fase 1: gera o arquivo de requisições dos PDFs e o submete ao backend.
+
+    Requisições repetidas (mesma imagem e prompt) e já presentes no cache
+    Vision não são enviadas. Grava <diretorio_job>/job.json com o
+    identificador do job e a configuração usada, que a fase 2 repete.
+
+    Retorna: dict do job (None se não houver PDFs)
+    """
+    backend = backend or criar_backend(BACKEND_JOB_PADRAO)
+    caminhos = pipeline.listar_pdfs(entrada) if os.path.isdir(entrada) or any(
+        c in entrada for c in '*?[') else [entrada]
+    if not caminhos:
+        print("❌ Nenhum PDF encontrado!")
+        return None
+
+    os.makedirs(diretorio_job, exist_ok=True)
+    cache = CacheVision(cache_dir)
+    classificador_local = ClassificadorTelas.carregar(classificador)
+    parametros = pipeline.carregar_parametros_heuristica(parametros_heuristica)
+    arquivo_requisicoes = os.path.join(diretorio_job, ARQUIVO_REQUISICOES)
+    estatisticas = {'paginas_vision': 0}
+    tipos = {}
+
+    print(f"📄 PDFs: {len(caminhos)} | Backend: {backend.nome}")
+    with open(arquivo_requisicoes, 'w', encoding='utf-8') as f:
+        for caminho_pdf in caminhos:
+            for chave, tipo, linha in _requisicoes_documento(
+                caminho_pdf, cache, recortar_telas, deteccao_lote, classificador_local, estatisticas,
+                parametros,
+            ):
+                if chave in tipos:
+                    continue
+                tipos[chave] = tipo
+                f.write(json.dumps(linha) + "\n")
+
+    job = {
+        'backend': backend.nome,
+        'id_job': None,
+        'criado_em': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'pdfs': [os.path.abspath(c) for c in caminhos],
+        'recortar_telas': recortar_telas,
+        'deteccao_lote': deteccao_lote,
+        'classificador': classificador,
+        'cache_dir': cache_dir,
+        'parametros_heuristica': parametros_heuristica,
+        'paginas_vision': estatisticas['paginas_vision'],
+        'requisicoes': tipos,
+    }
+    if tipos:
+        nome_exibicao = os.path.basename(os.path.normpath(diretorio_job))
+        job['id_job'] = backend.submeter(arquivo_requisicoes, nome_exibicao)
+
+    with open(os.path.join(diretorio_job, ARQUIVO_JOB), 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+
+    analises = sum(1 for t in tipos.values() if t == 'analise')
+    print(f"🖼️  Páginas roteadas ao Vision: {estatisticas['paginas_vision']}")
+    print(f"📦 Requisições no job: {len(tipos)} ({analises} análise(s), {len(tipos) - analises} confirmação(ões))")
+    print(f"🆔 Job: {job['id_job'] or 'nada a enviar (tudo em cache)'}")
+    return job
+
+
+def carregar_resultados(caminho, requisicoes, cache):
+    """
+    Grava no cache Vision os resultados do job, no formato que
+    processar_tela_com_retry() e confirmar_com_vision_flash() leem.
+
+    Retorna: (gravados, falhas)
+    """
+    gravados = falhas = 0
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            resultado = json.loads(linha)
+            tipo = requisicoes.get(resultado.get('key'))
+            texto = texto_resultado(resultado)
+            if tipo is None or texto is None:
+                falhas += 1
+                continue
+            if tipo == 'deteccao':
+                cache.salvar(resultado['key'], {'tem_tela': "SIM" in texto.strip().upper()})
+            else:
+                try:
+                    analise, _ = interpretar_json(texto)
+                except ValueError:
+                    analise = None
+                if not isinstance(analise, dict):
+                    falhas += 1
+                    continue
+                cache.salvar(resultado['key'], {'analise_vision': analise})
+            gravados += 1
+    return gravados, falhas
+
+
+def coletar_job(diretorio_job, diretorio_saida, backend=None, aguardar=False,
+                intervalo=INTERVALO_CONSULTA_JOB, extensao=".json", modelo=None, **opcoes):
+    """
+    Fase 2: obtém os resultados do job, grava-os no cache Vision e monta a
+    saída de cada PDF com processar_pdf_completo() (mesma configuração da
+    fase 1; `opcoes` repassa, por exemplo, chunking e deduplicar).
+
+    Retorna: lista de caminhos gerados (None se o job ainda não terminou)
+    """
+    with open(os.path.join(diretorio_job, ARQUIVO_JOB), 'r', encoding='utf-8') as f:
+        job = json.load(f)
+    backend = backend or criar_backend(job['backend'])
+    cache = CacheVision(job['cache_dir'])
+
+    if job['id_job']:
+        situacao = backend.situacao(job['id_job'])
+        while situacao == 'pendente' and aguardar:
+            print(f"⏳ Job {job['id_job']} em andamento, nova consulta em {intervalo}s...")
+            time.sleep(intervalo)
+            situacao = backend.situacao(job['id_job'])
+        if situacao == 'pendente':
+            print(f"⏳ Job {job['id_job']} ainda em andamento (use --aguardar)")
+            return None
+        if situacao == 'falhou':
+            print(f"⚠️  Job {job['id_job']} falhou: as páginas irão ao Vision interativo")
+        else:
+            arquivo_resultados = os.path.join(diretorio_job, ARQUIVO_RESULTADOS)
+            backend.baixar_resultados(job['id_job'], arquivo_resultados)
+            gravados, falhas = carregar_resultados(arquivo_resultados, job['requisicoes'], cache)
+            print(f"✅ Resultados do job: {gravados} gravado(s) no cache, {falhas} falha(s)")
+
+    os.makedirs(diretorio_saida, exist_ok=True)
+    saidas = []
+    for caminho_pdf in job['pdfs']:
+        nome_base = os.path.splitext(os.path.basename(caminho_pdf))[0]
+        output_json = os.path.join(diretorio_saida, f"{nome_base}{extensao}")
+        pipeline.processar_pdf_completo(
+            caminho_pdf, output_json, cache_dir=job['cache_dir'], verboso=False, modelo=modelo,
+            recortar_telas=job['recortar_telas'], deteccao_lote=job['deteccao_lote'],
+            classificador=job['classificador'],
+            parametros_heuristica=job.get('parametros_heuristica', pipeline.ARQUIVO_PARAMETROS_HEURISTICA),
+            **opcoes,
+        )
+        saidas.append(output_json)
+        print(f"📁 {output_json}")
+    return saidas
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    if len(argv) < 3 or argv[0] not in ('enviar', 'coletar'):
+        print(__doc__)
+        sys.exit(1)
+
+    obter_opcao = pipeline.obter_opcao
+    if argv[0] == 'enviar':
+        classificador = None if "--sem-classificador" in argv else MODELO_CLASSIFICADOR_TELAS
+        enviar_job(
+            argv[1], argv[2],
+            backend=criar_backend(obter_opcao(argv, "--backend", BACKEND_JOB_PADRAO, str)),
+            recortar_telas="--recortar-telas" in argv,
+            deteccao_lote=obter_opcao(argv, "--deteccao-lote", pipeline.DETECCAO_LOTE_TAMANHO),
+            classificador=classificador,
+            parametros_heuristica=obter_opcao(argv, "--parametros-heuristica",
+                                              pipeline.ARQUIVO_PARAMETROS_HEURISTICA, str),
+        )
+    else:
+        saidas = coletar_job(
+            argv[1], argv[2],
+            aguardar="--aguardar" in argv,
+            intervalo=obter_opcao(argv, "--intervalo", INTERVALO_CONSULTA_JOB, float),
+            extensao=".jsonl" if "--jsonl" in argv else ".parquet" if "--parquet" in argv else ".json",
+            chunking="--chunking" in argv,
+            max_tokens=obter_opcao(argv, "--max-tokens", pipeline.CHUNK_MAX_TOKENS),
+            deduplicar="--deduplicar" in argv,
+        )
+        sys.exit(0 if saidas is not None else 2)
@@ -0,0 +1,128 @@
+# manifesto_incremental.py
+"""
+Manifesto para reprocessamento e reenvio incrementais.
+
+Para cada página (identificada pelo doc_id, ex.:
+manual_chefe_unidade_pgd_petrvs_pagina_012) o manifesto guarda o hash do
+conteúdo da página no PDF (texto, content streams e imagens) e os IDs
+dos registros gerados; para cada registro, o hash do chunk_text.
+
+Numa nova execução só as páginas novas ou alteradas são reprocessadas, e
+o manifesto acumula em 'alteracoes' os IDs a enviar (upsert) e a remover
+do Pinecone até que o envio seja confirmado pelo uploader.
+"""
+import hashlib
+import json
+import os
+
+VERSAO_MANIFESTO = 1
+
+
+def caminho_manifesto(output_json):
+    """Caminho do manifesto associado a um arquivo de saída"""
+    return os.path.splitext(output_json)[0] + ".manifesto.json"
+
+
+def id_pagina(nome_base, num_pagina):
+    """doc_id de uma página (num_pagina começa em 0)"""
+    return f"{nome_base.replace('-', '_')}_pagina_{num_pagina + 1:03d}"
+
+
+def hash_conteudo_pagina(documento, pagina, texto_pagina):
+    """
+    Hash do conteúdo da página sem renderizá-la.
+
+    Combina o texto extraído, os content streams da página (que incluem
+    desenhos vetoriais e o posicionamento das imagens) e os streams brutos
+    (comprimidos, sem decodificar) das imagens referenciadas.
+    """
+    h = hashlib.sha256()
+    h.update(texto_pagina.encode('utf-8'))
+    h.update(b'\0')
+    h.update(pagina.read_contents() or b'')
+
+    for img in pagina.get_images():
+        xref = img[0]
+        h.update(f"\0img:{xref}:{img[2]}x{img[3]}\0".encode('ascii'))
+        try:
+            h.update(documento.xref_stream_raw(xref) or b'')
+        except Exception:
+            pass
+
+    return h.hexdigest()
+
+
+def hash_arquivo(caminho):
+    """Hash do conteúdo de um arquivo (None se não existir)"""
+    if not caminho or not os.path.exists(caminho):
+        return None
+    with open(caminho, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def hash_chunk(doc):
+    """Hash do chunk_text de um registro"""
+    return hashlib.sha256(doc['chunk_text'].encode('utf-8')).hexdigest()
+
+
+def carregar_manifesto(caminho):
+    """Carrega o manifesto ou retorna um manifesto vazio"""
+    if not os.path.exists(caminho):
+        return {
+            'versao': VERSAO_MANIFESTO,
+            'paginas': {},
+            'registros': {},
+            'alteracoes': {'upsert': [], 'remover': []},
+        }
+
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def salvar_manifesto(caminho, manifesto):
+    """Grava o manifesto de forma atômica"""
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    temporario = caminho + ".tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def atualizar_manifesto(manifesto, paginas, documentos):
+    """
+    Atualiza o manifesto após um processamento.
+
+    Args:
+        manifesto: Manifesto anterior (de carregar_manifesto)
+        paginas: dict doc_id da página -> {'hash_conteudo': str ou None, 'ids': [...]}
+            (hash None indica página a reprocessar na próxima execução,
+            ex.: falha no Vision)
+        documentos: Registros gerados nesta execução
+
+    Retorna: (manifesto atualizado, ids alterados, ids removidos) desta execução
+    """
+    registros_anteriores = manifesto.get('registros', {})
+    registros = {doc['id']: hash_chunk(doc) for doc in documentos}
+
+    alterados = [i for i, h in registros.items() if registros_anteriores.get(i) != h]
+    removidos = [i for i in registros_anteriores if i not in registros]
+
+    # Acumula com as alterações ainda não enviadas ao Pinecone
+    pendentes = manifesto.get('alteracoes', {'upsert': [], 'remover': []})
+    upsert = [i for i in dict.fromkeys(pendentes['upsert'] + alterados) if i in registros]
+    remover = [i for i in dict.fromkeys(pendentes['remover'] + removidos) if i not in registros]
+
+    manifesto.update({
+        'versao': VERSAO_MANIFESTO,
+        'paginas': paginas,
+        'registros': registros,
+        'alteracoes': {'upsert': upsert, 'remover': remover},
+    })
+    return manifesto, alterados, removidos
+
+
+def confirmar_envio(caminho):
+    """Limpa as alterações pendentes após um envio bem-sucedido ao Pinecone"""
+    manifesto = carregar_manifesto(caminho)
+    manifesto['alteracoes'] = {'upsert': [], 'remover': []}
+    salvar_manifesto(caminho, manifesto)
@@ -0,0 +1,242 @@
+# metricas.py
+"""
+Instrumentação do processamento: tempos por etapa e por página, chamadas
+à API (quantidade, erros, bytes enviados, tokens) e esperas (limitador de
+taxa e backoff dos retries).
+
+O relatório é um dict serializável em JSON (salvar_relatorio) e pode ser
+exportado no formato texto do Prometheus (salvar_prometheus), para o
+node_exporter (textfile collector) ou para comparar execuções.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIXO_PROMETHEUS = "pgd_rag"
+
+
+def caminho_relatorio(output_json):
+    """Relatório de métricas associado a um arquivo de saída"""
+    return os.path.splitext(output_json)[0] + ".relatorio.json"
+
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) de uma lista de valores, pelo vizinho mais próximo"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def _tokens_resposta(resposta):
+    """(tokens de entrada, tokens de saída) do usage_metadata, se a resposta expuser"""
+    uso = getattr(resposta, 'usage_metadata', None)
+    if uso is None:
+        return 0, 0
+    return (getattr(uso, 'prompt_token_count', 0) or 0,
+            getattr(uso, 'candidates_token_count', 0) or 0)
+
+
+class Metricas:
+    """
+    Coletor de métricas de uma execução (seguro entre threads).
+
+    - medir(etapa, pagina): context manager que cronometra um trecho
+    - cronometrar(etapa, pagina, funcao, ...): executa e cronometra uma função
+      (útil em executor.submit)
+    - registrar_chamada(tipo, bytes_enviados, resposta): chamada à API
+    - registrar_espera(tipo, segundos): tempo parado (limitador, backoff)
+    - registrar_evento(nome): contador de ocorrências (ex.: JSON reparado)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inicio = time.perf_counter()
+        self.etapas = {}
+        self.paginas = {}
+        self.api = {}
+        self.esperas = {}
+        self.eventos = {}
+
+    def adicionar_tempo(self, etapa, segundos, pagina=None):
+        with self._lock:
+            self.etapas.setdefault(etapa, []).append(segundos)
+            if pagina is not None:
+                tempos = self.paginas.setdefault(pagina, {})
+                tempos[etapa] = tempos.get(etapa, 0.0) + segundos
+
+    @contextmanager
+    def medir(self, etapa, pagina=None):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.adicionar_tempo(etapa, time.perf_counter() - inicio, pagina)
+
+    def cronometrar(self, etapa, pagina, funcao, *args, **kwargs):
+        with self.medir(etapa, pagina):
+            return funcao(*args, **kwargs)
+
+    def _api(self, tipo):
+        return self.api.setdefault(tipo, {
+            'chamadas': 0, 'erros': 0, 'bytes_enviados': 0, 'tokens_entrada': 0, 'tokens_saida': 0,
+        })
+
+    def registrar_chamada(self, tipo, bytes_enviados=0, resposta=None, erro=False):
+        entrada, saida = _tokens_resposta(resposta)
+        with self._lock:
+            api = self._api(tipo)
+            api['chamadas'] += 1
+            api['erros'] += int(erro)
+            api['bytes_enviados'] += bytes_enviados
+            api['tokens_entrada'] += entrada
+            api['tokens_saida'] += saida
+
+    def registrar_espera(self, tipo, segundos):
+        if segundos <= 0:
+            return
+        with self._lock:
+            espera = self.esperas.setdefault(tipo, {'ocorrencias': 0, 'segundos': 0.0})
+            espera['ocorrencias'] += 1
+            espera['segundos'] += segundos
+
+    def registrar_evento(self, nome):
+        with self._lock:
+            self.eventos[nome] = self.eventos.get(nome, 0) + 1
+
+    def relatorio(self, **informacoes):
+        """Relatório completo (dict serializável em JSON)"""
+        with self._lock:
+            etapas = {
+                etapa: {
+                    'chamadas': len(tempos),
+                    'total_s': round(sum(tempos), 4),
+                    'medio_ms': round(sum(tempos) / len(tempos) * 1000, 3),
+                    'p50_ms': round(percentil(tempos, 50) * 1000, 3),
+                    'p95_ms': round(percentil(tempos, 95) * 1000, 3),
+                    'max_ms': round(max(tempos) * 1000, 3),
+                }
+                for etapa, tempos in self.etapas.items()
+            }
+            paginas = [
+                {'pagina': pagina + 1, 'etapas_ms': {e: round(s * 1000, 3) for e, s in tempos.items()}}
+                for pagina, tempos in sorted(self.paginas.items())
+            ]
+            return dict(
+                informacoes,
+                tempo_total_s=round(time.perf_counter() - self._inicio, 3),
+                etapas=etapas,
+                api={tipo: dict(valores) for tipo, valores in self.api.items()},
+                esperas={tipo: {'ocorrencias': e['ocorrencias'], 'segundos': round(e['segundos'], 3)}
+                         for tipo, e in self.esperas.items()},
+                eventos=dict(self.eventos),
+                paginas=paginas,
+            )
+
+
+def totais_api(relatorio):
+    """Soma das chamadas, erros, bytes e tokens de todos os tipos de chamada"""
+    totais = {'chamadas': 0, 'erros': 0, 'bytes_enviados': 0, 'tokens_entrada': 0, 'tokens_saida': 0}
+    for valores in relatorio.get('api', {}).values():
+        for chave in totais:
+            totais[chave] += valores.get(chave, 0)
+    return totais
+
+
+def combinar_relatorios(relatorios, **informacoes):
+    """
+    Combina relatórios de vários documentos (modo lote): soma tempos,
+    chamadas, esperas e contadores. Percentis não são combináveis e ficam de fora.
+    """
+    etapas, api, esperas, eventos, contadores = {}, {}, {}, {}, {}
+    for relatorio in relatorios:
+        for etapa, valores in relatorio.get('etapas', {}).items():
+            total = etapas.setdefault(etapa, {'chamadas': 0, 'total_s': 0.0, 'max_ms': 0.0})
+            total['chamadas'] += valores['chamadas']
+            total['total_s'] = round(total['total_s'] + valores['total_s'], 4)
+            total['max_ms'] = max(total['max_ms'], valores['max_ms'])
+        for tipo, valores in relatorio.get('api', {}).items():
+            total = api.setdefault(tipo, dict.fromkeys(valores, 0))
+            for chave, valor in valores.items():
+                total[chave] = total.get(chave, 0) + valor
+        for tipo, valores in relatorio.get('esperas', {}).items():
+            total = esperas.setdefault(tipo, {'ocorrencias': 0, 'segundos': 0.0})
+            total['ocorrencias'] += valores['ocorrencias']
+            total['segundos'] = round(total['segundos'] + valores['segundos'], 3)
+        for nome, valor in relatorio.get('eventos', {}).items():
+            eventos[nome] = eventos.get(nome, 0) + valor
+        for chave, valor in relatorio.get('contadores', {}).items():
+            if isinstance(valor, (int, float)):
+                contadores[chave] = contadores.get(chave, 0) + valor
+
+    for valores in etapas.values():
+        valores['medio_ms'] = round(valores['total_s'] / max(valores['chamadas'], 1) * 1000, 3)
+    return dict(informacoes, etapas=etapas, api=api, esperas=esperas, eventos=eventos, contadores=contadores)
+
+
+def salvar_relatorio(caminho, relatorio):
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+
+def formatar_prometheus(relatorio, rotulos=None):
+    """Relatório no formato texto de exposição do Prometheus"""
+    base = dict(rotulos or {})
+
+    def serie(nome, valor, **extras):
+        todos = dict(base, **extras)
+        texto_rotulos = ",".join(
+            '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in todos.items()
+        )
+        return f"{PREFIXO_PROMETHEUS}_{nome}{{{texto_rotulos}}} {valor}"
+
+    linhas = []
+
+    def metrica(nome, tipo, ajuda, series):
+        linhas.append(f"# HELP {PREFIXO_PROMETHEUS}_{nome} {ajuda}")
+        linhas.append(f"# TYPE {PREFIXO_PROMETHEUS}_{nome} {tipo}")
+        linhas.extend(series)
+
+    etapas = relatorio.get('etapas', {})
+    metrica("etapa_segundos_total", "counter", "Tempo acumulado por etapa",
+            [serie("etapa_segundos_total", v['total_s'], etapa=e) for e, v in etapas.items()])
+    metrica("etapa_execucoes_total", "counter", "Execuções por etapa",
+            [serie("etapa_execucoes_total", v['chamadas'], etapa=e) for e, v in etapas.items()])
+
+    api = relatorio.get('api', {})
+    for chave, ajuda in (('chamadas', "Chamadas à API"), ('erros', "Chamadas à API com erro"),
+                         ('bytes_enviados', "Bytes de imagem enviados à API")):
+        metrica(f"api_{chave}_total", "counter", ajuda,
+                [serie(f"api_{chave}_total", v[chave], tipo=t) for t, v in api.items()])
+    metrica("api_tokens_total", "counter", "Tokens informados pela API (usage_metadata)",
+            [serie("api_tokens_total", v['tokens_entrada'], tipo=t, direcao="entrada") for t, v in api.items()]
+            + [serie("api_tokens_total", v['tokens_saida'], tipo=t, direcao="saida") for t, v in api.items()])
+
+    esperas = relatorio.get('esperas', {})
+    metrica("espera_segundos_total", "counter", "Tempo parado aguardando limitador ou backoff",
+            [serie("espera_segundos_total", v['segundos'], motivo=m) for m, v in esperas.items()])
+
+    metrica("eventos_total", "counter", "Ocorrências registradas (ex.: respostas JSON reparadas)",
+            [serie("eventos_total", v, evento=n) for n, v in relatorio.get('eventos', {}).items()])
+
+    contadores = {k: v for k, v in relatorio.get('contadores', {}).items() if isinstance(v, (int, float))}
+    metrica("paginas", "gauge", "Contadores da detecção híbrida e do processamento",
+            [serie("paginas", v, contador=k) for k, v in contadores.items()])
+
+    if 'tempo_total_s' in relatorio:
+        metrica("execucao_segundos", "gauge", "Duração da execução",
+                [serie("execucao_segundos", relatorio['tempo_total_s'])])
+
+    return "\n".join(linhas) + "\n"
+
+
+def salvar_prometheus(caminho, relatorio, rotulos=None):
+    """Grava o arquivo .prom de forma atômica (o textfile collector lê arquivos completos)"""
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    temporario = caminho + ".tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write(formatar_prometheus(relatorio, rotulos))
+    os.replace(temporario, caminho)
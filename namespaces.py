@@ -0,0 +1,112 @@
+# namespaces.py
+"""
+Divisão dos registros em namespaces do Pinecone e registro local dos IDs.
+
+Por padrão todos os registros vão para NAMESPACE. Com uma chave de
+namespace, cada registro vai para o namespace derivado do seu campo:
+- source_file: um namespace por documento (ex.: manual-chefe-unidade-pgd-petrvs)
+- chunk_type: um namespace por tipo de chunk (ex.: texto, contexto, interface)
+- grupo: um namespace por grupo de documentos, o prefixo do nome do
+  arquivo (manual, portaria, decreto, in...)
+
+O registro (REGISTRO_NAMESPACES) guarda, por namespace e por documento,
+os IDs enviados. Com ele o uploader substitui um documento (remove os IDs
+que deixaram de existir, em qualquer namespace) sem tocar nos demais, e as
+consultas sabem quais namespaces existem e o que há em cada um.
+"""
+import json
+import os
+import re
+
+NAMESPACE = "manual-participante"  # Namespace único (sem chave de namespace)
+CHAVES_NAMESPACE = ('source_file', 'chunk_type', 'grupo')
+REGISTRO_NAMESPACES = "registro_namespaces.json"
+VERSAO_REGISTRO = 1
+
+_PADRAO_INVALIDO = re.compile(r"[^a-z0-9_-]+")
+
+
+def _normalizar(valor):
+    return _PADRAO_INVALIDO.sub("-", str(valor).lower()).strip("-") or "sem-valor"
+
+
+def grupo_documento(source_file):
+    """Grupo de um documento: prefixo do nome do arquivo (ex.: 'manual')"""
+    return _normalizar(os.path.splitext(source_file)[0].split("-", 1)[0])
+
+
+def nome_namespace(doc, chave=None):
+    """Namespace de um registro segundo a chave (None: NAMESPACE)"""
+    if chave is None:
+        return NAMESPACE
+    if chave not in CHAVES_NAMESPACE:
+        raise ValueError(f"Chave de namespace desconhecida: {chave} (use {', '.join(CHAVES_NAMESPACE)})")
+    source_file = doc.get('source_file', '')
+    if chave == 'source_file':
+        return _normalizar(os.path.splitext(source_file)[0])
+    if chave == 'grupo':
+        return grupo_documento(source_file)
+    return _normalizar(doc.get(chave, ''))
+
+
+class RegistroNamespaces:
+    """
+    IDs enviados por namespace e por documento, num arquivo JSON local:
+    {"versao": 1, "namespaces": {namespace: {source_file: [ids]}}}
+    """
+
+    def __init__(self, caminho=REGISTRO_NAMESPACES):
+        self.caminho = caminho
+        self.namespaces = {}
+        if os.path.exists(caminho):
+            with open(caminho, 'r', encoding='utf-8') as f:
+                self.namespaces = json.load(f).get('namespaces', {})
+
+    def salvar(self):
+        """Grava o registro de forma atômica"""
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        temporario = self.caminho + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({'versao': VERSAO_REGISTRO, 'namespaces': self.namespaces}, f, ensure_ascii=False, indent=2)
+        os.replace(temporario, self.caminho)
+
+    def ids_namespace(self, namespace):
+        """Todos os IDs registrados num namespace"""
+        return {i for ids in self.namespaces.get(namespace, {}).values() for i in ids}
+
+    def ids_documento(self, source_file):
+        """IDs registrados de um documento: dict namespace -> set de IDs"""
+        return {
+            namespace: set(documentos[source_file])
+            for namespace, documentos in self.namespaces.items() if source_file in documentos
+        }
+
+    def namespaces_do_id(self, doc_id):
+        return [
+            namespace for namespace, documentos in self.namespaces.items()
+            if any(doc_id in ids for ids in documentos.values())
+        ]
+
+    def adicionar(self, namespace, source_file, ids):
+        documentos = self.namespaces.setdefault(namespace, {})
+        documentos[source_file] = sorted(set(documentos.get(source_file, ())) | set(ids))
+
+    def remover(self, namespace, ids):
+        ids = set(ids)
+        documentos = self.namespaces.get(namespace, {})
+        for source_file in list(documentos):
+            documentos[source_file] = [i for i in documentos[source_file] if i not in ids]
+            if not documentos[source_file]:
+                del documentos[source_file]
+        if not documentos:
+            self.namespaces.pop(namespace, None)
+
+    def definir_documento(self, source_file, ids_por_namespace):
+        """Substitui os IDs registrados de um documento em todos os namespaces"""
+        for namespace in list(self.namespaces):
+            self.namespaces[namespace].pop(source_file, None)
+            if not self.namespaces[namespace]:
+                del self.namespaces[namespace]
+        for namespace, ids in ids_por_namespace.items():
+            if ids:
+                self.adicionar(namespace, source_file, ids)
@@ -0,0 +1,403 @@
+# planejador_rotas.py
+"""
+Planejamento de rotas e calibração da heurística de telas (sem API).
+
+Os limiares (LIMIAR_ALTO, LIMIAR_BAIXO) e os pesos (PESOS_HEURISTICA) de
+processar_pdf_completo.py decidem quantas chamadas pagas ao Vision
+acontecem. Este script mostra o efeito de uma mudança sem executá-la:
+
+- planejar: extrai as páginas e aplica só a heurística, sem renderizar
+  nem chamar a API. Gera o plano por página (pular, confirmação com
+  Vision Flash ou análise Vision completa) e projeta o número de chamadas
+  e o tempo. As páginas ambíguas podem ou não ser confirmadas, então a
+  projeção de análises vai de um mínimo (nenhuma confirmada) a um máximo
+  (todas); o classificador local e o cache Vision não são considerados.
+- calibrar: usa os vereditos já obtidos do Vision (as amostras gravadas
+  com --coletar-treino em ARQUIVO_TREINO_CLASSIFICADOR) como rótulos e
+  busca limiares e pesos que minimizem as chamadas mantendo o recall das
+  páginas com tela acima do alvo. Grava os parâmetros no arquivo que o
+  pipeline lê (ARQUIVO_PARAMETROS_HEURISTICA).
+
+As amostras só existem para páginas que já foram ao Vision (roteadas ao
+Vision ou ambíguas): páginas puladas pela heurística nunca ganharam
+rótulo. A calibração mede o recall dentro dessas páginas; limiares muito
+mais permissivos que os usados na coleta não têm como ser avaliados.
+
+Uso:
+    python planejador_rotas.py planejar <pdf_diretorio_ou_glob> [--parametros ARQ]
+                               [--deteccao-lote K] [--concorrencia N] [--rpm N]
+                               [--relatorio ARQ] [--saida plano.json]
+    python planejador_rotas.py calibrar [amostras.jsonl] [--recall-alvo R]
+                               [--pdfs DIR] [--iteracoes N] [--deteccao-lote K]
+                               [--saida parametros.json]
+"""
+import json
+import math
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import processar_pdf_completo as pipeline
+from classificador_telas import ARQUIVO_TREINO_CLASSIFICADOR, carregar_amostras
+from metricas import Metricas
+
+# --- CONFIGURAÇÕES ---
+LATENCIA_VISION_S = 8.0  # Latência média de uma análise Vision (sem relatório de métricas)
+LATENCIA_DETECCAO_S = 1.5  # Latência média de uma requisição de confirmação
+RECALL_ALVO = 0.98  # Fração mínima das páginas com tela que devem chegar ao Vision
+ITERACOES_CALIBRACAO = 400  # Conjuntos de pesos avaliados na busca
+PASSO_LIMIAR = 0.02  # Resolução da grade de limiares
+SEMENTE = 42
+
+NOMES_ROTAS = {'vision': 'vision', 'ambigua': 'deteccao', 'texto': 'pular'}
+
+
+def latencias_relatorio(caminho):
+    """
+    Latências médias (s) de análise e de confirmação de um relatório de
+    métricas de execução (<saida>.relatorio.json ou relatorio_lote.json).
+    Etapas ausentes ficam com os padrões.
+    """
+    with open(caminho, 'r', encoding='utf-8') as f:
+        etapas = json.load(f).get('etapas', {})
+    latencias = {'vision': LATENCIA_VISION_S, 'deteccao': LATENCIA_DETECCAO_S}
+    if 'vision' in etapas:
+        latencias['vision'] = etapas['vision']['medio_ms'] / 1000
+    for etapa in ('deteccao_lote', 'deteccao'):
+        if etapa in etapas:
+            latencias['deteccao'] = etapas[etapa]['medio_ms'] / 1000
+            break
+    return latencias
+
+
+def planejar_documento(caminho_pdf, parametros, deteccao_lote=pipeline.DETECCAO_LOTE_TAMANHO):
+    """
+    Plano de um PDF: rota de cada página pela heurística, sem renderizar.
+
+    Retorna: dict com 'source_file', 'paginas' (pagina, rota, confianca,
+    razao), 'rotas' (contagem por rota), 'requisicoes_deteccao' e
+    'tempo_extracao_s'
+    """
+    metricas = Metricas()
+    paginas = []
+    rotas = {nome: 0 for nome in NOMES_ROTAS.values()}
+    with fitz.open(caminho_pdf) as documento:
+        with metricas.medir('indice_imagens'):
+            dimensoes_imagens = pipeline.indexar_dimensoes_imagens(documento)
+        for num_pagina in range(len(documento)):
+            extraida = pipeline.extrair_pagina(documento, num_pagina, heuristica=True,
+                                               dimensoes_imagens=dimensoes_imagens, metricas=metricas,
+                                               pesos=parametros['pesos'])
+            tem_tela, confianca, razao = extraida['heuristica']
+            rota = NOMES_ROTAS[pipeline.rotear_pagina(tem_tela, confianca, parametros)]
+            rotas[rota] += 1
+            paginas.append({'pagina': num_pagina + 1, 'rota': rota,
+                            'confianca': round(confianca, 3), 'razao': razao})
+
+    # No pipeline as miniaturas ambíguas são agrupadas em lotes por documento
+    lote = max(1, deteccao_lote)
+    return {
+        'source_file': os.path.basename(caminho_pdf),
+        'paginas': paginas,
+        'rotas': rotas,
+        'requisicoes_deteccao': math.ceil(rotas['deteccao'] / lote),
+        'tempo_extracao_s': round(sum(sum(t) for t in metricas.etapas.values()), 3),
+    }
+
+
+def projetar(documentos, latencias, concorrencia=pipeline.VISION_CONCORRENCIA, rpm=pipeline.VISION_RPM):
+    """
+    Chamadas e tempo projetados para os planos de `documentos`.
+
+    O tempo de API de um conjunto de chamadas é o maior entre o limitado
+    pela concorrência (latência / requisições simultâneas) e o limitado
+    pelo rpm; a extração corre em paralelo com as chamadas, então o tempo
+    total é o maior dos dois.
+    """
+    vision = sum(d['rotas']['vision'] for d in documentos)
+    ambiguas = sum(d['rotas']['deteccao'] for d in documentos)
+    deteccao = sum(d['requisicoes_deteccao'] for d in documentos)
+    extracao = sum(d['tempo_extracao_s'] for d in documentos)
+
+    def tempo_api(analises):
+        latencia_total = analises * latencias['vision'] + deteccao * latencias['deteccao']
+        return max(latencia_total / max(concorrencia, 1), (analises + deteccao) / rpm * 60)
+
+    projecao = {
+        'paginas': sum(len(d['paginas']) for d in documentos),
+        'paginas_por_rota': {
+            rota: sum(d['rotas'][rota] for d in documentos) for rota in NOMES_ROTAS.values()
+        },
+        'requisicoes_deteccao': deteccao,
+        'analises_vision_min': vision,
+        'analises_vision_max': vision + ambiguas,
+        'chamadas_min': vision + deteccao,
+        'chamadas_max': vision + ambiguas + deteccao,
+        'tempo_extracao_s': round(extracao, 2),
+    }
+    for limite, analises in (('min', vision), ('max', vision + ambiguas)):
+        projecao[f'tempo_api_{limite}_s'] = round(tempo_api(analises), 1)
+        projecao[f'tempo_total_{limite}_s'] = round(max(extracao, tempo_api(analises)), 1)
+    return projecao
+
+
+def planejar(entrada, parametros_heuristica=pipeline.ARQUIVO_PARAMETROS_HEURISTICA,
+             deteccao_lote=pipeline.DETECCAO_LOTE_TAMANHO, concorrencia=pipeline.VISION_CONCORRENCIA,
+             rpm=pipeline.VISION_RPM, relatorio=None, saida=None):
+    """
+    Planeja um PDF, diretório ou padrão glob e imprime a projeção.
+
+    Retorna: dict do plano (parâmetros, latências, documentos e projeção)
+    """
+    caminhos = pipeline.listar_pdfs(entrada) if os.path.isdir(entrada) or any(
+        c in entrada for c in '*?[') else [entrada]
+    if not caminhos:
+        print("❌ Nenhum PDF encontrado!")
+        return None
+
+    parametros = pipeline.carregar_parametros_heuristica(parametros_heuristica)
+    latencias = latencias_relatorio(relatorio) if relatorio else {
+        'vision': LATENCIA_VISION_S, 'deteccao': LATENCIA_DETECCAO_S,
+    }
+    documentos = [planejar_documento(c, parametros, deteccao_lote) for c in caminhos]
+    projecao = projetar(documentos, latencias, concorrencia, rpm)
+    plano = {
+        'criado_em': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'parametros_heuristica': parametros_heuristica if os.path.exists(parametros_heuristica or '') else None,
+        'limiar_alto': parametros['limiar_alto'],
+        'limiar_baixo': parametros['limiar_baixo'],
+        'deteccao_lote': deteccao_lote,
+        'latencias_s': latencias,
+        'projecao': projecao,
+        'documentos': documentos,
+    }
+
+    print(f"📄 PDFs: {len(documentos)} | Páginas: {projecao['paginas']}")
+    print(f"⚙️  Limiares: alto {parametros['limiar_alto']} | baixo {parametros['limiar_baixo']}"
+          f" ({plano['parametros_heuristica'] or 'padrões'})")
+    for documento in documentos:
+        rotas = documento['rotas']
+        print(f"   {documento['source_file']}: {rotas['vision']} vision, "
+              f"{rotas['deteccao']} confirmação, {rotas['pular']} pular")
+    por_rota = projecao['paginas_por_rota']
+    print(f"\n🗺️  Rotas: {por_rota['vision']} vision | {por_rota['deteccao']} confirmação | {por_rota['pular']} pular")
+    print(f"📞 Chamadas: {projecao['chamadas_min']}-{projecao['chamadas_max']} "
+          f"({projecao['requisicoes_deteccao']} confirmação(ões) em lotes de {deteccao_lote}, "
+          f"{projecao['analises_vision_min']}-{projecao['analises_vision_max']} análise(s))")
+    print(f"⏱️  Tempo projetado: {projecao['tempo_total_min_s']}-{projecao['tempo_total_max_s']}s "
+          f"(extração {projecao['tempo_extracao_s']}s, concorrência {concorrencia}, {rpm} req/min)")
+
+    if saida:
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump(plano, f, ensure_ascii=False, indent=2)
+        print(f"\n📁 Plano salvo em: {saida}")
+    return plano
+
+
+def sinais_amostras(amostras, diretorio_pdfs=None):
+    """
+    Sinais da heurística de cada amostra: os gravados na amostra ou, para
+    amostras antigas, recalculados a partir do PDF em `diretorio_pdfs`.
+
+    Retorna: (lista de sinais, lista de rótulos) só das amostras com sinais
+    """
+    sinais, rotulos = [], []
+    pendentes = {}
+    for amostra in amostras:
+        if amostra.get('sinais'):
+            sinais.append(amostra['sinais'])
+            rotulos.append(bool(amostra['tem_tela']))
+        elif diretorio_pdfs:
+            pendentes.setdefault(amostra['source_file'], []).append(amostra)
+
+    for source_file, do_documento in pendentes.items():
+        caminho_pdf = os.path.join(diretorio_pdfs, source_file)
+        if not os.path.exists(caminho_pdf):
+            print(f"⚠️  PDF não encontrado, amostras ignoradas: {caminho_pdf}")
+            continue
+        with fitz.open(caminho_pdf) as documento:
+            dimensoes_imagens = pipeline.indexar_dimensoes_imagens(documento)
+            for amostra in do_documento:
+                if amostra['pagina'] > len(documento):
+                    continue
+                extraida = pipeline.extrair_pagina(documento, amostra['pagina'] - 1, heuristica=True,
+                                                   dimensoes_imagens=dimensoes_imagens)
+                sinais.append(extraida['sinais'])
+                rotulos.append(bool(amostra['tem_tela']))
+    return sinais, rotulos
+
+
+def avaliar_parametros(confiancas, decisoes, rotulos, limiar_alto, limiar_baixo, deteccao_lote):
+    """
+    Custo e recall de um par de limiares sobre páginas rotuladas.
+
+    Uma página vai ao Vision se a heurística a rotear para lá ou se for
+    ambígua e a confirmação disser que tem tela (a confirmação é tomada
+    como igual ao rótulo). O custo conta análises e requisições de
+    confirmação (estas divididas pelo tamanho do lote).
+    """
+    alta = confiancas >= limiar_alto
+    vision = alta & decisoes
+    ambigua = ~alta & (confiancas >= limiar_baixo)
+    chega_ao_vision = vision | (ambigua & rotulos)
+    telas = rotulos.sum()
+    return {
+        'recall': float((chega_ao_vision & rotulos).sum() / telas) if telas else 1.0,
+        'analises': int(chega_ao_vision.sum()),
+        'ambiguas': int(ambigua.sum()),
+        'custo': float(chega_ao_vision.sum() + ambigua.sum() / max(1, deteccao_lote)),
+    }
+
+
+def melhores_limiares(confiancas, decisoes, rotulos, recall_alvo, deteccao_lote):
+    """
+    Par de limiares (alto, baixo) de menor custo com recall >= alvo, numa
+    grade de PASSO_LIMIAR (alto de 0.5 a 1.0, baixo até o alto).
+
+    Retorna: (limiar_alto, limiar_baixo, avaliação) ou None se nenhum par atingir o alvo
+    """
+    grade = np.round(np.arange(0.0, 1.0 + PASSO_LIMIAR / 2, PASSO_LIMIAR), 4)
+    melhor = None
+    for limiar_alto in grade[grade >= 0.5]:
+        for limiar_baixo in grade[grade <= limiar_alto]:
+            avaliacao = avaliar_parametros(confiancas, decisoes, rotulos, limiar_alto, limiar_baixo,
+                                           deteccao_lote)
+            if avaliacao['recall'] < recall_alvo:
+                continue
+            chave = (avaliacao['custo'], -avaliacao['recall'])
+            if melhor is None or chave < melhor[0]:
+                melhor = (chave, float(limiar_alto), float(limiar_baixo), avaliacao)
+    return melhor[1:] if melhor else None
+
+
+def _pontuar(sinais, pesos):
+    pontuados = [pipeline.pontuar_heuristica(s, pesos) for s in sinais]
+    return (np.array([c for _, c, _ in pontuados]), np.array([t for t, _, _ in pontuados]))
+
+
+def calibrar(sinais, rotulos, recall_alvo=RECALL_ALVO, iteracoes=ITERACOES_CALIBRACAO,
+             deteccao_lote=pipeline.DETECCAO_LOTE_TAMANHO, pesos_iniciais=None, semente=SEMENTE):
+    """
+    Busca aleatória local nos pesos (cada candidato perturba o melhor até
+    agora, mantendo o sinal de cada peso) e, para cada conjunto de pesos,
+    busca em grade dos limiares.
+
+    Retorna: dict com 'pesos', 'limiar_alto', 'limiar_baixo' e 'avaliacao'
+    (None se nem os pesos iniciais atingirem o alvo com algum par de limiares)
+    """
+    rotulos = np.asarray(rotulos, dtype=bool)
+    rng = np.random.default_rng(semente)
+    pesos = dict(pesos_iniciais or pipeline.PESOS_HEURISTICA)
+    confiancas, decisoes = _pontuar(sinais, pesos)
+    resultado = melhores_limiares(confiancas, decisoes, rotulos, recall_alvo, deteccao_lote)
+    if resultado is None:
+        return None
+    melhor = {'pesos': pesos, 'limiar_alto': resultado[0], 'limiar_baixo': resultado[1],
+              'avaliacao': resultado[2]}
+
+    for _ in range(iteracoes):
+        candidato = {
+            nome: round(valor * float(np.exp(rng.normal(0, 0.3))), 3)
+            for nome, valor in melhor['pesos'].items()
+        }
+        confiancas, decisoes = _pontuar(sinais, candidato)
+        resultado = melhores_limiares(confiancas, decisoes, rotulos, recall_alvo, deteccao_lote)
+        if resultado and resultado[2]['custo'] < melhor['avaliacao']['custo']:
+            melhor = {'pesos': candidato, 'limiar_alto': resultado[0], 'limiar_baixo': resultado[1],
+                      'avaliacao': resultado[2]}
+    return melhor
+
+
+def _imprimir_avaliacao(titulo, avaliacao, paginas):
+    print(f"{titulo}: recall {avaliacao['recall']:.1%} | {avaliacao['analises']} análise(s) | "
+          f"{avaliacao['ambiguas']} ambígua(s) | custo {avaliacao['custo']:.1f} chamadas "
+          f"({avaliacao['custo'] / max(paginas, 1):.2f} por página rotulada)")
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in ('planejar', 'calibrar') or (argv[0] == 'planejar' and len(argv) < 2):
+        print(__doc__)
+        sys.exit(1)
+
+    obter_opcao = pipeline.obter_opcao
+    deteccao_lote = obter_opcao(argv, "--deteccao-lote", pipeline.DETECCAO_LOTE_TAMANHO)
+
+    if argv[0] == 'planejar':
+        plano = planejar(
+            argv[1],
+            parametros_heuristica=obter_opcao(argv, "--parametros", pipeline.ARQUIVO_PARAMETROS_HEURISTICA, str),
+            deteccao_lote=deteccao_lote,
+            concorrencia=obter_opcao(argv, "--concorrencia", pipeline.VISION_CONCORRENCIA),
+            rpm=obter_opcao(argv, "--rpm", pipeline.VISION_RPM, float),
+            relatorio=obter_opcao(argv, "--relatorio", None, str),
+            saida=obter_opcao(argv, "--saida", None, str),
+        )
+        sys.exit(0 if plano else 1)
+
+    caminho_amostras = argv[1] if len(argv) > 1 and not argv[1].startswith('--') else ARQUIVO_TREINO_CLASSIFICADOR
+    recall_alvo = obter_opcao(argv, "--recall-alvo", RECALL_ALVO, float)
+    saida = obter_opcao(argv, "--saida", pipeline.ARQUIVO_PARAMETROS_HEURISTICA, str)
+    if not os.path.exists(caminho_amostras):
+        print(f"❌ Erro: amostras não encontradas: {caminho_amostras}")
+        print("As amostras são gravadas por: python processar_pdf_completo.py ... --coletar-treino")
+        sys.exit(1)
+
+    _, _, amostras = carregar_amostras(caminho_amostras)
+    sinais, rotulos = sinais_amostras(amostras, obter_opcao(argv, "--pdfs", None, str))
+    rotulos = np.asarray(rotulos, dtype=bool)
+    print(f"📊 {len(rotulos)} página(s) rotulada(s): {int(rotulos.sum())} com tela, "
+          f"{int(len(rotulos) - rotulos.sum())} sem tela")
+    if not rotulos.any() or rotulos.all():
+        print("❌ Erro: a calibração precisa de páginas com e sem tela (use --pdfs para amostras sem sinais)")
+        sys.exit(1)
+
+    # Referência: pesos e limiares atuais (arquivo de parâmetros, se existir)
+    atuais = pipeline.carregar_parametros_heuristica(pipeline.ARQUIVO_PARAMETROS_HEURISTICA)
+    confiancas, decisoes = _pontuar(sinais, atuais['pesos'])
+    avaliacao_atual = avaliar_parametros(confiancas, decisoes, rotulos, atuais['limiar_alto'],
+                                         atuais['limiar_baixo'], deteccao_lote)
+    _imprimir_avaliacao("\n📏 Atual", avaliacao_atual, len(rotulos))
+
+    # Validação com 20% das páginas (ordem fixa, reprodutível)
+    iteracoes = obter_opcao(argv, "--iteracoes", ITERACOES_CALIBRACAO)
+    ordem = np.random.default_rng(0).permutation(len(rotulos))
+    corte = max(1, len(rotulos) // 5)
+    validacao, treino = ordem[:corte], ordem[corte:]
+    parcial = calibrar([sinais[i] for i in treino], rotulos[treino], recall_alvo, iteracoes, deteccao_lote,
+                       atuais['pesos'])
+    avaliacao_validacao = None
+    if parcial:
+        confiancas, decisoes = _pontuar([sinais[i] for i in validacao], parcial['pesos'])
+        avaliacao_validacao = avaliar_parametros(confiancas, decisoes, rotulos[validacao],
+                                                 parcial['limiar_alto'], parcial['limiar_baixo'], deteccao_lote)
+        _imprimir_avaliacao("🔍 Validação", avaliacao_validacao, len(validacao))
+
+    # Parâmetros finais com todas as páginas
+    calibrado = calibrar(sinais, rotulos, recall_alvo, iteracoes, deteccao_lote, atuais['pesos'])
+    if calibrado is None:
+        print(f"❌ Nenhum par de limiares atinge recall {recall_alvo:.1%} com estas amostras")
+        sys.exit(1)
+    _imprimir_avaliacao("✅ Calibrado", calibrado['avaliacao'], len(rotulos))
+    print(f"   Limiares: alto {calibrado['limiar_alto']} | baixo {calibrado['limiar_baixo']}")
+
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({
+            'pesos': calibrado['pesos'],
+            'limiar_alto': calibrado['limiar_alto'],
+            'limiar_baixo': calibrado['limiar_baixo'],
+            'calibracao': {
+                'criado_em': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'amostras': caminho_amostras,
+                'paginas_rotuladas': int(len(rotulos)),
+                'recall_alvo': recall_alvo,
+                'deteccao_lote': deteccao_lote,
+                'atual': avaliacao_atual,
+                'validacao': avaliacao_validacao,
+                'calibrado': calibrado['avaliacao'],
+            },
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n📁 Parâmetros salvos em: {saida}")
@@ -13,16 +13,68 @@ import json
 import os
 import sys
 import io
+import re
 import time
+import hashlib
+import threading
+import glob
+import multiprocessing
+from collections import deque
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+)
 from tqdm import tqdm
 import config
+from controle_taxa import (
+    ControleTaxa, CircuitoAberto, criar_estado_compartilhado, classificar_erro, atraso_servidor,
+    backoff_com_jitter, motivo_bloqueio,
+)
+from cache_vision import CacheVision, CACHE_VISION_DIR
+from formato_saida import eh_jsonl, ler_registros, salvar_registros, nome_formato, EscritorJSONL
+from manifesto_incremental import (
+    caminho_manifesto, carregar_manifesto, salvar_manifesto, atualizar_manifesto,
+    hash_conteudo_pagina, hash_arquivo, id_pagina,
+)
+from reparo_json import interpretar_json
+from deduplicacao import (
+    IndiceTelas, dhash, distancia_hamming, diferenca_local, miniatura_tela, colapsar_chunks_duplicados,
+    LIMIAR_DIFERENCA_LOCAL,
+)
+from divisao_chunks import chunkear_registros, caminho_paginas, CHUNK_MAX_TOKENS
+from metricas import (
+    Metricas, caminho_relatorio, salvar_relatorio, salvar_prometheus, combinar_relatorios, totais_api,
+)
+from classificador_telas import (
+    ClassificadorTelas, extrair_caracteristicas, registrar_amostra,
+    MODELO_CLASSIFICADOR_TELAS, ARQUIVO_TREINO_CLASSIFICADOR,
+)
 
 # --- CONFIGURAÇÕES ---
 MODELO_VISION = "gemini-2.5-flash"
 DPI_IMAGENS = 150
+LADO_MAX_DETECCAO = 800  # Resolução máxima (px) da confirmação com Vision Flash
+LADO_MAX_ANALISE = 1500  # Resolução máxima (px) da análise completa
+LADO_MAX_MINIATURA_LOTE = 512  # Resolução máxima (px) das miniaturas na detecção em lote
+LADO_MAX_RECORTE = 2048  # Resolução máxima (px) de cada captura recortada (--recortar-telas)
+LARGURA_MIN_RECORTE = 500  # Imagem embutida a partir da qual é tratada como captura de tela
+ALTURA_MIN_RECORTE = 300
+MAX_RECORTES_PAGINA = 4  # Acima disso, a página inteira é enviada
+LADO_CAPTURA_INDICE = 512  # Resolução (px) da captura comparada no índice de telas (--deduplicar)
+DETECCAO_LOTE_TAMANHO = 6  # Páginas ambíguas por requisição de detecção (1 desativa o lote)
+FORMATO_IMAGEM_ENVIO = "jpeg"  # Formato enviado à API: "jpeg", "webp" ou "png"
+QUALIDADE_IMAGEM_ENVIO = 90  # Qualidade JPEG/WebP (ignorado em PNG)
 MAX_RETRIES = 3
 RETRY_DELAY_BASE = 2
-DELAY_ENTRE_PAGINAS = 1.5
+VISION_CONCORRENCIA = 4  # Requisições Vision simultâneas
+VISION_RPM = 60  # Limite de requisições por minuto (token bucket)
+LOTE_WORKERS = max(1, min(4, os.cpu_count() or 1))  # Processos no modo lote
+PAGINAS_POR_BLOCO_EXTRACAO = 16  # Páginas por tarefa na extração paralela
+PAGINAS_MIN_EXTRACAO_PARALELA = 200  # Abaixo disso, iniciar os processos (spawn) não compensa
+LIMIAR_ALTO = 0.7  # Confiança da heurística a partir da qual a página não é confirmada
+LIMIAR_BAIXO = 0.3  # Confiança abaixo da qual a página vai sem Vision (texto puro)
+ARQUIVO_PARAMETROS_HEURISTICA = "parametros_heuristica.json"  # Pesos/limiares calibrados (se existir)
+ARQUIVO_MANIFESTO_LOTE = "manifesto_lote.json"
+ARQUIVO_RELATORIO_LOTE = "relatorio_lote.json"
 
 # Prompt para análise de telas - Traduzir telas em texto inteligível usando nomes EXATOS dos elementos
 PROMPT_VISION = """Analise esta tela do sistema PGD Petrvs e traduza os elementos visuais em instruções passo a passo claras.
@@ -35,6 +87,7 @@ REGRAS FUNDAMENTAIS:
 
 FORMATO JSON (responda APENAS o JSON, sem texto adicional):
 {
+  "tem_tela": true/false,
   "titulo_tela": "Título ou ação principal da tela",
   "tipo_tela": "listagem/formulário/modal/dashboard/navegação/documento/início",
   "contexto": "O que esta tela faz e quando é usada",
@@ -67,112 +120,262 @@ CRÍTICO:
 - Use SEMPRE os textos EXATOS visíveis na tela (não invente, não generalize, não use sinônimos)
 - Se o botão diz "Incluir", escreva "Incluir" (não "Adicionar" ou "Criar")
 - Se o menu diz "Planejamento", escreva "Planejamento" (não "Planejamento de Trabalho" ou outro)
-- Se há números 1, 2, 3 na tela, use-os na mesma ordem"""
+- Se há números 1, 2, 3 na tela, use-os na mesma ordem
+- "tem_tela" é true só se a imagem mostra uma tela de sistema/aplicação com elementos interativos (botões, menus, campos, formulários)"""
 
 # Prompt para detecção rápida de telas (usado apenas em casos ambíguos)
 PROMPT_DETECCAO_TELA = """Esta imagem contém uma tela de sistema/aplicação com elementos interativos (botões, menus, campos, formulários)?
 
 Responda APENAS "SIM" ou "NÃO"."""
 
-def detectar_se_tem_tela_heuristica(texto_pagina, imagens_pagina, pixmap, documento):
+# Prompt para detecção em lote: várias miniaturas, cada uma identificada pela página
+PROMPT_DETECCAO_TELA_LOTE = """Você receberá várias imagens de páginas de um documento, cada uma precedida pelo rótulo "Página N".
+
+Para CADA imagem, diga se ela contém uma tela de sistema/aplicação com elementos interativos (botões, menus, campos, formulários).
+
+Responda APENAS com JSON no formato:
+{"paginas": [{"pagina": N, "tem_tela": true}, {"pagina": M, "tem_tela": false}]}"""
+
+# Complemento do PROMPT_VISION quando a página vai como várias capturas recortadas
+PROMPT_VISION_RECORTES = """As imagens a seguir são as capturas de tela de uma mesma página do manual, na ordem em que aparecem (de cima para baixo). Analise-as em conjunto, como um único fluxo, seguindo essa ordem."""
+
+# Esquemas de resposta (structured output): o Gemini devolve JSON nesse formato
+ESQUEMA_ANALISE_VISION = {
+    "type": "object",
+    "properties": {
+        "tem_tela": {"type": "boolean"},
+        "titulo_tela": {"type": "string"},
+        "tipo_tela": {"type": "string"},
+        "contexto": {"type": "string"},
+        "instrucoes_navegacao": {"type": "array", "items": {"type": "string"}},
+        "elementos_visiveis": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "tipo": {"type": "string"},
+                    "nome": {"type": "string"},
+                    "localizacao": {"type": "string"},
+                    "acao": {"type": "string"},
+                },
+                "required": ["tipo", "nome"],
+            },
+        },
+        "campos_formulario": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "nome": {"type": "string"},
+                    "tipo": {"type": "string"},
+                    "obrigatorio": {"type": "boolean"},
+                    "formato": {"type": "string"},
+                },
+                "required": ["nome"],
+            },
+        },
+        "observacoes": {"type": "string"},
+    },
+    "required": ["tem_tela", "titulo_tela", "tipo_tela", "contexto", "instrucoes_navegacao", "elementos_visiveis"],
+}
+
+ESQUEMA_DETECCAO_LOTE = {
+    "type": "object",
+    "properties": {
+        "paginas": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"pagina": {"type": "integer"}, "tem_tela": {"type": "boolean"}},
+                "required": ["pagina", "tem_tela"],
+            },
+        },
+    },
+    "required": ["paginas"],
+}
+
+CONFIG_GERACAO_VISION = {"response_mime_type": "application/json", "response_schema": ESQUEMA_ANALISE_VISION}
+CONFIG_GERACAO_DETECCAO_LOTE = {"response_mime_type": "application/json", "response_schema": ESQUEMA_DETECCAO_LOTE}
+
+# Pesos da heurística de telas (pontuação de -2 a +2 → confiança de 0 a 1);
+# sobrepostos por ARQUIVO_PARAMETROS_HEURISTICA, se existir
+PESOS_HEURISTICA = {
+    'marcador': 0.3,               # Por marcador de tela no texto...
+    'max_marcadores': 1.5,         # ...até este total
+    'passos': 0.8,                 # Instruções passo a passo
+    'imagem_grande': 0.5,          # Por imagem grande (possível screenshot)...
+    'max_imagens_grandes': 1.5,    # ...até este total
+    'imagem_media': 0.3,           # Por imagem média além da primeira (se 2 ou mais)...
+    'max_imagens_medias': 1.0,     # ...até este total
+    'proporcao_baixa': 0.4,        # Pouco texto para a área da página, com imagens
+    'texto_sem_marcadores': -1.0,  # Mais de 2000 caracteres sem marcadores
+    'normativo': -1.5,             # Artigos, parágrafos, incisos (com < 3 marcadores)
+    'sem_imagem': -0.5,            # Nenhuma imagem e mais de 500 caracteres
+}
+
+# Marcadores de tela no texto (comparados com o texto em minúsculas)
+MARCADORES_TELA = [
+    'clicar em', 'clicar no', 'clicar na',
+    'selecionar', 'selecionar o', 'selecionar a',
+    'botão', 'menu', 'campo', 'formulário',
+    'tela do sistema', 'sistema', 'petrvs',
+    'incluir', 'editar', 'excluir', 'gravar', 'cancelar',
+    'filtrar', 'buscar', 'pesquisar',
+    'menu superior', 'menu lateral',
+    'ícone', 'aba', 'dropdown'
+]
+
+# Hierarquia dos marcadores por contenção (ex.: 'menu superior' contém 'menu'),
+# montada uma vez: um marcador só é procurado se o marcador que ele contém
+# estiver no texto, o que evita as buscas dos que não podem ocorrer
+def _montar_hierarquia_marcadores(marcadores):
+    marcadores = list(dict.fromkeys(marcadores))
+    pais = {
+        m: max((outro for outro in marcadores if outro != m and outro in m), key=len, default=None)
+        for m in marcadores
+    }
+    raizes = [m for m in marcadores if pais[m] is None]
+    filhos = {m: [outro for outro in marcadores if pais[outro] == m] for m in marcadores}
+    return raizes, filhos
+
+_RAIZES_MARCADORES_TELA, _FILHOS_MARCADORES_TELA = _montar_hierarquia_marcadores(MARCADORES_TELA)
+_PADRAO_PASSOS = re.compile(r"[123]\. |[Pp]asso ")
+_PADRAO_NORMATIVO = re.compile(r"Art\. |§ |Parágrafo|CAPÍTULO|Seção")
+
+def contar_marcadores_tela(texto_lower):
+    """Número de marcadores de MARCADORES_TELA distintos presentes no texto"""
+    encontrados = 0
+    a_verificar = list(_RAIZES_MARCADORES_TELA)
+    while a_verificar:
+        marcador = a_verificar.pop()
+        if marcador in texto_lower:
+            encontrados += 1
+            a_verificar.extend(_FILHOS_MARCADORES_TELA[marcador])
+    return encontrados
+
+def indexar_dimensoes_imagens(documento):
     """
-    Detecta se a página contém telas de sistema usando heurísticas locais (sem API).
+    Índice xref -> (largura, altura) das imagens do documento.
     
-    Retorna: (tem_tela: bool, confianca: float 0-1, razao: str)
+    Usa os metadados do dicionário da imagem (get_images), sem extrair nem
+    decodificar os pixels; imagens compartilhadas (ex.: logos) aparecem uma vez.
     """
-    if not texto_pagina and len(imagens_pagina) == 0:
-        return (False, 1.0, "Página vazia")
+    dimensoes = {}
+    for pagina in documento:
+        for img in pagina.get_images():
+            dimensoes.setdefault(img[0], (img[2], img[3]))
+    return dimensoes
+
+def carregar_parametros_heuristica(caminho=ARQUIVO_PARAMETROS_HEURISTICA):
+    """
+    Pesos e limiares da heurística: os padrões (PESOS_HEURISTICA,
+    LIMIAR_ALTO, LIMIAR_BAIXO) sobrepostos pelo arquivo JSON, se existir
+    (ex.: gerado por `planejador_rotas.py calibrar`).
+    
+    Retorna: dict com 'pesos', 'limiar_alto' e 'limiar_baixo'
+    """
+    parametros = {'pesos': dict(PESOS_HEURISTICA), 'limiar_alto': LIMIAR_ALTO, 'limiar_baixo': LIMIAR_BAIXO}
+    if caminho and os.path.exists(caminho):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+        parametros['pesos'].update(dados.get('pesos', {}))
+        parametros['limiar_alto'] = dados.get('limiar_alto', LIMIAR_ALTO)
+        parametros['limiar_baixo'] = dados.get('limiar_baixo', LIMIAR_BAIXO)
+    return parametros
+
+def sinais_heuristica(texto_pagina, imagens_pagina, pagina, dimensoes_imagens=None):
+    """
+    Sinais locais (sem API) usados pela heurística de telas.
     
-    # 1. Verificar marcadores de tela no texto
-    marcadores_tela = [
-        'clicar em', 'clicar no', 'clicar na',
-        'selecionar', 'selecionar o', 'selecionar a',
-        'botão', 'menu', 'campo', 'formulário',
-        'tela do sistema', 'sistema', 'petrvs',
-        'incluir', 'editar', 'excluir', 'gravar', 'cancelar',
-        'filtrar', 'buscar', 'pesquisar',
-        'menu superior', 'menu lateral',
-        'ícone', 'aba', 'dropdown'
-    ]
-    
-    texto_lower = texto_pagina.lower()
-    marcadores_encontrados = sum(1 for marcador in marcadores_tela if marcador in texto_lower)
-    
-    # 2. Verificar instruções passo a passo
-    tem_passos = any(marker in texto_pagina for marker in ['1. ', '2. ', '3. ', 'Passo ', 'passo '])
-    
-    # 3. Verificar quantidade e tamanho de imagens
-    qtd_imagens = len(imagens_pagina)
+    Args:
+        dimensoes_imagens: Índice xref -> (largura, altura) do documento (de
+            indexar_dimensoes_imagens); se None, usa as dimensões de `imagens_pagina`
+    
+    Retorna: dict de sinais (números e booleanos, serializável em JSON)
+    """
+    # Quantidade e tamanho de imagens (dimensões pelo índice do documento,
+    # sem decodificar a imagem); screenshots costumam ser grandes
     imagens_grandes = 0
     imagens_medias = 0
-    
     for img in imagens_pagina:
-        # Obter dimensões da imagem
-        xref = img[0]
-        try:
-            base_image = documento.extract_image(xref)
-            width = base_image['width']
-            height = base_image['height']
-            
-            # Screenshots de telas geralmente têm dimensões específicas
-            if width > 500 and height > 300:
-                imagens_grandes += 1
-            elif width > 200 and height > 150:
-                imagens_medias += 1
-        except:
-            pass
-    
-    # 4. Verificar proporção texto/imagem
-    tamanho_pagina = pixmap.width * pixmap.height
-    razao_texto_imagem = len(texto_pagina) / max(tamanho_pagina / 1000, 1)
-    
-    # 5. Calcular pontuação e confiança
+        if dimensoes_imagens is not None and img[0] in dimensoes_imagens:
+            width, height = dimensoes_imagens[img[0]]
+        else:
+            width, height = img[2], img[3]
+        if width > 500 and height > 300:
+            imagens_grandes += 1
+        elif width > 200 and height > 150:
+            imagens_medias += 1
+    
+    # Proporção texto/imagem (área da página em pixels a DPI_IMAGENS,
+    # calculada pelo retângulo da página, sem renderizar)
+    escala = DPI_IMAGENS / 72
+    tamanho_pagina = (pagina.rect.width * escala) * (pagina.rect.height * escala)
+    
+    return {
+        'tamanho_texto': len(texto_pagina),
+        'marcadores': contar_marcadores_tela(texto_pagina.lower()),
+        'passos': _PADRAO_PASSOS.search(texto_pagina) is not None,
+        'normativo': _PADRAO_NORMATIVO.search(texto_pagina) is not None,
+        'qtd_imagens': len(imagens_pagina),
+        'imagens_grandes': imagens_grandes,
+        'imagens_medias': imagens_medias,
+        'razao_texto_imagem': len(texto_pagina) / max(tamanho_pagina / 1000, 1),
+    }
+
+def pontuar_heuristica(sinais, pesos=None):
+    """
+    Pontua os sinais de sinais_heuristica() com os pesos (PESOS_HEURISTICA
+    por padrão) e converte a pontuação em confiança.
+    
+    Retorna: (tem_tela: bool, confianca: float 0-1, razao: str)
+    """
+    pesos = pesos or PESOS_HEURISTICA
+    if not sinais['tamanho_texto'] and sinais['qtd_imagens'] == 0:
+        return (False, 1.0, "Página vazia")
+    
     pontuacao = 0
     razoes = []
     
-    # Marcadores de tela no texto (+0.3 por marcador, até +1.5)
-    if marcadores_encontrados > 0:
-        pontos_marcadores = min(marcadores_encontrados * 0.3, 1.5)
-        pontuacao += pontos_marcadores
-        razoes.append(f"{marcadores_encontrados} marcadores de tela no texto")
+    # Marcadores de tela no texto
+    if sinais['marcadores'] > 0:
+        pontuacao += min(sinais['marcadores'] * pesos['marcador'], pesos['max_marcadores'])
+        razoes.append(f"{sinais['marcadores']} marcadores de tela no texto")
     
-    # Instruções passo a passo (+0.8)
-    if tem_passos:
-        pontuacao += 0.8
+    # Instruções passo a passo
+    if sinais['passos']:
+        pontuacao += pesos['passos']
         razoes.append("instruções passo a passo")
     
-    # Imagens grandes (screenshots) (+0.5 cada, até +1.5)
-    if imagens_grandes > 0:
-        pontos_imagens = min(imagens_grandes * 0.5, 1.5)
-        pontuacao += pontos_imagens
-        razoes.append(f"{imagens_grandes} imagem(ns) grande(s) (possível screenshot)")
-    
-    # Múltiplas imagens médias (+0.3 cada, até +1.0)
-    if imagens_medias >= 2:
-        pontos_medias = min((imagens_medias - 1) * 0.3, 1.0)
-        pontuacao += pontos_medias
-        razoes.append(f"{imagens_medias} imagens médias")
-    
-    # Proporção texto baixa + imagens (+0.4)
-    if razao_texto_imagem < 0.1 and qtd_imagens > 0:
-        pontuacao += 0.4
+    # Imagens grandes (screenshots)
+    if sinais['imagens_grandes'] > 0:
+        pontuacao += min(sinais['imagens_grandes'] * pesos['imagem_grande'], pesos['max_imagens_grandes'])
+        razoes.append(f"{sinais['imagens_grandes']} imagem(ns) grande(s) (possível screenshot)")
+    
+    # Múltiplas imagens médias
+    if sinais['imagens_medias'] >= 2:
+        pontuacao += min((sinais['imagens_medias'] - 1) * pesos['imagem_media'], pesos['max_imagens_medias'])
+        razoes.append(f"{sinais['imagens_medias']} imagens médias")
+    
+    # Proporção texto baixa + imagens
+    if sinais['razao_texto_imagem'] < 0.1 and sinais['qtd_imagens'] > 0:
+        pontuacao += pesos['proporcao_baixa']
         razoes.append("baixa proporção texto/imagem")
     
-    # 6. Penalidades (indicam texto puro)
-    # Muito texto sem marcadores (-1.0)
-    if len(texto_pagina) > 2000 and marcadores_encontrados == 0:
-        pontuacao -= 1.0
+    # Penalidades (indicam texto puro)
+    # Muito texto sem marcadores
+    if sinais['tamanho_texto'] > 2000 and sinais['marcadores'] == 0:
+        pontuacao += pesos['texto_sem_marcadores']
         razoes.append("muito texto sem marcadores de tela")
     
-    # Artigos, parágrafos, incisos (documento normativo) (-1.5)
-    if any(marker in texto_pagina for marker in ['Art. ', '§ ', 'Parágrafo', 'CAPÍTULO', 'Seção']):
-        if marcadores_encontrados < 3:  # Poucos marcadores de tela
-            pontuacao -= 1.5
-            razoes.append("padrão de documento normativo")
+    # Artigos, parágrafos, incisos (documento normativo), com poucos marcadores de tela
+    if sinais['normativo'] and sinais['marcadores'] < 3:
+        pontuacao += pesos['normativo']
+        razoes.append("padrão de documento normativo")
     
-    # Nenhuma imagem (-0.5)
-    if qtd_imagens == 0 and len(texto_pagina) > 500:
-        pontuacao -= 0.5
+    # Nenhuma imagem
+    if sinais['qtd_imagens'] == 0 and sinais['tamanho_texto'] > 500:
+        pontuacao += pesos['sem_imagem']
         razoes.append("nenhuma imagem")
     
     # Normalizar pontuação para 0-1 (confiança)
@@ -185,398 +388,1592 @@ def detectar_se_tem_tela_heuristica(texto_pagina, imagens_pagina, pixmap, docume
     
     return (tem_tela, confianca, razao_str)
 
-def confirmar_com_vision_flash(model, pixmap):
+def detectar_se_tem_tela_heuristica(texto_pagina, imagens_pagina, pagina, dimensoes_imagens=None, pesos=None):
+    """
+    Detecta se a página contém telas de sistema usando heurísticas locais (sem API).
+    
+    Retorna: (tem_tela: bool, confianca: float 0-1, razao: str)
+    """
+    return pontuar_heuristica(sinais_heuristica(texto_pagina, imagens_pagina, pagina, dimensoes_imagens), pesos)
+
+def rotear_pagina(tem_tela, confianca, parametros=None):
+    """
+    Destino da página segundo a heurística: 'vision' (tela com confiança
+    alta), 'texto' (sem tela com confiança alta, ou confiança muito baixa)
+    ou 'ambigua' (classificador local e/ou confirmação com Vision Flash).
+    
+    `parametros` (de carregar_parametros_heuristica) define os limiares;
+    sem ele, LIMIAR_ALTO e LIMIAR_BAIXO.
+    """
+    limiar_alto = parametros['limiar_alto'] if parametros else LIMIAR_ALTO
+    limiar_baixo = parametros['limiar_baixo'] if parametros else LIMIAR_BAIXO
+    if confianca >= limiar_alto:  # Alta confiança
+        return 'vision' if tem_tela else 'texto'
+    if confianca >= limiar_baixo:  # Confiança média (ambíguo)
+        return 'ambigua'
+    return 'texto'  # Confiança muito baixa - provavelmente texto puro
+
+def renderizar_pagina(pagina, lado_maximo, dpi_maximo=DPI_IMAGENS):
+    """
+    Renderiza a página diretamente na resolução-alvo.
+    
+    Usa o zoom que faz o maior lado caber em `lado_maximo` pixels, sem
+    passar de `dpi_maximo` (evita renderizar a 150 DPI e depois reduzir).
+    """
+    maior_lado = max(pagina.rect.width, pagina.rect.height)
+    zoom = min(dpi_maximo / 72, lado_maximo / maior_lado)
+    return pagina.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+
+def _unir_retangulos(retangulos):
+    """Une os retângulos que se sobrepõem (ex.: captura dividida em faixas)"""
+    unidos = []
+    for retangulo in retangulos:
+        retangulo = fitz.Rect(retangulo)
+        sobrepostos = [r for r in unidos if r.intersects(retangulo)]
+        for r in sobrepostos:
+            unidos.remove(r)
+            retangulo |= r
+        unidos.append(retangulo)
+    return unidos
+
+def renderizar_recortes(pagina, lado_maximo=LADO_MAX_RECORTE):
+    """
+    Renderiza apenas as regiões das capturas de tela embutidas na página.
+    
+    As capturas são as imagens com ao menos LARGURA_MIN_RECORTE x
+    ALTURA_MIN_RECORTE pixels (get_image_info); imagens sobrepostas viram
+    um único recorte. Cada região é renderizada (com setas e números
+    desenhados por cima) na resolução nativa da imagem, sem passar de
+    `lado_maximo`, nem ficar abaixo de DPI_IMAGENS.
+    
+    Retorna: lista de pixmaps em ordem de leitura (vazia se não houver
+    capturas ou se passarem de MAX_RECORTES_PAGINA: nesse caso, a página
+    inteira deve ser enviada)
+    """
+    regioes = []
+    for info in pagina.get_image_info():
+        if info['width'] < LARGURA_MIN_RECORTE or info['height'] < ALTURA_MIN_RECORTE:
+            continue
+        caixa = fitz.Rect(info['bbox']) & pagina.rect
+        if caixa.is_empty:
+            continue
+        # Pixels da imagem por ponto da página (resolução nativa)
+        regioes.append((caixa, max(info['width'] / caixa.width, info['height'] / caixa.height)))
+    
+    recortes = _unir_retangulos([caixa for caixa, _ in regioes])
+    if len(recortes) > MAX_RECORTES_PAGINA:
+        return []
+    
+    pixmaps = []
+    for recorte in sorted(recortes, key=lambda r: (round(r.y0), r.x0)):
+        nativo = max(zoom for caixa, zoom in regioes if recorte.contains(caixa))
+        zoom = min(max(nativo, DPI_IMAGENS / 72), lado_maximo / max(recorte.width, recorte.height))
+        pixmaps.append(pagina.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=recorte))
+    return pixmaps
+
+def captura_para_indice(pagina):
+    """
+    Imagem PIL da única captura de tela embutida na página, para o índice
+    de telas (--deduplicar). None se a página não tiver exatamente uma
+    captura isolável: sem ela, páginas diferentes com o mesmo cabeçalho,
+    texto e rodapé pareceriam a mesma tela.
+    """
+    recortes = renderizar_recortes(pagina, LADO_CAPTURA_INDICE)
+    if len(recortes) != 1:
+        return None
+    return Image.frombytes("RGB", (recortes[0].width, recortes[0].height), recortes[0].samples)
+
+def preparar_imagem(pixmap, formato=FORMATO_IMAGEM_ENVIO, qualidade=QUALIDADE_IMAGEM_ENVIO):
+    """
+    Prepara a imagem de uma página para envio ao Gemini.
+    
+    Monta a imagem PIL diretamente do buffer de amostras do pixmap (sem
+    codificar e decodificar PNG) e calcula o hash dos pixels, usado como
+    chave do cache. A codificação para envio é feita uma única vez, sob
+    demanda, por obter_parte_imagem(). Depois disso o pixmap pode ser liberado.
+    
+    Retorna: dict com 'imagem', 'hash_pixels', 'formato' e 'qualidade'
+    """
+    modo = {1: "L", 3: "RGB", 4: "RGBA"}[pixmap.n]
+    amostras = pixmap.samples_mv
+    
+    imagem = Image.frombytes(modo, (pixmap.width, pixmap.height), amostras, "raw", modo, pixmap.stride)
+    hash_pixels = hashlib.sha256(f"{pixmap.width}x{pixmap.height}x{pixmap.n}\0".encode('ascii'))
+    hash_pixels.update(amostras)
+    
+    return {
+        'imagem': imagem,
+        'hash_pixels': hash_pixels.hexdigest(),
+        'formato': formato,
+        'qualidade': qualidade,
+        'parte': None,
+        '_lock': threading.Lock(),
+    }
+
+def obter_parte_imagem(imagem_preparada):
+    """
+    Retorna a parte (blob) da imagem para a requisição, codificando-a
+    apenas na primeira chamada; os retries reaproveitam os mesmos bytes.
+    """
+    with imagem_preparada['_lock']:
+        if imagem_preparada['parte'] is None:
+            formato = imagem_preparada['formato'].lower()
+            imagem = imagem_preparada['imagem']
+            buffer = io.BytesIO()
+            if formato == "png":
+                imagem.save(buffer, format="PNG", compress_level=1)
+            elif formato == "webp":
+                imagem.save(buffer, format="WEBP", quality=imagem_preparada['qualidade'], method=0)
+            else:
+                formato = "jpeg"
+                imagem.convert("RGB").save(buffer, format="JPEG", quality=imagem_preparada['qualidade'])
+            
+            imagem_preparada['parte'] = {'mime_type': f"image/{formato}", 'data': buffer.getvalue()}
+            # Os bytes codificados substituem a imagem decodificada em memória
+            imagem_preparada['imagem'] = None
+        
+        return imagem_preparada['parte']
+
+def preparar_imagem_analise(pagina, recortar_telas=False):
+    """
+    Prepara a imagem enviada à análise completa: a página renderizada em
+    LADO_MAX_ANALISE ou, com `recortar_telas`, as capturas embutidas
+    (lista, se houver mais de uma).
+    
+    Retorna: (imagem ou lista de imagens de preparar_imagem(), recortada: bool)
+    """
+    recortes = [preparar_imagem(pixmap) for pixmap in renderizar_recortes(pagina)] if recortar_telas else []
+    if recortes:
+        return (recortes if len(recortes) > 1 else recortes[0]), True
+    return preparar_imagem(renderizar_pagina(pagina, LADO_MAX_ANALISE)), False
+
+def requisicao_analise(imagem):
+    """
+    Prompt e hash dos pixels da análise de uma imagem (ou lista de capturas),
+    que compõem a chave do cache.
+    
+    Retorna: (lista de imagens, prompt, hash_pixels)
+    """
+    imagens = imagem if isinstance(imagem, list) else [imagem]
+    prompt = PROMPT_VISION if len(imagens) == 1 else PROMPT_VISION + "\n\n" + PROMPT_VISION_RECORTES
+    return imagens, prompt, "+".join(img['hash_pixels'] for img in imagens)
+
+def montar_partes_analise(imagens):
+    """Partes da requisição de análise: prompt e imagem(ns), codificadas sob demanda"""
+    partes = [PROMPT_VISION]
+    if len(imagens) == 1:
+        partes.append(obter_parte_imagem(imagens[0]))
+    else:
+        partes.append(PROMPT_VISION_RECORTES)
+        for indice, img in enumerate(imagens, 1):
+            partes.extend([f"Captura {indice} de {len(imagens)}:", obter_parte_imagem(img)])
+    return partes
+
+def chamar_gemini(model, partes, tipo, limitador=None, metricas=None, configuracao=None):
+    """
+    Chama generate_content respeitando o limitador de taxa e registra nas
+    métricas (se informadas) a espera, a chamada, os bytes de imagem
+    enviados e os tokens informados na resposta.
+    
+    O resultado é informado ao limitador (ControleTaxa), que ajusta a taxa
+    e o disjuntor. Com o circuito aberto, levanta CircuitoAberto sem chamar a API.
+    `configuracao` é o generation_config da chamada (ex.: esquema de resposta).
+    """
+    if limitador:
+        espera = limitador.adquirir()
+        if metricas:
+            metricas.registrar_espera('limitador', espera)
+    
+    bytes_enviados = sum(len(parte['data']) for parte in partes if isinstance(parte, dict))
+    try:
+        if configuracao:
+            response = model.generate_content(partes, generation_config=configuracao)
+        else:
+            response = model.generate_content(partes)
+    except Exception as e:
+        if limitador:
+            limitador.registrar_falha(classificar_erro(e), atraso_servidor(e))
+        if metricas:
+            metricas.registrar_chamada(tipo, bytes_enviados, erro=True)
+        raise
+    if limitador:
+        limitador.registrar_sucesso()
+    if metricas:
+        metricas.registrar_chamada(tipo, bytes_enviados, response)
+    return response
+
+def confirmar_com_vision_flash(model, imagem, limitador=None, cache=None, metricas=None):
     """
     Confirma se há tela usando Vision Flash (rápido e barato).
     Usado apenas em casos ambíguos.
     
+    `imagem` é o resultado de preparar_imagem(). Se `cache` for informado,
+    o veredito SIM/NÃO é reaproveitado para páginas com os mesmos pixels.
+    
     Retorna: (tem_tela: bool, erro: str)
     """
+    chave_cache = None
+    if cache:
+        chave_cache = cache.chave(imagem['hash_pixels'], PROMPT_DETECCAO_TELA, MODELO_VISION)
+        em_cache = cache.obter(chave_cache)
+        if em_cache is not None:
+            return (em_cache['tem_tela'], None)
+    
     try:
-        # Converter pixmap para PIL Image
-        img_bytes = pixmap.tobytes("png")
-        img = Image.open(io.BytesIO(img_bytes))
-        
-        # Redimensionar se necessário (para detecção rápida, menor resolução)
-        if img.width > 800 or img.height > 800:
-            img.thumbnail((800, 800), Image.Resampling.LANCZOS)
+        parte_imagem = obter_parte_imagem(imagem)
         
         # Chamar Gemini Vision Flash apenas para SIM/NÃO
-        response = model.generate_content([PROMPT_DETECCAO_TELA, img])
+        response = chamar_gemini(model, [PROMPT_DETECCAO_TELA, parte_imagem], 'deteccao', limitador, metricas)
         resposta = response.text.strip().upper()
         
         # Verificar resposta
-        if "SIM" in resposta:
-            return (True, None)
-        else:
-            return (False, None)
+        tem_tela = "SIM" in resposta
+        if cache:
+            cache.salvar(chave_cache, {'tem_tela': tem_tela})
+        return (tem_tela, None)
             
     except Exception as e:
         return (None, str(e))
 
+def interpretar_veredictos_lote(texto):
+    """
+    Extrai os veredictos da resposta da detecção em lote.
+    
+    Retorna: dict número da página (rótulo, começa em 1) -> tem_tela (bool);
+    itens malformados são ignorados
+    """
+    try:
+        dados, _ = interpretar_json(texto)
+    except ValueError:
+        return {}
+    
+    itens = dados.get('paginas', []) if isinstance(dados, dict) else dados
+    veredictos = {}
+    for item in itens if isinstance(itens, list) else []:
+        if not isinstance(item, dict):
+            continue
+        pagina, tem_tela = item.get('pagina'), item.get('tem_tela')
+        if isinstance(tem_tela, str):
+            tem_tela = {'SIM': True, 'TRUE': True, 'NÃO': False, 'NAO': False, 'FALSE': False}.get(
+                tem_tela.strip().upper()
+            )
+        try:
+            pagina = int(pagina)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(tem_tela, bool):
+            veredictos[pagina] = tem_tela
+    return veredictos
+
+def confirmar_lote_com_vision_flash(model, paginas, limitador=None, cache=None, metricas=None):
+    """
+    Confirma várias páginas ambíguas com uma única requisição ao Vision Flash.
+    
+    Envia as miniaturas rotuladas ("Página N") e espera um veredicto por
+    página em JSON. Páginas já em cache não são enviadas; páginas ausentes
+    de uma resposta malformada (ou todas, se a requisição falhar) são
+    confirmadas individualmente com confirmar_com_vision_flash().
+    
+    Args:
+        paginas: lista de (num_pagina, imagem), com num_pagina começando em 0
+            e imagem vinda de preparar_imagem()
+    
+    Retorna: dict num_pagina -> (tem_tela: bool, erro: str)
+    """
+    resultados = {}
+    chaves = {}
+    a_enviar = []
+    for num_pagina, imagem in paginas:
+        if cache:
+            chaves[num_pagina] = cache.chave(imagem['hash_pixels'], PROMPT_DETECCAO_TELA, MODELO_VISION)
+            em_cache = cache.obter(chaves[num_pagina])
+            if em_cache is not None:
+                resultados[num_pagina] = (em_cache['tem_tela'], None)
+                continue
+        a_enviar.append((num_pagina, imagem))
+    
+    veredictos = {}
+    if len(a_enviar) > 1:
+        partes = [PROMPT_DETECCAO_TELA_LOTE]
+        for num_pagina, imagem in a_enviar:
+            partes.extend([f"Página {num_pagina + 1}:", obter_parte_imagem(imagem)])
+        try:
+            response = chamar_gemini(model, partes, 'deteccao_lote', limitador, metricas,
+                                     CONFIG_GERACAO_DETECCAO_LOTE)
+            veredictos = interpretar_veredictos_lote(response.text)
+        except Exception:
+            veredictos = {}
+    
+    for num_pagina, imagem in a_enviar:
+        tem_tela = veredictos.get(num_pagina + 1)
+        if tem_tela is None:
+            # Fora da resposta (ou lote de uma página só): requisição individual
+            resultados[num_pagina] = confirmar_com_vision_flash(model, imagem, limitador, cache, metricas)
+            continue
+        if cache:
+            cache.salvar(chaves[num_pagina], {'tem_tela': tem_tela})
+        resultados[num_pagina] = (tem_tela, None)
+    
+    return resultados
+
 def configurar_gemini():
     """Configura o Gemini API"""
     genai.configure(api_key=config.GEMINI_API_KEY)
     return genai.GenerativeModel(MODELO_VISION)
 
-def processar_tela_com_retry(model, pixmap_image, max_retries=MAX_RETRIES):
-    """Processa uma tela com retry logic"""
+def processar_tela_com_retry(model, imagem, max_retries=MAX_RETRIES, limitador=None, cache=None,
+                             metricas=None):
+    """
+    Processa uma tela com retry logic
     
+    `imagem` é o resultado de preparar_imagem() (ou uma lista deles, as
+    capturas recortadas de uma página, enviadas como partes da mesma
+    requisição); a imagem é codificada uma
+    única vez e reaproveitada em todas as tentativas. Se `cache` for
+    informado, a análise já obtida para uma página com os mesmos pixels
+    (mesmo modelo e prompt) é reaproveitada sem chamar a API. O tempo
+    parado no backoff entre tentativas é registrado em `metricas`.
+    
+    Os erros são classificados por tipo/status (classificar_erro). Com um
+    ControleTaxa, o 429 pausa todas as requisições pelo atraso pedido
+    pelo servidor e a nova tentativa só aguarda o limitador; erros
+    temporários esperam backoff com jitter; erros permanentes não são
+    repetidos; com o circuito aberto, a página desiste imediatamente.
+    
+    A resposta segue ESQUEMA_ANALISE_VISION (structured output) e é lida
+    com interpretar_json(), que repara JSON cortado ou malformado sem nova
+    chamada; só uma resposta sem JSON recuperável é pedida de novo, após
+    backoff com jitter. Uma resposta barrada pelos filtros do Gemini
+    (motivo_bloqueio) é erro permanente e não é repetida.
+    """
+    def esperar(delay):
+        if metricas:
+            metricas.registrar_espera('backoff', delay)
+        time.sleep(delay)
+    
+    imagens, prompt, hash_pixels = requisicao_analise(imagem)
+    
+    chave_cache = None
+    if cache:
+        chave_cache = cache.chave(hash_pixels, prompt, MODELO_VISION)
+        em_cache = cache.obter(chave_cache)
+        if em_cache is not None:
+            return em_cache['analise_vision'], None
+    
+    pausa_global = isinstance(limitador, ControleTaxa)
+    erro = "Máximo de tentativas excedido"
     for tentativa in range(max_retries):
         try:
-            # Converter pixmap para PIL Image
-            img_bytes = pixmap_image.tobytes("png")
-            img = Image.open(io.BytesIO(img_bytes))
-            
-            # Redimensionar se necessário
-            if img.width > 1500 or img.height > 1500:
-                img.thumbnail((1500, 1500), Image.Resampling.LANCZOS)
-            
-            # Chamar Gemini Vision
-            response = model.generate_content([PROMPT_VISION, img])
-            texto = response.text.strip()
+            # Chamar Gemini Vision (respeitando o limite de requisições por minuto),
+            # com a resposta no formato de ESQUEMA_ANALISE_VISION
+            response = chamar_gemini(model, montar_partes_analise(imagens), 'vision', limitador, metricas,
+                                     CONFIG_GERACAO_VISION)
             
-            # Limpar markdown
-            if "```json" in texto:
-                texto = texto.split("```json")[1].split("```")[0].strip()
-            elif "```" in texto:
-                texto = texto.split("```")[1].split("```")[0].strip()
+            # Conteúdo barrado pelos filtros não muda numa nova tentativa
+            bloqueio = motivo_bloqueio(response)
+            if bloqueio:
+                if metricas:
+                    metricas.registrar_evento('resposta_bloqueada')
+                return None, bloqueio
             
-            # Parse JSON
-            analise = json.loads(texto)
+            # JSON cortado ou com defeitos de formatação é reparado localmente
+            analise, reparado = interpretar_json(response.text)
+            if not isinstance(analise, dict):
+                raise ValueError("resposta não é um objeto JSON")
+            if reparado and metricas:
+                metricas.registrar_evento('json_reparado')
+            if cache:
+                cache.salvar(chave_cache, {'analise_vision': analise})
             return analise, None  # Sucesso
-            
-        except json.JSONDecodeError as e:
+        
+        except CircuitoAberto as e:
+            return None, str(e)
+        
+        except ValueError as e:
+            # Resposta sem JSON recuperável (ou sem texto): nova tentativa
+            # após backoff, sem penalizar a taxa global
             erro = f"JSON inválido: {str(e)[:100]}"
+            if metricas:
+                metricas.registrar_evento('json_irrecuperavel')
             if tentativa < max_retries - 1:
-                delay = RETRY_DELAY_BASE * (2 ** tentativa)
-                time.sleep(delay)
-            else:
-                return None, erro
-                
+                esperar(backoff_com_jitter(RETRY_DELAY_BASE, tentativa))
+            continue
+        
         except Exception as e:
+            classe = classificar_erro(e)
             erro = str(e)[:100]
-            if "429" in erro or "quota" in erro.lower() or "rate" in erro.lower():
-                delay = 10 * (2 ** tentativa)
-                if tentativa < max_retries - 1:
-                    time.sleep(delay)
-                else:
-                    return None, f"Rate limit após {max_retries} tentativas"
-            else:
-                if tentativa < max_retries - 1:
-                    delay = RETRY_DELAY_BASE * (2 ** tentativa)
-                    time.sleep(delay)
-                else:
-                    return None, erro
+            if classe == 'permanente':
+                return None, erro
+            if classe == 'limite':
+                erro = f"Rate limit após {tentativa + 1} tentativa(s): {erro}"
+            if tentativa == max_retries - 1:
+                break
+            if classe == 'limite' and pausa_global:
+                # A pausa (Retry-After ou backoff) já vale para todas as
+                # requisições; a nova tentativa aguarda no limitador
+                continue
+            atraso = atraso_servidor(e)
+            esperar(atraso if atraso is not None else backoff_com_jitter(RETRY_DELAY_BASE, tentativa))
     
-    return None, "Máximo de tentativas excedido"
+    return None, erro
 
-def processar_pdf_completo(caminho_pdf, output_json, processar_telas=True):
+def montar_documento(num_pagina, texto_pagina, analise_vision, caminho_pdf):
+    """
+    Monta o documento final (chunk) de uma página a partir do texto extraído
+    e da análise visual (se houver).
+    
+    Retorna: dict do documento ou None se a página não tiver conteúdo
+    """
+    nome_base = os.path.splitext(os.path.basename(caminho_pdf))[0]
+    document_title = nome_base.replace('-', ' ').title()
+    
+    # Montar chunk_text combinado (priorizando texto com instruções)
+    chunk_text = ""
+    
+    # Priorizar texto extraído se já tiver instruções passo a passo
+    tem_instrucoes_texto = texto_pagina and (
+        any(marker in texto_pagina for marker in ['1. ', '2. ', '3. ', 'Passo ', 'Clicar em', 'Selecionar'])
+    )
+    
+    # Se há análise visual, usar para enriquecer ou substituir
+    if analise_vision:
+        titulo_tela = analise_vision.get('titulo_tela', '')
+        contexto = analise_vision.get('contexto', '')
+        instrucoes_nav = analise_vision.get('instrucoes_navegacao', [])
+        elementos = analise_vision.get('elementos_visiveis', [])
+        campos = analise_vision.get('campos_formulario', [])
+        observacoes = analise_vision.get('observacoes', '')
+        
+        # Se a análise visual gerou instruções, priorizar ela
+        if instrucoes_nav and isinstance(instrucoes_nav, list):
+            chunk_text = titulo_tela + "\n\n" if titulo_tela else ""
+            
+            if contexto:
+                chunk_text += f"{contexto}\n\n"
+            
+            # Adicionar instruções passo a passo (principal)
+            chunk_text += "\n".join(instrucoes_nav) + "\n\n"
+            
+            # Se texto extraído tem informações adicionais, adicionar
+            if texto_pagina and not tem_instrucoes_texto:
+                chunk_text += f"[Imagens da tela do sistema PETRVS com anotações]\n\n"
+                chunk_text += f"{texto_pagina}\n\n"
+            
+            # Adicionar campos do formulário se houver
+            if campos:
+                chunk_text += "**Campos do Formulário:**\n"
+                for campo in campos:
+                    nome = campo.get('nome', '')
+                    tipo = campo.get('tipo', '')
+                    obrig = "obrigatório" if campo.get('obrigatorio') else "opcional"
+                    formato = campo.get('formato', '')
+                    chunk_text += f"- {nome} ({tipo}, {obrig}"
+                    if formato:
+                        chunk_text += f", formato: {formato}"
+                    chunk_text += ")\n"
+                chunk_text += "\n"
+            
+            # Adicionar elementos visíveis da tela
+            if elementos:
+                chunk_text += "**Elementos da Tela:**\n"
+                for elem in elementos:
+                    nome = elem.get('nome', '')
+                    acao = elem.get('acao', '')
+                    local = elem.get('localizacao', '')
+                    chunk_text += f"- {nome}"
+                    if acao:
+                        chunk_text += f": {acao}"
+                    if local:
+                        chunk_text += f" ({local})"
+                    chunk_text += "\n"
+                chunk_text += "\n"
+            
+            if observacoes:
+                chunk_text += f"**Observações:** {observacoes}\n"
+                
+        else:
+            # Fallback: usar estrutura antiga se não houver instruções_navegacao
+            chunk_text = texto_pagina if texto_pagina else ""
+            if contexto:
+                chunk_text += f"\n\nContexto: {contexto}\n"
+    
+    # Se não há análise visual ou ela não gerou instruções, usar texto extraído
+    elif texto_pagina:
+        chunk_text = texto_pagina
+        if tem_instrucoes_texto:
+            # Adicionar marcador de imagem se houver instruções mas não análise visual
+            chunk_text = chunk_text.replace(
+                "[Imagem", "[Imagens da tela do sistema PETRVS com anotações]"
+            ) if "[Imagem" in chunk_text else f"[Imagens da tela do sistema PETRVS com anotações]\n\n{chunk_text}"
+    
+    # Se não há conteúdo, pular
+    if not chunk_text.strip():
+        return None
+    
+    # Criar documento final
+    doc_id = id_pagina(nome_base, num_pagina)
+    
+    # Determinar tipo de chunk (usar "contexto" para instruções de navegação)
+    if analise_vision:
+        # Se tem instruções de navegação, é contexto (como no JSON original)
+        instrucoes_nav = analise_vision.get('instrucoes_navegacao', [])
+        if instrucoes_nav:
+            chunk_type = "contexto"
+        else:
+            chunk_type = "interface"
+        task_title = analise_vision.get('titulo_tela', f'Página {num_pagina + 1}')
+    elif tem_instrucoes_texto:
+        # Texto com instruções também é contexto
+        chunk_type = "contexto"
+        # Extrair primeiro título do texto
+        linhas = texto_pagina.split('\n')[:3]
+        task_title = linhas[0].strip() if linhas else f'Página {num_pagina + 1}'
+        # Remover marcações de formatação
+        task_title = task_title.replace('**', '').strip()
+        if len(task_title) > 100:
+            task_title = task_title[:100] + "..."
+    else:
+        chunk_type = "texto"
+        # Extrair primeiro título/parágrafo do texto como task_title
+        linhas = texto_pagina.split('\n')[:3]
+        task_title = linhas[0].strip() if linhas else f'Página {num_pagina + 1}'
+        task_title = task_title.replace('**', '').strip()
+        if len(task_title) > 100:
+            task_title = task_title[:100] + "..."
+    
+    doc = {
+        'id': doc_id,
+        'chunk_text': chunk_text.strip(),
+        'document_title': document_title,
+        'source_file': os.path.basename(caminho_pdf),
+        'task_title': task_title,
+        'chunk_type': chunk_type,
+        'pagina': num_pagina + 1,
+        'num_palavras': len(chunk_text.split()),
+    }
+    
+    # Adicionar metadados de tela se houver
+    if analise_vision:
+        doc['tipo_tela'] = analise_vision.get('tipo_tela', 'N/A')
+        elementos_importantes = analise_vision.get('elementos_importantes', [])
+        campos_formulario = analise_vision.get('campos_formulario', [])
+        doc['num_elementos'] = len(elementos_importantes) + len(campos_formulario)
+        doc['tem_texto'] = bool(texto_pagina)
+        doc['tem_instrucoes_navegacao'] = bool(analise_vision.get('instrucoes_navegacao', []))
+    else:
+        doc['tem_texto'] = bool(texto_pagina)
+        doc['tem_instrucoes_navegacao'] = tem_instrucoes_texto
+    
+    return doc
+
+def extrair_pagina(documento, num_pagina, calcular_hash=False, heuristica=False,
+                   dimensoes_imagens=None, metricas=None, pesos=None):
+    """
+    Extrai de uma página o que não depende do Vision: texto, hash do
+    conteúdo (modo incremental) e resultado da heurística de telas.
+    
+    Retorna: dict com 'num_pagina', 'texto', 'hash_conteudo', 'sinais'
+    (de sinais_heuristica) e 'heuristica' ((tem_tela, confianca, razao)
+    com os `pesos`); os dois últimos são None sem `heuristica`
+    """
+    metricas = metricas or Metricas()
+    with metricas.medir('load_page', num_pagina):
+        pagina = documento.load_page(num_pagina)
+    with metricas.medir('get_text', num_pagina):
+        texto_pagina = pagina.get_text("text").strip()
+    
+    extraida = {'num_pagina': num_pagina, 'texto': texto_pagina, 'hash_conteudo': None,
+                'sinais': None, 'heuristica': None}
+    if calcular_hash:
+        with metricas.medir('hash_conteudo', num_pagina):
+            extraida['hash_conteudo'] = hash_conteudo_pagina(documento, pagina, texto_pagina)
+    if heuristica:
+        with metricas.medir('get_images', num_pagina):
+            imagens_pagina = pagina.get_images()
+        with metricas.medir('heuristica', num_pagina):
+            extraida['sinais'] = sinais_heuristica(texto_pagina, imagens_pagina, pagina, dimensoes_imagens)
+            extraida['heuristica'] = pontuar_heuristica(extraida['sinais'], pesos)
+    return extraida
+
+def extrair_intervalo(caminho_pdf, inicio, fim, calcular_hash=False, heuristica=False, pesos=None):
+    """
+    Executa extrair_pagina() nas páginas [inicio, fim) com um fitz.open
+    próprio (usado pelos processos da extração paralela).
+    
+    Retorna: lista dos dicts de extrair_pagina(), cada um com 'tempos'
+    (segundos por etapa, para as métricas do processo principal)
+    """
+    metricas = Metricas()
+    with fitz.open(caminho_pdf) as documento:
+        dimensoes_imagens = indexar_dimensoes_imagens(documento) if heuristica else None
+        extraidas = [
+            extrair_pagina(documento, num_pagina, calcular_hash, heuristica, dimensoes_imagens, metricas, pesos)
+            for num_pagina in range(inicio, fim)
+        ]
+    for extraida in extraidas:
+        extraida['tempos'] = metricas.paginas.get(extraida['num_pagina'], {})
+    return extraidas
+
+def processar_pdf_completo(caminho_pdf, output_json, processar_telas=True,
+                           concorrencia=VISION_CONCORRENCIA, rpm=VISION_RPM,
+                           cache_dir=CACHE_VISION_DIR, limitador=None, verboso=True,
+                           estatisticas=None, incremental=False, retomar=False,
+                           chunking=False, max_tokens=CHUNK_MAX_TOKENS,
+                           deteccao_lote=DETECCAO_LOTE_TAMANHO,
+                           classificador=MODELO_CLASSIFICADOR_TELAS, coletar_treino=None,
+                           metricas_prometheus=None, modelo=None, deduplicar=False,
+                           indice_telas=None, processos_extracao=1, recortar_telas=False,
+                           parametros_heuristica=ARQUIVO_PARAMETROS_HEURISTICA):
     """
     Processa um PDF completo: extrai texto, imagens e processa com Vision
     
+    As páginas roteadas ao Vision são enviadas a um pool de `concorrencia`
+    workers, limitado a `rpm` requisições por minuto (token bucket). Os
+    documentos são montados e salvos sempre na ordem das páginas.
+    
     Args:
         caminho_pdf: Caminho para o PDF
         output_json: Caminho para o JSON de saída
         processar_telas: Se True, processa telas com Gemini Vision
+        concorrencia: Número máximo de requisições Vision em paralelo
+        rpm: Limite de requisições Vision por minuto
+        cache_dir: Diretório do cache de resultados Vision (None desativa)
+        limitador: ControleTaxa externo (ex.: compartilhado no processamento em
+            lote); se None, cria um controle local com `rpm`
+        verboso: Se False, não imprime mensagens nem barra de progresso
+        estatisticas: dict opcional que recebe os contadores da detecção híbrida
+        incremental: Se True, reaproveita os registros das páginas inalteradas
+            desde a última execução (ver manifesto_incremental.py)
+        retomar: Com saída .jsonl, mantém os registros já gravados e continua a
+            partir da página seguinte à última gravada
+        chunking: Se True, divide páginas longas e junta páginas curtas em chunks
+            de até `max_tokens` (ver divisao_chunks.py)
+        max_tokens: Orçamento de tokens por chunk
+        deteccao_lote: Páginas ambíguas confirmadas por requisição ao Vision
+            Flash (miniaturas rotuladas); 1 confirma uma página por requisição
+        classificador: Modelo do classificador local de telas (JSON); se o
+            arquivo existir, decide as páginas ambíguas sem API e só as que
+            ficam em dúvida vão ao Vision Flash (None desativa)
+        coletar_treino: Arquivo JSONL onde gravar os vereditos do Vision com as
+            características das páginas, para treinar o classificador
+        metricas_prometheus: Arquivo .prom onde exportar as métricas da execução
+            (formato texto do Prometheus); None não exporta
+        modelo: Modelo já configurado (qualquer objeto com generate_content,
+            ex.: o Gemini simulado de benchmark.py); se None, configura o Gemini
+        deduplicar: Se True, reaproveita a análise Vision de telas quase
+            idênticas (hash perceptual) e colapsa chunks quase duplicados
+            (MinHash), ver deduplicacao.py
+        indice_telas: IndiceTelas externo (ex.: compartilhado no lote); se
+            None e `deduplicar`, cria um índice para este documento
+        processos_extracao: Processos que extraem texto, hash e heurística das
+            páginas em paralelo (cada um com o próprio fitz.open); 1 extrai no
+            processo principal. Só vale a partir de PAGINAS_MIN_EXTRACAO_PARALELA
+        recortar_telas: Se True, a análise recebe só as capturas de tela
+            embutidas na página (renderizar_recortes), na resolução nativa e
+            como partes da mesma requisição; sem capturas, vai a página inteira
+        parametros_heuristica: Arquivo JSON com pesos e limiares da heurística
+            (ver carregar_parametros_heuristica); se não existir, os padrões
+    
+    Se `output_json` terminar em .jsonl, cada registro é gravado (com flush)
+    assim que a página é montada, em vez de uma lista JSON ao final.
+    
+    Com chunking (ou deduplicação), os registros por página são gravados em
+    streaming em <saida>.paginas.jsonl (base para --retomar e --incremental)
+    e a saída final, com os chunks, é gerada ao término.
+    
+    Tempos por etapa e por página, chamadas à API, bytes enviados, tokens e
+    esperas são gravados em <saida>.relatorio.json (ver metricas.py).
     """
-    print("="*80)
-    print("PROCESSAMENTO COMPLETO DE PDF")
-    print("="*80)
-    print(f"\n📄 PDF: {os.path.basename(caminho_pdf)}")
-    print(f"📁 Saída: {output_json}")
-    print(f"🖼️  Processar telas: {'Sim' if processar_telas else 'Não'}\n")
+    log = print if verboso else (lambda *args, **kwargs: None)
+    metricas = Metricas()
+    
+    log("="*80)
+    log("PROCESSAMENTO COMPLETO DE PDF")
+    log("="*80)
+    log(f"\n📄 PDF: {os.path.basename(caminho_pdf)}")
+    log(f"📁 Saída: {output_json}")
+    log(f"🖼️  Processar telas: {'Sim' if processar_telas else 'Não'}")
+    log(f"✂️  Chunking: {f'até {max_tokens} tokens' if chunking else 'Não (um registro por página)'}\n")
     
     # Abrir PDF
     documento = fitz.open(caminho_pdf)
     total_paginas = len(documento)
     
     if total_paginas == 0:
-        print("❌ PDF vazio!")
+        log("❌ PDF vazio!")
         documento.close()
         return
     
-    print(f"📊 Total de páginas: {total_paginas}\n")
+    log(f"📊 Total de páginas: {total_paginas}\n")
     
     # Configurar Gemini se necessário
     modelo_vision = None
+    cache = None
     if processar_telas:
-        print("Configurando Gemini Vision...")
-        modelo_vision = configurar_gemini()
-        print(f"✅ Modelo: {MODELO_VISION}\n")
+        log("Configurando Gemini Vision...")
+        modelo_vision = modelo or configurar_gemini()
+        if limitador is None:
+            limitador = ControleTaxa(rpm, capacidade=concorrencia)
+        log(f"✅ Modelo: {MODELO_VISION}")
+        log(f"⚙️  Concorrência: {concorrencia} | Limite: {limitador.rpm} req/min")
+        if cache_dir:
+            cache = CacheVision(cache_dir)
+            log(f"💾 Cache Vision: {cache_dir}")
+        log()
+    
+    # Classificador local das páginas ambíguas (se houver modelo treinado)
+    classificador_local = ClassificadorTelas.carregar(classificador) if modelo_vision else None
+    if classificador_local:
+        log(f"🧠 Classificador local de telas: {classificador}\n")
+    coletar_treino = coletar_treino if modelo_vision else None
+    
+    # Índice de telas já analisadas (hash perceptual), para reaproveitar a análise
+    if deduplicar and modelo_vision and indice_telas is None:
+        indice_telas = IndiceTelas()
+    indice_telas = indice_telas if deduplicar and modelo_vision else None
+    
+    # Dimensões das imagens do documento (para a heurística), lidas uma única vez
+    # (no modo paralelo, cada processo de extração lê as suas)
+    dimensoes_imagens = None
+    if modelo_vision and processos_extracao <= 1:
+        with metricas.medir('indice_imagens'):
+            dimensoes_imagens = indexar_dimensoes_imagens(documento)
+    
+    # Registros por página: na própria saída ou, se houver pós-processamento
+    # (chunking, deduplicação), em arquivo à parte
+    pos_processar = chunking or deduplicar
+    saida_paginas = caminho_paginas(output_json) if pos_processar else output_json
     
-    # Extrair nome do documento
+    # Configuração que altera os registros por página (roteamento e Vision)
+    parametros = carregar_parametros_heuristica(parametros_heuristica)
+    configuracao_registros = {
+        'processar_telas': processar_telas,
+        'recortar_telas': recortar_telas,
+        'deduplicar': deduplicar,
+        'parametros_heuristica': parametros,
+        'classificador': hash_arquivo(classificador) if classificador_local else None,
+    }
+    
+    # Modo incremental: manifesto e registros da execução anterior
     nome_base = os.path.splitext(os.path.basename(caminho_pdf))[0]
-    document_title = nome_base.replace('-', ' ').title()
+    manifesto = None
+    paginas_anteriores = {}
+    registros_anteriores = {}
+    paginas_manifesto = {}
+    if incremental:
+        arquivo_manifesto = caminho_manifesto(output_json)
+        manifesto = carregar_manifesto(arquivo_manifesto)
+        # Mudanças de configuração invalidam os registros anteriores
+        alteradas = [chave for chave, valor in configuracao_registros.items() if manifesto.get(chave) != valor]
+        if alteradas and manifesto.get('paginas'):
+            log(f"⚠️  Configuração alterada ({', '.join(alteradas)}): todas as páginas serão reprocessadas")
+        if not alteradas and os.path.exists(saida_paginas):
+            paginas_anteriores = manifesto.get('paginas', {})
+            registros_anteriores = {doc['id']: doc for doc in ler_registros(saida_paginas)}
+        log(f"♻️  Modo incremental: {len(paginas_anteriores)} página(s) no manifesto anterior\n")
+    
+    def obter_registros_inalterados(num_pagina, hash_conteudo):
+        """Registros anteriores da página, se ela não mudou (senão None)"""
+        anterior = paginas_anteriores.get(id_pagina(nome_base, num_pagina))
+        if not anterior or anterior['hash_conteudo'] != hash_conteudo:
+            return None
+        if not all(i in registros_anteriores for i in anterior['ids']):
+            return None
+        return [registros_anteriores[i] for i in anterior['ids']]
+    
+    # Saída JSONL: grava cada registro assim que a página é montada
+    escritor = EscritorJSONL(saida_paginas, retomar) if eh_jsonl(saida_paginas) else None
+    pagina_inicial = 0
+    if escritor and escritor.registros_existentes:
+        pagina_inicial = escritor.ultima_pagina
+        log(f"⏯️  Retomando após a página {pagina_inicial} "
+            f"({len(escritor.registros_existentes)} registro(s) já gravados)\n")
     
     # Processar cada página
-    documentos = []
-    sucessos_vision = 0
-    erros_vision = 0
-    paginas_com_tela = 0
-    paginas_sem_tela = 0
-    paginas_ambigua_confirmada = 0
-    paginas_ambigua_rejeitada = 0
-    
-    print("Processando páginas...")
-    print("-"*80)
-    
-    for num_pagina in tqdm(range(total_paginas), desc="Processando", unit="página"):
+    documentos = list(escritor.registros_existentes) if escritor else []
+    
+    # Retomada no modo incremental: as páginas já gravadas não passam pelo
+    # laço, então suas entradas do manifesto são refeitas a partir dos
+    # registros mantidos (sem hash se o Vision ficou pendente)
+    if manifesto is not None and pagina_inicial:
+        registros_por_pagina = {}
+        for doc in documentos:
+            registros_por_pagina.setdefault(doc['pagina'] - 1, []).append(doc)
+        for num_pagina in range(min(pagina_inicial, len(documento))):
+            mantidos = registros_por_pagina.get(num_pagina, [])
+            pendente = any(doc.get('vision_pendente') for doc in mantidos)
+            paginas_manifesto[id_pagina(nome_base, num_pagina)] = {
+                'hash_conteudo': None if pendente else extrair_pagina(documento, num_pagina, True)['hash_conteudo'],
+                'ids': [doc['id'] for doc in mantidos],
+            }
+    
+    def registrar(doc):
+        documentos.append(doc)
+        if escritor:
+            escritor.escrever(doc)
+
+    if estatisticas is None:
+        estatisticas = {}
+    estatisticas.update({
+        'total_paginas': total_paginas,
+        'sucessos_vision': 0,
+        'erros_vision': 0,
+        'paginas_com_tela': 0,
+        'paginas_sem_tela': 0,
+        'paginas_ambigua_confirmada': 0,
+        'paginas_ambigua_rejeitada': 0,
+        'paginas_reaproveitadas': 0,
+        'requisicoes_deteccao_lote': 0,
+        'paginas_ambigua_local_sim': 0,
+        'paginas_ambigua_local_nao': 0,
+        'paginas_vision_pendente': 0,
+        'paginas_tela_repetida': 0,
+        'paginas_recortadas': 0,
+        'chunks_colapsados': 0,
+    })
+    
+    log("Processando páginas...")
+    log("-"*80)
+    
+    barra = tqdm(total=total_paginas, initial=pagina_inicial, desc="Processando", unit="página",
+                 disable=not verboso)
+    
+    # Páginas aguardando o Vision, na ordem do documento. Cada item guarda os
+    # futuros da confirmação (Vision Flash) e da análise completa.
+    pendentes = deque()
+    # Limita as páginas renderizadas em memória aguardando o pool
+    max_pendentes = max(1, concorrencia) * 2
+    # Páginas ambíguas acumuladas para a próxima detecção em lote
+    lote_deteccao = []
+    # Telas enviadas ao Vision neste documento (hash perceptual -> origem, futuro)
+    telas_em_voo = {}
+    if deteccao_lote > 1:
+        max_pendentes += deteccao_lote
+    
+    def coletar_amostra(item, tem_tela, origem):
+        """Grava o veredito do Vision como amostra de treino do classificador"""
+        if coletar_treino and item.get('caracteristicas') is not None:
+            registrar_amostra(coletar_treino, {
+                'id': id_pagina(nome_base, item['num_pagina']),
+                'source_file': os.path.basename(caminho_pdf),
+                'pagina': item['num_pagina'] + 1,
+                'tem_tela': bool(tem_tela),
+                'origem': origem,
+                'caracteristicas': item['caracteristicas'],
+                'sinais': item.get('sinais'),
+            })
+    
+    def renderizar(pagina, num_pagina, lado_maximo):
+        """Renderiza e prepara a imagem da página (na thread principal)"""
+        with metricas.medir('renderizacao', num_pagina):
+            return preparar_imagem(renderizar_pagina(pagina, lado_maximo))
+    
+    def calcular_caracteristicas(item, imagem):
+        with metricas.medir('caracteristicas', item['num_pagina']):
+            item['caracteristicas'] = extrair_caracteristicas(imagem['imagem'], item['confianca'])
+    
+    def submeter_analise(executor, item):
+        """
+        Renderiza a página na resolução de análise e envia ao pool. Com o
+        circuito aberto, a página não é enviada e fica marcada como pendente.
+        """
+        if limitador.circuito_aberto():
+            item['vision_pendente'] = True
+            return None
+        # A renderização fica na thread principal (PyMuPDF não é thread-safe)
+        num_pagina = item['num_pagina']
         pagina = documento.load_page(num_pagina)
+        with metricas.medir('recorte' if recortar_telas else 'renderizacao', num_pagina):
+            imagem, recortada = preparar_imagem_analise(pagina, recortar_telas)
+        if recortada:
+            estatisticas['paginas_recortadas'] += 1
+        if coletar_treino and item.get('caracteristicas') is None:
+            # As características vêm sempre da miniatura da página inteira, a
+            # mesma resolução usada ao classificar as páginas ambíguas
+            calcular_caracteristicas(item, renderizar(pagina, num_pagina, LADO_MAX_MINIATURA_LOTE))
         
-        # 1. Extrair texto
-        texto_pagina = pagina.get_text("text").strip()
-        
-        # 2. Extrair imagens da página
-        imagens_pagina = pagina.get_images()
+        # O índice de telas compara a captura embutida, não a página inteira;
+        # páginas sem exatamente uma captura (ou com várias enviadas na
+        # mesma requisição) não entram nele
+        captura = None
+        if indice_telas is not None and not isinstance(imagem, list):
+            with metricas.medir('hash_perceptual', num_pagina):
+                captura = captura_para_indice(pagina)
+                if captura is not None:
+                    hash_tela = dhash(captura)
+                    miniatura = miniatura_tela(captura)
+        if captura is None:
+            return executor.submit(
+                metricas.cronometrar, 'vision', num_pagina,
+                processar_tela_com_retry, modelo_vision, imagem,
+                limitador=limitador, cache=cache, metricas=metricas,
+            )
         
-        # 3. Converter página em imagem (pixmap)
-        pixmap = pagina.get_pixmap(dpi=DPI_IMAGENS)
+        # Tela quase idêntica a uma já analisada (neste ou em outro documento
+        # do lote) ou em análise neste documento: reaproveita a análise
+        origem = f"{os.path.basename(caminho_pdf)}:{num_pagina + 1}"
+        conhecida = indice_telas.buscar(hash_tela, miniatura)
+        if conhecida is not None:
+            item['tela_repetida_de'] = conhecida['origem']
+            futuro = Future()
+            futuro.set_result((conhecida['analise'], None))
+            return futuro
+        for hash_em_voo, (origem_em_voo, miniatura_em_voo, futuro) in telas_em_voo.items():
+            if (distancia_hamming(hash_em_voo, hash_tela) <= indice_telas.limiar
+                    and diferenca_local(miniatura_em_voo, miniatura) <= LIMIAR_DIFERENCA_LOCAL):
+                item['tela_repetida_de'] = origem_em_voo
+                return futuro
         
-        # 4. DETECÇÃO HÍBRIDA: Verificar se há tela antes de chamar Vision
-        analise_vision = None
-        usar_vision = False
-        
-        if processar_telas and modelo_vision:
-            # Etapa 1: Heurística rápida (sem API)
-            tem_tela, confianca, razao = detectar_se_tem_tela_heuristica(
-                texto_pagina, imagens_pagina, pixmap, documento
+        def analisar_e_indexar():
+            analise, erro = processar_tela_com_retry(
+                modelo_vision, imagem, limitador=limitador, cache=cache, metricas=metricas,
             )
-            
-            # Decisão baseada em confiança
-            if confianca >= 0.7:  # Alta confiança
-                if tem_tela:
-                    # Confiança alta de que tem tela → usar Vision
-                    usar_vision = True
-                    paginas_com_tela += 1
-                else:
-                    # Confiança alta de que NÃO tem tela → pular Vision
-                    usar_vision = False
-                    paginas_sem_tela += 1
-            
-            elif confianca < 0.7 and confianca >= 0.3:  # Confiança média (ambíguo)
-                # Caso ambíguo → usar Vision Flash para confirmar
-                tem_tela_confirmada, erro_conf = confirmar_com_vision_flash(modelo_vision, pixmap)
-                
-                if erro_conf:
-                    # Se erro na confirmação, usar Vision completo por segurança
-                    usar_vision = True
-                    paginas_ambigua_confirmada += 1
-                elif tem_tela_confirmada:
-                    # Confirmado que tem tela → usar Vision completo
-                    usar_vision = True
-                    paginas_ambigua_confirmada += 1
-                else:
-                    # Confirmado que NÃO tem tela → pular Vision
-                    usar_vision = False
-                    paginas_ambigua_rejeitada += 1
-            
-            else:  # Confiança muito baixa (< 0.3) - provavelmente texto puro
-                usar_vision = False
-                paginas_sem_tela += 1
-            
-            # Etapa 2: Usar Vision apenas se necessário
-            if usar_vision:
-                analise_vision, erro = processar_tela_com_retry(modelo_vision, pixmap)
-                
-                if analise_vision:
-                    sucessos_vision += 1
-                else:
-                    erros_vision += 1
-                    if erro:
-                        tqdm.write(f"⚠️  Página {num_pagina + 1}: {erro}")
+            if analise:
+                indice_telas.adicionar(hash_tela, {'analise': analise, 'origem': origem, 'miniatura': miniatura})
+            return analise, erro
         
-        # 4. Montar chunk_text combinado (priorizando texto com instruções)
-        chunk_text = ""
-        
-        # Priorizar texto extraído se já tiver instruções passo a passo
-        tem_instrucoes_texto = texto_pagina and (
-            any(marker in texto_pagina for marker in ['1. ', '2. ', '3. ', 'Passo ', 'Clicar em', 'Selecionar'])
+        futuro = executor.submit(metricas.cronometrar, 'vision', num_pagina, analisar_e_indexar)
+        telas_em_voo[hash_tela] = (origem, miniatura, futuro)
+        return futuro
+    
+    def enviar_lote_deteccao(executor):
+        """Envia as páginas ambíguas acumuladas numa única requisição de detecção"""
+        if not lote_deteccao:
+            return
+        futuro = executor.submit(
+            metricas.cronometrar, 'deteccao_lote', None,
+            confirmar_lote_com_vision_flash, modelo_vision,
+            [(item['num_pagina'], imagem) for item, imagem in lote_deteccao], limitador, cache, metricas,
         )
-        
-        # Se há análise visual, usar para enriquecer ou substituir
-        if analise_vision:
-            titulo_tela = analise_vision.get('titulo_tela', '')
-            contexto = analise_vision.get('contexto', '')
-            instrucoes_nav = analise_vision.get('instrucoes_navegacao', [])
-            elementos = analise_vision.get('elementos_visiveis', [])
-            campos = analise_vision.get('campos_formulario', [])
-            observacoes = analise_vision.get('observacoes', '')
-            
-            # Se a análise visual gerou instruções, priorizar ela
-            if instrucoes_nav and isinstance(instrucoes_nav, list):
-                chunk_text = titulo_tela + "\n\n" if titulo_tela else ""
-                
-                if contexto:
-                    chunk_text += f"{contexto}\n\n"
-                
-                # Adicionar instruções passo a passo (principal)
-                chunk_text += "\n".join(instrucoes_nav) + "\n\n"
-                
-                # Se texto extraído tem informações adicionais, adicionar
-                if texto_pagina and not tem_instrucoes_texto:
-                    chunk_text += f"[Imagens da tela do sistema PETRVS com anotações]\n\n"
-                    chunk_text += f"{texto_pagina}\n\n"
-                
-                # Adicionar campos do formulário se houver
-                if campos:
-                    chunk_text += "**Campos do Formulário:**\n"
-                    for campo in campos:
-                        nome = campo.get('nome', '')
-                        tipo = campo.get('tipo', '')
-                        obrig = "obrigatório" if campo.get('obrigatorio') else "opcional"
-                        formato = campo.get('formato', '')
-                        chunk_text += f"- {nome} ({tipo}, {obrig}"
-                        if formato:
-                            chunk_text += f", formato: {formato}"
-                        chunk_text += ")\n"
-                    chunk_text += "\n"
-                
-                # Adicionar elementos visíveis da tela
-                if elementos:
-                    chunk_text += "**Elementos da Tela:**\n"
-                    for elem in elementos:
-                        nome = elem.get('nome', '')
-                        acao = elem.get('acao', '')
-                        local = elem.get('localizacao', '')
-                        chunk_text += f"- {nome}"
-                        if acao:
-                            chunk_text += f": {acao}"
-                        if local:
-                            chunk_text += f" ({local})"
-                        chunk_text += "\n"
-                    chunk_text += "\n"
-                
-                if observacoes:
-                    chunk_text += f"**Observações:** {observacoes}\n"
-                    
+        for item, _ in lote_deteccao:
+            item['deteccao'] = futuro
+            item['aguardando_lote'] = False
+        # Um lote de uma página só vai pela detecção individual
+        if len(lote_deteccao) > 1:
+            estatisticas['requisicoes_deteccao_lote'] += 1
+        lote_deteccao.clear()
+    
+    def promover_confirmadas(executor):
+        """Envia à análise completa as páginas ambíguas já confirmadas pelo Flash"""
+        for item in pendentes:
+            if item['deteccao'] is None or item['confirmada'] is not None or not item['deteccao'].done():
+                continue
+            resultado = item['deteccao'].result()
+            if 'aguardando_lote' in item:
+                # Detecção em lote: um resultado por página
+                resultado = resultado[item['num_pagina']]
+            tem_tela_confirmada, erro_conf = resultado
+            # Se erro na confirmação, usar Vision completo por segurança
+            item['confirmada'] = True if erro_conf else bool(tem_tela_confirmada)
+            if not erro_conf:
+                coletar_amostra(item, tem_tela_confirmada, 'flash')
+            if item['confirmada']:
+                estatisticas['paginas_ambigua_confirmada'] += 1
+                item['analise'] = submeter_analise(executor, item)
             else:
-                # Fallback: usar estrutura antiga se não houver instruções_navegacao
-                chunk_text = texto_pagina if texto_pagina else ""
-                if contexto:
-                    chunk_text += f"\n\nContexto: {contexto}\n"
-        
-        # Se não há análise visual ou ela não gerou instruções, usar texto extraído
-        elif texto_pagina:
-            chunk_text = texto_pagina
-            if tem_instrucoes_texto:
-                # Adicionar marcador de imagem se houver instruções mas não análise visual
-                chunk_text = chunk_text.replace(
-                    "[Imagem", "[Imagens da tela do sistema PETRVS com anotações]"
-                ) if "[Imagem" in chunk_text else f"[Imagens da tela do sistema PETRVS com anotações]\n\n{chunk_text}"
-        
-        # Se não há conteúdo, pular
-        if not chunk_text.strip():
-            continue
+                estatisticas['paginas_ambigua_rejeitada'] += 1
+    
+    def pagina_pronta(item):
+        if item.get('aguardando_lote'):
+            return False
+        if item['deteccao'] is not None and item['confirmada'] is None:
+            return False
+        return item['analise'] is None or item['analise'].done()
+    
+    def finalizar_pagina(item):
+        """Consolida o resultado do Vision (se houver) e monta o documento"""
+        num_pagina = item['num_pagina']
+        analise_vision = None
         
-        # 5. Criar documento final
-        doc_id = f"{nome_base.replace('-', '_')}_pagina_{num_pagina + 1:03d}"
+        if item.get('reaproveitados') is not None:
+            for doc in item['reaproveitados']:
+                registrar(doc)
+            paginas_manifesto[id_pagina(nome_base, num_pagina)] = {
+                'hash_conteudo': item['hash_conteudo'],
+                'ids': [doc['id'] for doc in item['reaproveitados']],
+            }
+            barra.update(1)
+            return
         
-        # Determinar tipo de chunk (usar "contexto" para instruções de navegação)
-        if analise_vision:
-            # Se tem instruções de navegação, é contexto (como no JSON original)
-            instrucoes_nav = analise_vision.get('instrucoes_navegacao', [])
-            if instrucoes_nav:
-                chunk_type = "contexto"
+        if item['analise'] is not None:
+            analise_vision, erro = item['analise'].result()
+            item['vision_pendente'] = not analise_vision
+            if analise_vision:
+                estatisticas['sucessos_vision'] += 1
+                # Só rotula com a resposta explícita do modelo; sem ela a página fica fora do treino
+                if isinstance(analise_vision.get('tem_tela'), bool):
+                    coletar_amostra(item, analise_vision['tem_tela'], 'vision')
             else:
-                chunk_type = "interface"
-            task_title = analise_vision.get('titulo_tela', f'Página {num_pagina + 1}')
-        elif tem_instrucoes_texto:
-            # Texto com instruções também é contexto
-            chunk_type = "contexto"
-            # Extrair primeiro título do texto
-            linhas = texto_pagina.split('\n')[:3]
-            task_title = linhas[0].strip() if linhas else f'Página {num_pagina + 1}'
-            # Remover marcações de formatação
-            task_title = task_title.replace('**', '').strip()
-            if len(task_title) > 100:
-                task_title = task_title[:100] + "..."
-        else:
-            chunk_type = "texto"
-            # Extrair primeiro título/parágrafo do texto como task_title
-            linhas = texto_pagina.split('\n')[:3]
-            task_title = linhas[0].strip() if linhas else f'Página {num_pagina + 1}'
-            task_title = task_title.replace('**', '').strip()
-            if len(task_title) > 100:
-                task_title = task_title[:100] + "..."
+                estatisticas['erros_vision'] += 1
+                if erro and verboso:
+                    tqdm.write(f"⚠️  Página {num_pagina + 1}: {erro}")
         
-        doc = {
-            'id': doc_id,
-            'chunk_text': chunk_text.strip(),
-            'document_title': document_title,
-            'source_file': os.path.basename(caminho_pdf),
-            'task_title': task_title,
-            'chunk_type': chunk_type,
-            'pagina': num_pagina + 1,
-            'num_palavras': len(chunk_text.split()),
-        }
+        with metricas.medir('montagem_json', num_pagina):
+            doc = montar_documento(num_pagina, item['texto'], analise_vision, caminho_pdf)
+        if item.get('tela_repetida_de') and analise_vision:
+            estatisticas['paginas_tela_repetida'] += 1
+            if doc:
+                doc['tela_repetida_de'] = item['tela_repetida_de']
         
-        # Adicionar metadados de tela se houver
-        if analise_vision:
-            doc['tipo_tela'] = analise_vision.get('tipo_tela', 'N/A')
-            elementos_importantes = analise_vision.get('elementos_importantes', [])
-            campos_formulario = analise_vision.get('campos_formulario', [])
-            doc['num_elementos'] = len(elementos_importantes) + len(campos_formulario)
-            doc['tem_texto'] = bool(texto_pagina)
-            doc['tem_instrucoes_navegacao'] = bool(analise_vision.get('instrucoes_navegacao', []))
-        else:
-            doc['tem_texto'] = bool(texto_pagina)
-            doc['tem_instrucoes_navegacao'] = tem_instrucoes_texto
+        # Vision que falhou ou nem foi tentado (circuito aberto): a página
+        # sai só com o texto, marcada para ser refeita depois
+        pendente = bool(item.get('vision_pendente'))
+        if pendente:
+            estatisticas['paginas_vision_pendente'] += 1
+            if doc:
+                doc['vision_pendente'] = True
+        if doc:
+            registrar(doc)
         
-        documentos.append(doc)
+        if manifesto is not None:
+            # Página pendente de Vision fica sem hash para ser refeita depois
+            paginas_manifesto[id_pagina(nome_base, num_pagina)] = {
+                'hash_conteudo': None if pendente else item['hash_conteudo'],
+                'ids': [doc['id']] if doc else [],
+            }
+        barra.update(1)
+    
+    def atualizar_pendentes(executor):
+        """Promove confirmações e monta, em ordem, as páginas já concluídas"""
+        promover_confirmadas(executor)
+        while pendentes and pagina_pronta(pendentes[0]):
+            finalizar_pagina(pendentes.popleft())
+    
+    def aguardar_pendentes():
+        """Bloqueia até que algum futuro pendente termine"""
+        futuros = [
+            f for item in pendentes for f in (item['deteccao'], item['analise'])
+            if f is not None and not f.done()
+        ]
+        if futuros:
+            wait(futuros, return_when=FIRST_COMPLETED)
+    
+    usar_heuristica = bool(processar_telas and modelo_vision)
+    paralelo = processos_extracao > 1 and total_paginas - pagina_inicial >= PAGINAS_MIN_EXTRACAO_PARALELA
+    
+    def extrair_paginas():
+        """Dados extraídos de cada página, na ordem do documento"""
+        if not paralelo:
+            for num_pagina in range(pagina_inicial, total_paginas):
+                yield extrair_pagina(documento, num_pagina, manifesto is not None, usar_heuristica,
+                                     dimensoes_imagens, metricas, parametros['pesos'])
+            return
         
-        # Delay entre páginas
-        if processar_telas:
-            time.sleep(DELAY_ENTRE_PAGINAS)
+        # Cada processo abre o próprio documento; os blocos são consumidos em ordem
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processos_extracao, mp_context=contexto) as pool:
+            futuros = [
+                pool.submit(extrair_intervalo, caminho_pdf, inicio,
+                            min(inicio + PAGINAS_POR_BLOCO_EXTRACAO, total_paginas),
+                            manifesto is not None, usar_heuristica, parametros['pesos'])
+                for inicio in range(pagina_inicial, total_paginas, PAGINAS_POR_BLOCO_EXTRACAO)
+            ]
+            for futuro in futuros:
+                for extraida in futuro.result():
+                    for etapa, segundos in extraida.pop('tempos').items():
+                        metricas.adicionar_tempo(etapa, segundos, extraida['num_pagina'])
+                    yield extraida
+    
+    if paralelo:
+        log(f"🧵 Extração em {processos_extracao} processos "
+            f"(blocos de {PAGINAS_POR_BLOCO_EXTRACAO} páginas)\n")
     
+    with ThreadPoolExecutor(max_workers=max(1, concorrencia)) as executor:
+        # 1-2. Texto, hash e heurística de cada página (em ordem), extraídos
+        # aqui ou, com processos_extracao > 1, por processos em paralelo
+        for extraida in extrair_paginas():
+            num_pagina = extraida['num_pagina']
+            
+            # 3. DETECÇÃO HÍBRIDA: Verificar se há tela antes de chamar Vision
+            # (a página só é renderizada se for enviada ao Vision)
+            item = {'num_pagina': num_pagina, 'texto': extraida['texto'],
+                    'deteccao': None, 'confirmada': None, 'analise': None}
+            
+            # Modo incremental: reaproveita os registros de páginas inalteradas
+            if manifesto is not None:
+                item['hash_conteudo'] = extraida['hash_conteudo']
+                item['reaproveitados'] = obter_registros_inalterados(num_pagina, item['hash_conteudo'])
+                if item['reaproveitados'] is not None:
+                    estatisticas['paginas_reaproveitadas'] += 1
+            
+            if processar_telas and modelo_vision and item.get('reaproveitados') is None:
+                # Etapa 1: Heurística rápida (sem API), calculada na extração
+                tem_tela, confianca, razao = extraida['heuristica']
+                item['confianca'] = confianca
+                
+                # Decisão baseada em confiança
+                item['sinais'] = extraida['sinais']
+                rota = rotear_pagina(tem_tela, confianca, parametros)
+                if rota == 'vision':
+                    # Confiança alta de que tem tela → usar Vision
+                    estatisticas['paginas_com_tela'] += 1
+                    item['analise'] = submeter_analise(executor, item)
+                
+                elif rota == 'ambigua':
+                    # Caso ambíguo → classificador local (se houver) e, se ele
+                    # também ficar em dúvida, Vision Flash para confirmar (no pool)
+                    pagina = documento.load_page(num_pagina)
+                    miniatura = None
+                    decisao_local = None
+                    if classificador_local or coletar_treino:
+                        miniatura = renderizar(pagina, num_pagina, LADO_MAX_MINIATURA_LOTE)
+                        calcular_caracteristicas(item, miniatura)
+                    if classificador_local:
+                        with metricas.medir('classificador', num_pagina):
+                            decisao_local, _ = classificador_local.decidir(item['caracteristicas'])
+                    
+                    if decisao_local is True:
+                        estatisticas['paginas_ambigua_local_sim'] += 1
+                        item['confirmada'] = True
+                        item['analise'] = submeter_analise(executor, item)
+                    elif decisao_local is False:
+                        estatisticas['paginas_ambigua_local_nao'] += 1
+                        item['confirmada'] = False
+                    elif limitador.circuito_aberto():
+                        # Sem API por enquanto: a página fica para depois
+                        item['vision_pendente'] = True
+                    elif deteccao_lote > 1:
+                        # Em lote: miniatura acumulada até completar a requisição
+                        imagem_deteccao = miniatura or renderizar(pagina, num_pagina, LADO_MAX_MINIATURA_LOTE)
+                        item['aguardando_lote'] = True
+                        lote_deteccao.append((item, imagem_deteccao))
+                    else:
+                        # Uma requisição por página, na resolução de detecção
+                        imagem_deteccao = renderizar(pagina, num_pagina, LADO_MAX_DETECCAO)
+                        item['deteccao'] = executor.submit(
+                            metricas.cronometrar, 'deteccao', num_pagina,
+                            confirmar_com_vision_flash, modelo_vision, imagem_deteccao, limitador, cache, metricas,
+                        )
+                
+                else:  # Sem tela (confiança alta) ou confiança muito baixa → pular Vision
+                    estatisticas['paginas_sem_tela'] += 1
+            
+            pendentes.append(item)
+            if len(lote_deteccao) >= deteccao_lote:
+                enviar_lote_deteccao(executor)
+            
+            # Etapa 2: montar, em ordem, as páginas cujo Vision já terminou
+            # (aguarda se a janela de pendentes estiver cheia; antes de
+            # bloquear, envia o lote de detecção mesmo incompleto)
+            atualizar_pendentes(executor)
+            while len(pendentes) > max_pendentes:
+                enviar_lote_deteccao(executor)
+                aguardar_pendentes()
+                atualizar_pendentes(executor)
+        
+        while pendentes:
+            enviar_lote_deteccao(executor)
+            aguardar_pendentes()
+            atualizar_pendentes(executor)
+    
+    barra.close()
     documento.close()
     
-    # Salvar JSON final
-    os.makedirs(os.path.dirname(output_json) if os.path.dirname(output_json) else '.', exist_ok=True)
+    # Salvar JSON final (no JSONL os registros já foram gravados)
+    if escritor:
+        escritor.fechar()
+    total_paginas_registradas = len(documentos)
+    if chunking:
+        with metricas.medir('chunking'):
+            documentos = chunkear_registros(documentos, max_tokens)
+    if deduplicar:
+        with metricas.medir('colapso_duplicados'):
+            documentos, estatisticas['chunks_colapsados'] = colapsar_chunks_duplicados(documentos)
+    with metricas.medir('gravacao_saida'):
+        if pos_processar or not escritor:
+            salvar_registros(output_json, documentos)
     
-    with open(output_json, 'w', encoding='utf-8') as f:
-        json.dump(documentos, f, ensure_ascii=False, indent=2)
+    if manifesto is not None:
+        manifesto['source_file'] = os.path.basename(caminho_pdf)
+        manifesto.update(configuracao_registros)
+        manifesto['chunking'] = max_tokens if chunking else None
+        manifesto, alterados, removidos = atualizar_manifesto(manifesto, paginas_manifesto, documentos)
+        salvar_manifesto(arquivo_manifesto, manifesto)
+    
+    # Relatório de métricas da execução
+    relatorio = metricas.relatorio(
+        source_file=os.path.basename(caminho_pdf),
+        output_json=output_json,
+        total_paginas=total_paginas,
+        paginas_processadas=total_paginas - pagina_inicial,
+        documentos=len(documentos),
+        processar_telas=processar_telas,
+        modelo_vision=MODELO_VISION if processar_telas else None,
+        concorrencia=concorrencia,
+        rpm=limitador.rpm if limitador else None,
+        controle_taxa=limitador.situacao() if limitador else None,
+        contadores=dict(estatisticas),
+        cache={'acertos': cache.acertos, 'faltas': cache.faltas} if cache else None,
+    )
+    arquivo_relatorio = caminho_relatorio(output_json)
+    salvar_relatorio(arquivo_relatorio, relatorio)
+    if metricas_prometheus:
+        salvar_prometheus(metricas_prometheus, relatorio, {'documento': os.path.basename(caminho_pdf)})
     
     # Resumo
-    print("\n" + "="*80)
-    print("PROCESSAMENTO CONCLUÍDO")
-    print("="*80)
-    print(f"✅ Total de documentos criados: {len(documentos)}")
+    log("\n" + "="*80)
+    log("PROCESSAMENTO CONCLUÍDO")
+    log("="*80)
+    log(f"✅ Total de documentos criados: {len(documentos)}")
+    if chunking:
+        log(f"✂️  Chunking: {total_paginas_registradas} registro(s) por página → "
+            f"{len(documentos) + estatisticas['chunks_colapsados']} chunk(s)")
+    if deduplicar:
+        log(f"🧬 Deduplicação: {estatisticas['paginas_tela_repetida']} tela(s) repetida(s) reaproveitada(s), "
+            f"{estatisticas['chunks_colapsados']} chunk(s) quase duplicado(s) colapsado(s)")
+    if pos_processar:
+        log(f"   Registros por página: {saida_paginas}")
     if processar_telas:
-        print(f"\n📊 DETECÇÃO HÍBRIDA:")
-        print(f"   Páginas com tela detectadas (heurística): {paginas_com_tela}")
-        print(f"   Páginas sem tela detectadas (heurística): {paginas_sem_tela}")
-        print(f"   Páginas ambíguas → confirmadas com Vision: {paginas_ambigua_confirmada}")
-        print(f"   Páginas ambíguas → rejeitadas (sem tela): {paginas_ambigua_rejeitada}")
-        print(f"\n🔍 PROCESSAMENTO VISION:")
-        print(f"   Visão processada: {sucessos_vision} sucessos, {erros_vision} erros")
-        total_vision_chamadas = sucessos_vision + erros_vision + paginas_ambigua_confirmada
+        log(f"\n📊 DETECÇÃO HÍBRIDA:")
+        log(f"   Páginas com tela detectadas (heurística): {estatisticas['paginas_com_tela']}")
+        log(f"   Páginas sem tela detectadas (heurística): {estatisticas['paginas_sem_tela']}")
+        log(f"   Páginas ambíguas → confirmadas com Vision: {estatisticas['paginas_ambigua_confirmada']}")
+        log(f"   Páginas ambíguas → rejeitadas (sem tela): {estatisticas['paginas_ambigua_rejeitada']}")
+        if classificador_local:
+            log(f"   Páginas ambíguas → decididas pelo classificador local: "
+                f"{estatisticas['paginas_ambigua_local_sim']} com tela, "
+                f"{estatisticas['paginas_ambigua_local_nao']} sem tela")
+        if estatisticas['paginas_recortadas']:
+            log(f"   Páginas enviadas só com as capturas recortadas: {estatisticas['paginas_recortadas']}")
+        if estatisticas['requisicoes_deteccao_lote']:
+            log(f"   Requisições de detecção em lote: {estatisticas['requisicoes_deteccao_lote']} "
+                f"(até {deteccao_lote} página(s) cada)")
+        log(f"\n🔍 PROCESSAMENTO VISION:")
+        log(f"   Visão processada: {estatisticas['sucessos_vision']} sucessos, {estatisticas['erros_vision']} erros")
+        total_vision_chamadas = (
+            estatisticas['sucessos_vision'] + estatisticas['erros_vision']
+            + estatisticas['paginas_ambigua_confirmada']
+        )
         economia = total_paginas - total_vision_chamadas
         if economia > 0:
-            print(f"   📉 Economia: {economia} página(s) sem chamadas Vision ({economia*100//total_paginas}%)")
-    print(f"\n📝 Total de palavras: {sum(d['num_palavras'] for d in documentos):,}")
-    print(f"📁 JSON salvo em: {output_json}")
-    print("="*80 + "\n")
+            log(f"   📉 Economia: {economia} página(s) sem chamadas Vision ({economia*100//total_paginas}%)")
+        if cache:
+            log(f"   💾 Cache: {cache.acertos} acerto(s), {cache.faltas} falta(s)")
+        totais = totais_api(relatorio)
+        log(f"   💰 API: {totais['chamadas']} chamada(s) ({totais['erros']} com erro), "
+            f"{totais['bytes_enviados'] / 1024 / 1024:.1f} MB enviados, "
+            f"tokens: {totais['tokens_entrada']:,} entrada / {totais['tokens_saida']:,} saída")
+        situacao = limitador.situacao()
+        if situacao.get('rpm_atual', limitador.rpm) < limitador.rpm or situacao.get('aberturas_circuito'):
+            log(f"   🚦 Taxa ao final: {situacao['rpm_atual']:.0f} de {limitador.rpm} req/min | "
+                f"Circuito aberto {situacao['aberturas_circuito']} vez(es)")
+        if estatisticas['paginas_vision_pendente']:
+            log(f"   ⏳ Páginas pendentes de Vision (vision_pendente): {estatisticas['paginas_vision_pendente']} "
+                f"— reprocesse com --incremental para completá-las")
+    if manifesto is not None:
+        log(f"\n♻️  INCREMENTAL:")
+        log(f"   Páginas reaproveitadas (inalteradas): {estatisticas['paginas_reaproveitadas']}")
+        log(f"   Registros novos/alterados: {len(alterados)} | Removidos: {len(removidos)}")
+        log(f"   Pendentes de envio: {len(manifesto['alteracoes']['upsert'])} upsert(s), "
+            f"{len(manifesto['alteracoes']['remover'])} remoção(ões)")
+        log(f"   Manifesto: {arquivo_manifesto}")
+    log(f"\n📝 Total de palavras: {sum(d['num_palavras'] for d in documentos):,}")
+    etapas_lentas = sorted(relatorio['etapas'].items(), key=lambda e: e[1]['total_s'], reverse=True)[:3]
+    log(f"⏱️  Tempo total: {relatorio['tempo_total_s']:.1f}s | Etapas mais demoradas: "
+        + ", ".join(f"{etapa} {valores['total_s']:.1f}s" for etapa, valores in etapas_lentas))
+    log(f"📁 {nome_formato(output_json)} salvo em: {output_json}")
+    log(f"📈 Relatório de métricas: {arquivo_relatorio}")
+    log("="*80 + "\n")
     
     return documentos
 
+# --- PROCESSAMENTO EM LOTE ---
+# Limitador do processo worker, criado a partir do estado compartilhado
+_limitador_lote = None
+# Índice de telas (hash perceptual) compartilhado entre os workers do lote
+_indice_telas_lote = None
+
+def _inicializar_worker_lote(rpm, capacidade, estado, dados_telas=None, lock_telas=None):
+    """Inicializa o worker do pool com o orçamento Vision (e o índice de telas) compartilhados"""
+    global _limitador_lote, _indice_telas_lote
+    _limitador_lote = ControleTaxa(rpm, capacidade, estado=estado)
+    if dados_telas is not None:
+        _indice_telas_lote = IndiceTelas(armazenamento=dados_telas, lock=lock_telas)
+
+def _processar_documento_lote(caminho_pdf, output_json, processar_telas, concorrencia, cache_dir,
+                              incremental=False, retomar=False, chunking=False,
+                              max_tokens=CHUNK_MAX_TOKENS, deteccao_lote=DETECCAO_LOTE_TAMANHO,
+                              classificador=MODELO_CLASSIFICADOR_TELAS, coletar_treino=None,
+                              deduplicar=False, recortar_telas=False,
+                              parametros_heuristica=ARQUIVO_PARAMETROS_HEURISTICA):
+    """Processa um PDF dentro de um worker do pool e retorna sua entrada do manifesto"""
+    inicio = time.time()
+    estatisticas = {}
+    entrada = {
+        'source_file': os.path.basename(caminho_pdf),
+        'caminho_pdf': caminho_pdf,
+        'output_json': output_json,
+    }
+    
+    try:
+        documentos = processar_pdf_completo(
+            caminho_pdf, output_json, processar_telas, concorrencia,
+            cache_dir=cache_dir, limitador=_limitador_lote, verboso=False,
+            estatisticas=estatisticas, incremental=incremental, retomar=retomar,
+            chunking=chunking, max_tokens=max_tokens, deteccao_lote=deteccao_lote,
+            classificador=classificador, coletar_treino=coletar_treino,
+            deduplicar=deduplicar, indice_telas=_indice_telas_lote,
+            recortar_telas=recortar_telas, parametros_heuristica=parametros_heuristica,
+        )
+    except Exception as e:
+        entrada.update({'status': 'erro', 'erro': str(e), 'tempo_segundos': round(time.time() - inicio, 2)})
+        return entrada
+    
+    documentos = documentos or []
+    tipos_chunk = {}
+    for doc in documentos:
+        tipos_chunk[doc['chunk_type']] = tipos_chunk.get(doc['chunk_type'], 0) + 1
+    
+    entrada.update({
+        'status': 'ok' if documentos else 'vazio',
+        'total_documentos': len(documentos),
+        'total_palavras': sum(d['num_palavras'] for d in documentos),
+        'tipos_chunk': tipos_chunk,
+        'estatisticas': estatisticas,
+        'tempo_segundos': round(time.time() - inicio, 2),
+    })
+    
+    arquivo_relatorio = caminho_relatorio(output_json)
+    if os.path.exists(arquivo_relatorio):
+        with open(arquivo_relatorio, 'r', encoding='utf-8') as f:
+            entrada['relatorio'] = json.load(f)
+    return entrada
+
+def listar_pdfs(entrada):
+    """Lista os PDFs de um diretório ou de um padrão glob, em ordem alfabética"""
+    if os.path.isdir(entrada):
+        padrao = os.path.join(entrada, "*.pdf")
+    else:
+        padrao = entrada
+    return sorted(c for c in glob.glob(padrao) if c.lower().endswith('.pdf'))
+
+def processar_lote(entrada, diretorio_saida, processar_telas=True, workers=LOTE_WORKERS,
+                   concorrencia=VISION_CONCORRENCIA, rpm=VISION_RPM, cache_dir=CACHE_VISION_DIR,
+                   incremental=False, retomar=False, extensao=".json", chunking=False,
+                   max_tokens=CHUNK_MAX_TOKENS, deteccao_lote=DETECCAO_LOTE_TAMANHO,
+                   classificador=MODELO_CLASSIFICADOR_TELAS, coletar_treino=None,
+                   metricas_prometheus=None, deduplicar=False, recortar_telas=False,
+                   parametros_heuristica=ARQUIVO_PARAMETROS_HEURISTICA):
+    """
+    Processa vários PDFs em paralelo com um pool de processos.
+    
+    A renderização e a extração de texto (PyMuPDF) rodam em paralelo nos
+    workers; o limite de requisições Vision por minuto é compartilhado entre
+    todos eles. Gera um JSON por documento em `diretorio_saida` e um
+    manifesto combinado (ARQUIVO_MANIFESTO_LOTE).
+    
+    Args:
+        entrada: Diretório com PDFs ou padrão glob (ex.: "docs/manual-*.pdf")
+        diretorio_saida: Diretório dos JSONs gerados e do manifesto
+        processar_telas: Se True, processa telas com Gemini Vision
+        workers: Número de processos
+        concorrencia: Requisições Vision simultâneas por processo
+        rpm: Limite global de requisições Vision por minuto
+        cache_dir: Diretório do cache de resultados Vision (None desativa)
+        incremental: Se True, cada documento é reprocessado de forma incremental
+        retomar: Se True, saídas .jsonl existentes são continuadas
+        extensao: Extensão dos arquivos por documento (".json", ".jsonl" ou ".parquet")
+        chunking: Se True, gera chunks de até `max_tokens` em vez de um registro por página
+        max_tokens: Orçamento de tokens por chunk
+        deteccao_lote: Páginas ambíguas por requisição de detecção (1 desativa o lote)
+        classificador: Modelo do classificador local de telas (None desativa)
+        coletar_treino: Arquivo JSONL das amostras de treino do classificador
+        metricas_prometheus: Arquivo .prom com as métricas combinadas do lote
+        deduplicar: Se True, reaproveita análises de telas repetidas entre todos
+            os documentos do lote e colapsa chunks quase duplicados em cada um
+        recortar_telas: Se True, envia ao Vision só as capturas de tela recortadas
+        parametros_heuristica: Arquivo JSON com pesos e limiares da heurística
+    """
+    caminhos = listar_pdfs(entrada)
+    
+    print("="*80)
+    print("PROCESSAMENTO EM LOTE")
+    print("="*80)
+    print(f"\n📂 Entrada: {entrada}")
+    print(f"📁 Saída: {diretorio_saida}")
+    print(f"📄 PDFs encontrados: {len(caminhos)}")
+    print(f"⚙️  Processos: {workers} | Concorrência Vision por processo: {concorrencia} | Limite global: {rpm} req/min\n")
+    
+    if not caminhos:
+        print("❌ Nenhum PDF encontrado!")
+        return None
+    
+    os.makedirs(diretorio_saida, exist_ok=True)
+    
+    # Orçamento Vision único para todos os processos
+    contexto = multiprocessing.get_context("spawn")
+    capacidade = concorrencia
+    estado = criar_estado_compartilhado(capacidade, contexto)
+    
+    # Índice de telas único para todos os processos (telas repetidas entre manuais)
+    gerenciador = contexto.Manager() if deduplicar and processar_telas else None
+    argumentos_worker = (rpm, capacidade, estado)
+    if gerenciador:
+        argumentos_worker += (gerenciador.dict(), gerenciador.Lock())
+    
+    inicio = time.time()
+    entradas = []
+    
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=contexto,
+        initializer=_inicializar_worker_lote, initargs=argumentos_worker,
+    ) as executor:
+        futuros = []
+        for caminho_pdf in caminhos:
+            nome_base = os.path.splitext(os.path.basename(caminho_pdf))[0]
+            output_json = os.path.join(diretorio_saida, f"{nome_base}{extensao}")
+            futuros.append(executor.submit(
+                _processar_documento_lote, caminho_pdf, output_json,
+                processar_telas, concorrencia, cache_dir, incremental, retomar,
+                chunking, max_tokens, deteccao_lote, classificador, coletar_treino, deduplicar,
+                recortar_telas, parametros_heuristica,
+            ))
+        
+        for futuro in tqdm(as_completed(futuros), total=len(futuros), desc="Documentos", unit="pdf"):
+            entrada_manifesto = futuro.result()
+            entradas.append(entrada_manifesto)
+            if entrada_manifesto['status'] == 'erro':
+                tqdm.write(f"❌ {entrada_manifesto['source_file']}: {entrada_manifesto['erro']}")
+    
+    if gerenciador:
+        gerenciador.shutdown()
+    
+    entradas.sort(key=lambda e: e['source_file'])
+    
+    # Métricas combinadas de todos os documentos (o relatório completo de
+    # cada um fica em <saida>.relatorio.json)
+    relatorios = [e.pop('relatorio') for e in entradas if 'relatorio' in e]
+    relatorio_lote = combinar_relatorios(
+        relatorios, entrada=entrada, documentos=len(relatorios),
+        tempo_total_s=round(time.time() - inicio, 3),
+    )
+    caminho_relatorio_lote = os.path.join(diretorio_saida, ARQUIVO_RELATORIO_LOTE)
+    salvar_relatorio(caminho_relatorio_lote, relatorio_lote)
+    if metricas_prometheus:
+        salvar_prometheus(metricas_prometheus, relatorio_lote, {'lote': entrada})
+    
+    manifesto = {
+        'entrada': entrada,
+        'processar_telas': processar_telas,
+        'modelo_vision': MODELO_VISION if processar_telas else None,
+        'workers': workers,
+        'rpm': rpm,
+        'chunking': max_tokens if chunking else None,
+        'deduplicar': deduplicar,
+        'recortar_telas': recortar_telas,
+        'parametros_heuristica': parametros_heuristica if os.path.exists(parametros_heuristica or '') else None,
+        'tempo_segundos': round(time.time() - inicio, 2),
+        'total_documentos': sum(e.get('total_documentos', 0) for e in entradas),
+        'total_palavras': sum(e.get('total_palavras', 0) for e in entradas),
+        'arquivos': entradas,
+    }
+    
+    caminho_manifesto = os.path.join(diretorio_saida, ARQUIVO_MANIFESTO_LOTE)
+    with open(caminho_manifesto, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    
+    erros = [e for e in entradas if e['status'] == 'erro']
+    print("\n" + "="*80)
+    print("LOTE CONCLUÍDO")
+    print("="*80)
+    print(f"✅ PDFs processados: {len(entradas) - len(erros)} | ❌ Erros: {len(erros)}")
+    print(f"📝 Total de documentos: {manifesto['total_documentos']} | Palavras: {manifesto['total_palavras']:,}")
+    totais = totais_api(relatorio_lote)
+    print(f"💰 API: {totais['chamadas']} chamada(s), {totais['bytes_enviados'] / 1024 / 1024:.1f} MB enviados, "
+          f"tokens: {totais['tokens_entrada']:,} entrada / {totais['tokens_saida']:,} saída")
+    print(f"⏱️  Tempo total: {manifesto['tempo_segundos']}s")
+    print(f"📁 Manifesto salvo em: {caminho_manifesto}")
+    print(f"📈 Relatório de métricas: {caminho_relatorio_lote}")
+    print("="*80 + "\n")
+    
+    return manifesto
+
+def obter_opcao(argv, nome, padrao, tipo=int):
+    """Lê o valor de uma flag no formato '--nome VALOR' (ou retorna o padrão)"""
+    if nome in argv:
+        indice = argv.index(nome)
+        if indice + 1 < len(argv):
+            return tipo(argv[indice + 1])
+    return padrao
+
 if __name__ == '__main__':
     if len(sys.argv) < 3:
-        print("Uso: python processar_pdf_completo.py <caminho_pdf> <output_json> [--sem-telas]")
+        print("Uso: python processar_pdf_completo.py <caminho_pdf> <output_json> [--sem-telas] [--concorrencia N] [--rpm N] [--cache-dir DIR] [--sem-cache] [--incremental] [--retomar] [--chunking] [--max-tokens N] [--deteccao-lote K] [--classificador ARQ] [--sem-classificador] [--coletar-treino] [--metricas-prometheus ARQ] [--deduplicar] [--processos-extracao N] [--recortar-telas] [--parametros-heuristica ARQ]")
+        print("     python processar_pdf_completo.py <diretorio_ou_glob> <diretorio_saida> [--workers N] [flags]")
         print("\nExemplos:")
         print("  python processar_pdf_completo.py manual.pdf json_processados/manual.json")
         print("  python processar_pdf_completo.py manual.pdf json_processados/manual.json --sem-telas")
+        print("  python processar_pdf_completo.py manual.pdf json_processados/manual.json --concorrencia 8 --rpm 120")
+        print("  python processar_pdf_completo.py manual.pdf json_processados/manual.jsonl --retomar")
+        print("  python processar_pdf_completo.py manual.pdf json_processados/manual.parquet")
+        print("  python processar_pdf_completo.py decreto.pdf json_processados/decreto.json --chunking --max-tokens 400")
+        print("  python processar_pdf_completo.py documentos_para_processar/ json_processados/ --workers 4")
+        print("  python processar_pdf_completo.py 'documentos_para_processar/manual-*.pdf' json_processados/")
         print("\nFlags:")
-        print("  --sem-telas    Não processa telas com Gemini Vision (apenas extrai texto)")
+        print("  --sem-telas        Não processa telas com Gemini Vision (apenas extrai texto)")
+        print(f"  --concorrencia N   Requisições Vision simultâneas (padrão: {VISION_CONCORRENCIA})")
+        print(f"  --rpm N            Limite de requisições Vision por minuto (padrão: {VISION_RPM})")
+        print(f"  --cache-dir DIR    Diretório do cache de resultados Vision (padrão: {CACHE_VISION_DIR})")
+        print("  --sem-cache        Não usa o cache de resultados Vision")
+        print(f"  --workers N        Processos no modo lote (padrão: {LOTE_WORKERS})")
+        print("  --jsonl            No modo lote, grava um .jsonl por documento (em vez de .json)")
+        print("  --parquet          No modo lote, grava um .parquet por documento (colunar; requer pyarrow)")
+        print("  --retomar          Com saída .jsonl, continua após a última página gravada")
+        print("  --incremental      Reprocessa só as páginas novas ou alteradas (manifesto <saida>.manifesto.json)")
+        print("  --chunking         Divide páginas longas e junta páginas curtas em chunks com orçamento de tokens")
+        print(f"  --max-tokens N     Orçamento de tokens por chunk com --chunking (padrão: {CHUNK_MAX_TOKENS})")
+        print(f"  --deteccao-lote K  Páginas ambíguas por requisição de detecção (padrão: {DETECCAO_LOTE_TAMANHO}; 1 desativa)")
+        print(f"  --classificador ARQ  Modelo do classificador local de telas (padrão: {MODELO_CLASSIFICADOR_TELAS}, se existir)")
+        print("  --sem-classificador  Não usa o classificador local (páginas ambíguas vão ao Vision Flash)")
+        print(f"  --coletar-treino   Grava os vereditos do Vision em {ARQUIVO_TREINO_CLASSIFICADOR} (treino do classificador)")
+        print("  --metricas-prometheus ARQ  Exporta as métricas da execução em formato Prometheus (.prom)")
+        print("  --deduplicar       Reaproveita a análise de telas repetidas e colapsa chunks quase duplicados")
+        print("  --processos-extracao N  Processos que extraem as páginas de um PDF grande em paralelo (padrão: 1)")
+        print("  --recortar-telas   Envia ao Vision só as capturas de tela embutidas (resolução nativa), não a página inteira")
+        print(f"  --parametros-heuristica ARQ  Pesos e limiares calibrados da heurística (padrão: {ARQUIVO_PARAMETROS_HEURISTICA}, se existir)")
         sys.exit(1)
     
-    caminho_pdf = sys.argv[1]
-    output_json = sys.argv[2]
+    entrada = sys.argv[1]
+    saida = sys.argv[2]
     processar_telas = "--sem-telas" not in sys.argv
+    concorrencia = obter_opcao(sys.argv, "--concorrencia", VISION_CONCORRENCIA)
+    rpm = obter_opcao(sys.argv, "--rpm", VISION_RPM, tipo=float)
+    cache_dir = obter_opcao(sys.argv, "--cache-dir", CACHE_VISION_DIR, tipo=str)
+    if "--sem-cache" in sys.argv:
+        cache_dir = None
+    incremental = "--incremental" in sys.argv
+    retomar = "--retomar" in sys.argv
+    chunking = "--chunking" in sys.argv
+    max_tokens = obter_opcao(sys.argv, "--max-tokens", CHUNK_MAX_TOKENS)
+    deteccao_lote = obter_opcao(sys.argv, "--deteccao-lote", DETECCAO_LOTE_TAMANHO)
+    classificador = obter_opcao(sys.argv, "--classificador", MODELO_CLASSIFICADOR_TELAS, tipo=str)
+    if "--sem-classificador" in sys.argv:
+        classificador = None
+    coletar_treino = ARQUIVO_TREINO_CLASSIFICADOR if "--coletar-treino" in sys.argv else None
+    metricas_prometheus = obter_opcao(sys.argv, "--metricas-prometheus", None, tipo=str)
+    deduplicar = "--deduplicar" in sys.argv
+    processos_extracao = obter_opcao(sys.argv, "--processos-extracao", 1)
+    recortar_telas = "--recortar-telas" in sys.argv
+    parametros_heuristica = obter_opcao(sys.argv, "--parametros-heuristica", ARQUIVO_PARAMETROS_HEURISTICA, tipo=str)
     
-    if not os.path.exists(caminho_pdf):
-        print(f"❌ Erro: PDF não encontrado: {caminho_pdf}")
+    # Modo lote: diretório ou padrão glob
+    if os.path.isdir(entrada) or any(c in entrada for c in '*?['):
+        workers = obter_opcao(sys.argv, "--workers", LOTE_WORKERS)
+        extensao = ".jsonl" if "--jsonl" in sys.argv else ".parquet" if "--parquet" in sys.argv else ".json"
+        processar_lote(entrada, saida, processar_telas, workers, concorrencia, rpm, cache_dir,
+                       incremental, retomar, extensao, chunking, max_tokens, deteccao_lote,
+                       classificador, coletar_treino, metricas_prometheus, deduplicar, recortar_telas,
+                       parametros_heuristica)
+        sys.exit(0)
+    
+    if not os.path.exists(entrada):
+        print(f"❌ Erro: PDF não encontrado: {entrada}")
         sys.exit(1)
     
-    processar_pdf_completo(caminho_pdf, output_json, processar_telas)
-
+    processar_pdf_completo(entrada, saida, processar_telas, concorrencia, rpm, cache_dir,
+                           incremental=incremental, retomar=retomar,
+                           chunking=chunking, max_tokens=max_tokens, deteccao_lote=deteccao_lote,
+                           classificador=classificador, coletar_treino=coletar_treino,
+                           metricas_prometheus=metricas_prometheus, deduplicar=deduplicar,
+                           processos_extracao=processos_extracao, recortar_telas=recortar_telas,
+                           parametros_heuristica=parametros_heuristica)
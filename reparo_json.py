@@ -0,0 +1,125 @@
+# reparo_json.py
+"""
+Leitura tolerante das respostas JSON do Gemini.
+
+Mesmo com response_schema, uma resposta pode chegar cortada (limite de
+tokens de saída) ou com pequenos defeitos de formatação. Em vez de repetir
+a chamada inteira (reenviando a imagem), interpretar_json() tenta, em ordem:
+
+1. o JSON como veio (sem cercas ```json e ignorando texto após o objeto)
+2. sem vírgulas antes de } e ] e com strings/objetos/listas abertos fechados
+3. descartando o último item incompleto, de trás para frente, até o JSON
+   ficar válido
+
+Retorna o objeto e se houve reparo; levanta ValueError se nada servir.
+"""
+import json
+
+MAX_TENTATIVAS_CORTE = 64  # Cortes testados ao descartar itens incompletos
+
+_FECHAMENTOS = {'{': '}', '[': ']'}
+_DECODIFICADOR = json.JSONDecoder(strict=False)
+
+
+def remover_cercas(texto):
+    """Remove as cercas de markdown (```json ... ```) ao redor do JSON"""
+    texto = texto.strip()
+    if "```json" in texto:
+        texto = texto.split("```json", 1)[1]
+    elif texto.startswith("```"):
+        texto = texto[3:]
+    if "```" in texto:
+        texto = texto.split("```", 1)[0]
+    return texto.strip()
+
+
+def _decodificar(texto):
+    """Decodifica o primeiro valor JSON do texto (ignora o que vier depois)"""
+    valor, _ = _DECODIFICADOR.raw_decode(texto)
+    return valor
+
+
+def _normalizar(texto):
+    """
+    Percorre o texto fora das strings: remove vírgulas antes de } e ],
+    fecha uma string aberta e registra os pontos de corte (antes de cada
+    vírgula e após cada { ou [) com a pilha de estruturas abertas.
+
+    Retorna: (texto normalizado, pilha ao final, lista de (posição, pilha))
+    """
+    saida = []
+    pilha = []
+    cortes = []
+    em_string = False
+    escape = False
+
+    for caractere in texto:
+        if em_string:
+            saida.append(caractere)
+            if escape:
+                escape = False
+            elif caractere == '\\':
+                escape = True
+            elif caractere == '"':
+                em_string = False
+            continue
+
+        if caractere == '"':
+            em_string = True
+        elif caractere in _FECHAMENTOS:
+            pilha.append(caractere)
+            saida.append(caractere)
+            cortes.append((len(saida), list(pilha)))
+            continue
+        elif caractere in '}]':
+            while saida and saida[-1].isspace():
+                saida.pop()
+            if saida and saida[-1] == ',':
+                saida.pop()
+            if pilha:
+                pilha.pop()
+        elif caractere == ',':
+            cortes.append((len(saida), list(pilha)))
+        saida.append(caractere)
+
+    if em_string:
+        if escape:
+            saida.pop()
+        saida.append('"')
+    return "".join(saida), pilha, cortes
+
+
+def _fechar(texto, pilha):
+    return texto.rstrip().rstrip(',') + "".join(_FECHAMENTOS[c] for c in reversed(pilha))
+
+
+def interpretar_json(texto):
+    """
+    Interpreta uma resposta JSON, reparando-a se necessário.
+
+    Retorna: (valor, reparado: bool)
+    Levanta: ValueError se não houver JSON recuperável
+    """
+    texto = remover_cercas(texto)
+    inicios = [i for i in (texto.find('{'), texto.find('[')) if i >= 0]
+    if not inicios:
+        raise ValueError("resposta sem objeto JSON")
+    texto = texto[min(inicios):]
+
+    try:
+        return _decodificar(texto), False
+    except json.JSONDecodeError:
+        pass
+
+    normalizado, pilha, cortes = _normalizar(texto)
+    try:
+        return _decodificar(_fechar(normalizado, pilha)), True
+    except json.JSONDecodeError:
+        pass
+
+    for posicao, pilha_corte in reversed(cortes[-MAX_TENTATIVAS_CORTE:]):
+        try:
+            return _decodificar(_fechar(normalizado[:posicao], pilha_corte)), True
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("JSON irrecuperável")